@@ -0,0 +1,137 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2021 Scipp contributors (https://github.com/scipp)
+"""
+Measure throughput and latency of data_stream by replaying a NeXus file.
+
+Usage:
+  python data_stream_replay.py PATH_TO_NEXUS_FILE [--speed S] [--threaded]
+
+The event data and logs of the file are replayed through an in-process
+fake broker, so no Kafka cluster is needed, and consumed by the same
+consumers that data_stream uses with a real broker. All messages are
+serialised before the replay starts.
+The latency of each yielded chunk is the time from when its last pulse
+was due to be produced to when the chunk is yielded, it is not measured
+when replaying as quickly as possible (--speed 0).
+The fake broker runs in this process, so producing messages competes
+with consuming them for the interpreter, process consumers cannot be
+benchmarked this way.
+"""
+
+import argparse
+import asyncio
+import functools
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+import scipp as sc
+from scippneutron.data_stream import _data_stream, StartTime
+from scippneutron._streaming_consumer import (KafkaConsumer,
+                                              KafkaQueryConsumer,
+                                              KafkaThreadedConsumer)
+from scippneutron._streaming_data_buffer import StreamedDataBuffer
+from scippneutron._streaming_fake_broker import FakeBroker
+from scippneutron._streaming_replay import NexusReplay
+
+
+async def _next_or_none(stream, timeout: float):
+    try:
+        return await asyncio.wait_for(stream.__anext__(), timeout=timeout)
+    except (asyncio.TimeoutError, StopAsyncIteration):
+        return None
+
+
+async def _run(replay: NexusReplay, speed: Optional[float], threaded: bool,
+               buffer_size: int, interval: sc.Variable):
+    broker = FakeBroker()
+    replay.produce_run_start(broker)
+    queue = asyncio.Queue()
+    buffer = StreamedDataBuffer(queue, buffer_size, interval)
+    query_consumer = KafkaQueryConsumer("fake_broker",
+                                        consumer_factory=broker.client)
+    consumer_type = functools.partial(
+        KafkaThreadedConsumer if threaded else KafkaConsumer,
+        consumer_factory=broker.client)
+
+    start_time = time.time()
+    producer = threading.Thread(target=replay.replay,
+                                args=(broker, speed, start_time),
+                                daemon=True)
+    producer.start()
+    stream = _data_stream(buffer,
+                          queue,
+                          "fake_broker",
+                          None,
+                          interval,
+                          replay.run_info_topic,
+                          StartTime.start_of_run,
+                          query_consumer,
+                          consumer_type,
+                          threaded_consumers=threaded)
+    # The first chunk is the data loaded from the run start message
+    await stream.__anext__()
+
+    n_events = 0
+    latencies: List[float] = []
+    # Give up if events are lost, for example if the buffer is too small
+    timeout = 10. * sc.to_unit(interval, 's').value + 1.
+    while n_events < replay.n_events:
+        data = await _next_or_none(stream, timeout)
+        if data is None:
+            print(f"Stopped waiting for data after receiving {n_events} of "
+                  f"{replay.n_events} events")
+            break
+        if 'pulse_time' not in data.coords or data.shape[0] == 0:
+            continue
+        yield_time = time.time()
+        n_events += int(np.sum(data.bins.size().values))
+        if speed is not None:
+            last_pulse = np.max(data.coords['pulse_time'].values)
+            due_time = start_time + (last_pulse -
+                                     replay.start_time) * 1e-9 / speed
+            latencies.append(yield_time - due_time)
+    elapsed = time.time() - start_time
+    buffer.stop()
+    return n_events, elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("filename")
+    parser.add_argument("--speed",
+                        type=float,
+                        default=1.,
+                        help="Multiple of the recorded rate to replay at, "
+                        "0 to replay as quickly as possible")
+    parser.add_argument("--threaded",
+                        action="store_true",
+                        help="Consume in threads rather than on the "
+                        "event loop")
+    parser.add_argument("--buffer-size", type=int, default=1048576)
+    parser.add_argument("--interval",
+                        type=float,
+                        default=2.,
+                        help="Interval between yields in seconds")
+    args = parser.parse_args()
+
+    load_start = time.time()
+    replay = NexusReplay(args.filename)
+    print(f"Serialised {len(replay.messages)} messages with "
+          f"{replay.n_events} events in {time.time() - load_start:.1f} s")
+    speed = args.speed if args.speed > 0. else None
+    n_events, elapsed, latencies = asyncio.run(
+        _run(replay, speed, args.threaded, args.buffer_size,
+             args.interval * sc.units.s))
+
+    print(f"Received {n_events} events in {elapsed:.2f} s, "
+          f"{n_events / elapsed / 1e6:.2f} M events/s")
+    if latencies:
+        print(f"Latency (s): median {np.median(latencies):.3f}, "
+              f"95th percentile {np.percentile(latencies, 95):.3f}, "
+              f"max {np.max(latencies):.3f}")
+
+
+if __name__ == "__main__":
+    main()
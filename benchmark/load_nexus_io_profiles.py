@@ -0,0 +1,49 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2021 Scipp contributors (https://github.com/scipp)
+"""
+Time load_nexus with each HDF5 I/O profile.
+
+Usage:
+  python load_nexus_io_profiles.py PATH_TO_NEXUS_FILE [--repeats N]
+
+The operating system caches file contents, so the first load of a file
+is usually much slower than subsequent loads. For results representative
+of cold reads from a parallel filesystem, drop the page cache between
+runs or use a file larger than the memory of the machine.
+"""
+
+import argparse
+import os
+from timeit import default_timer as timer
+
+import scippneutron
+from scippneutron.load_nexus import _io_profiles
+
+profiles = [*_io_profiles.keys(), "auto"]
+
+
+def _time_load(filename: str, io_profile: str, repeats: int) -> float:
+    best_time = float("inf")
+    for _ in range(repeats):
+        start = timer()
+        scippneutron.load_nexus(filename, io_profile=io_profile)
+        best_time = min(best_time, timer() - start)
+    return best_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("filename")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    file_size_mb = os.path.getsize(args.filename) / 1024**2
+    print(f"{'profile':<12} {'best time (s)':>14} {'throughput (MiB/s)':>19}")
+    for io_profile in profiles:
+        best_time = _time_load(args.filename, io_profile, args.repeats)
+        print(f"{io_profile:<12} {best_time:>14.3f} "
+              f"{file_size_mb / best_time:>19.1f}")
+
+
+if __name__ == "__main__":
+    main()
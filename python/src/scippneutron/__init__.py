@@ -10,5 +10,6 @@ from ._scippneutron import convert
 from ._scippneutron import position, source_position, sample_position, incident_beam, scattered_beam, Ltotal, L1, L2, two_theta
 from .mantid import from_mantid, to_mantid, load, fit
 from .instrument_view import instrument_view
-from .load_nexus import load_nexus, load_nexus_json
+from .load_nexus import load_nexus, load_nexus_json, load_nexus_async, load_transformations
+from ._loading_pixel_grid import positions_from_pixel_grids
 from .data_stream import data_stream, start_stream
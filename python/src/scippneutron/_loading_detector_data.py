@@ -4,14 +4,18 @@
 
 from dataclasses import dataclass
 import h5py
-from typing import Optional, List, Any, Dict, Union
+from typing import Optional, List, Any, Dict, Union, Generator, Tuple
 import numpy as np
 from ._loading_common import (BadSource, MissingDataset, Group)
 import scipp as sc
 from warnings import warn
 from itertools import groupby
-from ._loading_transformations import get_full_transformation_matrix
+from ._loading_transformations import (get_full_transformation_matrix,
+                                       TransformationCache)
 from ._loading_nexus import LoadFromNexus, GroupObject
+from ._loading_pixel_shape import load_pixel_shape
+from ._loading_pixel_grid import (PixelGrid, find_pixel_grid,
+                                  pixel_grids_as_dataset)
 
 _detector_dimension = "detector_id"
 _event_dimension = "event"
@@ -49,9 +53,14 @@ def _convert_array_to_metres(array: np.ndarray, unit: str) -> np.ndarray:
                     dtype=np.float64), "m").values
 
 
-def _load_pixel_positions(detector_group: GroupObject, detector_ids_size: int,
-                          file_root: h5py.File,
-                          nexus: LoadFromNexus) -> Optional[sc.Variable]:
+def _load_pixel_positions(
+    detector_group: GroupObject, detector_ids_size: int, file_root: h5py.File,
+    nexus: LoadFromNexus, transform_cache: TransformationCache
+) -> Optional[Union[sc.Variable, PixelGrid]]:
+    """
+    Returns a PixelGrid if the pixels are on a regular grid,
+    otherwise the position of each pixel
+    """
     offsets_unit = nexus.get_unit(
         nexus.get_dataset_from_group(detector_group, "x_pixel_offset"))
     if offsets_unit == sc.units.dimensionless:
@@ -61,60 +70,143 @@ def _load_pixel_positions(detector_group: GroupObject, detector_ids_size: int,
 
     try:
         x_positions = nexus.load_dataset_from_group_as_numpy_array(
-            detector_group, "x_pixel_offset").flatten()
+            detector_group, "x_pixel_offset")
         y_positions = nexus.load_dataset_from_group_as_numpy_array(
-            detector_group, "y_pixel_offset").flatten()
+            detector_group, "y_pixel_offset")
     except MissingDataset:
         return None
     try:
         z_positions = nexus.load_dataset_from_group_as_numpy_array(
-            detector_group, "z_pixel_offset").flatten()
+            detector_group, "z_pixel_offset")
     except MissingDataset:
         # According to the NeXus standard z offsets are allowed to be
         # missing, in which case use zeros
-        z_positions = np.zeros_like(x_positions)
-
-    if not _all_equal((x_positions.size, y_positions.size, z_positions.size,
-                       detector_ids_size)):
-        warn(f"Skipped loading pixel positions as pixel offset and id "
-             f"dataset sizes do not match in {nexus.get_name(detector_group)}")
-        return None
-
-    x_positions = _convert_array_to_metres(x_positions, offsets_unit)
-    y_positions = _convert_array_to_metres(y_positions, offsets_unit)
-    z_positions = _convert_array_to_metres(z_positions, offsets_unit)
-
-    array = np.array([x_positions, y_positions, z_positions]).T
+        z_positions = None
+
+    if x_positions.ndim == 1 and y_positions.ndim == 1 and \
+            z_positions is None and \
+            x_positions.size * y_positions.size == detector_ids_size and \
+            x_positions.size != detector_ids_size:
+        # The NeXus standard allows offsets of a 2D detector to be given
+        # along each axis, x_pixel_offset[i] and y_pixel_offset[j],
+        # rather than an x and y offset for each pixel
+        x_positions, y_positions = np.broadcast_arrays(
+            x_positions[:, np.newaxis], y_positions[np.newaxis, :])
+
+    grid = find_pixel_grid(x_positions, y_positions, z_positions)
+    if grid is not None:
+        if grid.shape[0] * grid.shape[1] != detector_ids_size:
+            warn(f"Skipped loading pixel positions as pixel offset and id "
+                 f"dataset sizes do not match in "
+                 f"{nexus.get_name(detector_group)}")
+            return None
+        # Only the origin and steps of the grid need converting and
+        # transforming, positions of all pixels are computed if needed
+        metres_per_unit = _convert_array_to_metres(np.ones(1), offsets_unit)[0]
+        grid = grid.scaled(metres_per_unit)
+        array = None
+    else:
+        x_positions = x_positions.flatten()
+        y_positions = y_positions.flatten()
+        if z_positions is None:
+            z_positions = np.zeros_like(x_positions)
+        z_positions = z_positions.flatten()
+        if not _all_equal((x_positions.size, y_positions.size,
+                           z_positions.size, detector_ids_size)):
+            warn(f"Skipped loading pixel positions as pixel offset and id "
+                 f"dataset sizes do not match in "
+                 f"{nexus.get_name(detector_group)}")
+            return None
+
+        x_positions = _convert_array_to_metres(x_positions, offsets_unit)
+        y_positions = _convert_array_to_metres(y_positions, offsets_unit)
+        z_positions = _convert_array_to_metres(z_positions, offsets_unit)
+
+        array = np.array([x_positions, y_positions, z_positions]).T
 
     found_depends_on, _ = nexus.dataset_in_group(detector_group, "depends_on")
     if found_depends_on:
-        # Add fourth element of 1 to each vertex, indicating these are
-        # positions not direction vectors
-        n_rows = array.shape[0]
-        array = np.hstack((array, np.ones((n_rows, 1))))
-
         # Get and apply transformation matrix
         transformation = get_full_transformation_matrix(
-            detector_group, file_root, nexus)
-        for row_index in range(n_rows):
-            array[row_index, :] = np.matmul(transformation,
-                                            array[row_index, :])
-
-        # Now the transformations are done we do not need the 4th
-        # element in each position
-        array = array[:, :3]
-
+            detector_group, file_root, nexus, transform_cache)
+        if transformation.ndim > 2:
+            warn(f"Skipped loading pixel positions as the transformations "
+                 f"of {nexus.get_name(detector_group)} are time-dependent; "
+                 f"events are not binned by time so a single position "
+                 f"per pixel cannot be given")
+            return None
+        if grid is not None:
+            grid = grid.transformed(transformation)
+        else:
+            # Add fourth element of 1 to each vertex, indicating these are
+            # positions not direction vectors
+            n_rows = array.shape[0]
+            array = np.hstack((array, np.ones((n_rows, 1))))
+            array = array @ transformation.T
+            # Now the transformations are done we do not need the 4th
+            # element in each position
+            array = array[:, :3]
+
+    if grid is not None:
+        return grid
     return sc.Variable([_detector_dimension],
                        values=array,
                        dtype=sc.dtype.vector_3_float64,
                        unit=sc.units.m)
 
 
+def _load_pixel_shape(
+    detector_group: GroupObject, file_root: h5py.File, nexus: LoadFromNexus,
+    transform_cache: TransformationCache
+) -> Tuple[Optional[sc.Dataset], Optional[np.ndarray]]:
+    """
+    Load the pixel shape and the rotation of the detector, the shape is
+    not rotated so that it can be shared by detectors with different
+    rotations
+    """
+    pixel_shape = load_pixel_shape(detector_group, nexus)
+    rotation = None
+    found_depends_on, _ = nexus.dataset_in_group(detector_group, "depends_on")
+    if pixel_shape is not None and found_depends_on:
+        # Pixel positions were loaded, so the transformation is known
+        # to be static and is already in the cache
+        rotation = get_full_transformation_matrix(detector_group, file_root,
+                                                  nexus,
+                                                  transform_cache)[:3, :3]
+    return pixel_shape, rotation
+
+
 @dataclass
 class DetectorData:
     events: Optional[sc.DataArray] = None
     detector_ids: Optional[sc.Variable] = None
-    pixel_positions: Optional[sc.Variable] = None
+    # A PixelGrid if the pixels are on a regular grid
+    pixel_positions: Optional[Union[sc.Variable, PixelGrid]] = None
+    pixel_shape: Optional[sc.Dataset] = None
+    # Rotation of the detector, which is applied to its pixel shape
+    pixel_rotation: Optional[np.ndarray] = None
+    histogram: Optional[sc.DataArray] = None
+
+
+def _dense_pixel_positions(
+        pixel_positions: Union[sc.Variable, PixelGrid]) -> sc.Variable:
+    if isinstance(pixel_positions, PixelGrid):
+        return sc.Variable([_detector_dimension],
+                           values=pixel_positions.positions(),
+                           dtype=sc.dtype.vector_3_float64,
+                           unit=sc.units.m)
+    return pixel_positions
+
+
+def _pixel_grids(detector_data: List[DetectorData]) -> Optional[sc.Dataset]:
+    """
+    The compact representation of the pixel positions can only be used
+    if the pixels of every detector are on a regular grid
+    """
+    grids = [data.pixel_positions for data in detector_data]
+    if not all(isinstance(grid, PixelGrid) for grid in grids):
+        return None
+    return pixel_grids_as_dataset(grids)
 
 
 def _create_empty_events_data_array(
@@ -138,8 +230,8 @@ def _create_empty_events_data_array(
                         })
 
 
-def _load_detector(group: Group, file_root: h5py.File,
-                   nexus: LoadFromNexus) -> DetectorData:
+def _load_detector(group: Group, file_root: h5py.File, nexus: LoadFromNexus,
+                   transform_cache: TransformationCache) -> DetectorData:
     detector_number_ds_name = "detector_number"
     dataset_in_group, _ = nexus.dataset_in_group(group.group,
                                                  detector_number_ds_name)
@@ -154,19 +246,75 @@ def _load_detector(group: Group, file_root: h5py.File,
                                    dtype=detector_id_type)
 
     pixel_positions = None
+    pixel_shape = None
+    pixel_rotation = None
     pixel_positions_found, _ = nexus.dataset_in_group(group.group,
                                                       "x_pixel_offset")
     if pixel_positions_found:
         pixel_positions = _load_pixel_positions(group.group,
                                                 detector_ids.shape[0],
-                                                file_root, nexus)
+                                                file_root, nexus,
+                                                transform_cache)
+    if pixel_positions is not None:
+        pixel_shape, pixel_rotation = _load_pixel_shape(
+            group.group, file_root, nexus, transform_cache)
+
+    histogram = None
+    # Check it is a dataset, NXevent_data groups are sometimes named "data"
+    if nexus.get_dataset_from_group(group.group, "data") is not None:
+        try:
+            histogram = _load_histogram(group.group, detector_ids, nexus)
+        except BadSource as e:
+            warn(f"Skipped loading histogram data from {group.path} "
+                 f"due to:\n{e}")
     return DetectorData(detector_ids=detector_ids,
-                        pixel_positions=pixel_positions)
+                        pixel_positions=pixel_positions,
+                        pixel_shape=pixel_shape,
+                        pixel_rotation=pixel_rotation,
+                        histogram=histogram)
+
+
+def _load_histogram(group: GroupObject, detector_ids: Optional[sc.Variable],
+                    nexus: LoadFromNexus) -> sc.DataArray:
+    """
+    Load histogram mode data, the last dimension of the "data" dataset
+    is time-of-flight and the others correspond to detector_number
+    """
+    if detector_ids is None:
+        raise BadSource("missing 'detector_number' dataset")
+    data_shape = nexus.get_shape(nexus.get_dataset_from_group(group, "data"))
+    if len(data_shape) < 2:
+        raise BadSource("'data' dataset must have a time-of-flight "
+                        "dimension and at least one detector dimension")
+    n_bins = data_shape[-1]
+    if int(np.prod(data_shape[:-1])) != detector_ids.shape[0]:
+        raise BadSource("shape of 'data' dataset does not match "
+                        "'detector_number' dataset")
+    counts = nexus.load_dataset(group,
+                                "data", [_detector_dimension, _time_of_flight],
+                                shape=[detector_ids.shape[0], n_bins])
+    try:
+        time_of_flight = nexus.load_dataset(group, "time_of_flight",
+                                            [_time_of_flight])
+    except MissingDataset:
+        raise BadSource("missing 'time_of_flight' dataset")
+    if time_of_flight.shape[0] not in (n_bins, n_bins + 1):
+        raise BadSource("'time_of_flight' dataset does not match the "
+                        "shape of the 'data' dataset")
+    if counts.unit == sc.units.dimensionless:
+        counts.unit = sc.units.counts
+    return sc.detail.move_to_data_array(data=counts,
+                                        coords={
+                                            _time_of_flight:
+                                            time_of_flight,
+                                            _detector_dimension:
+                                            detector_ids.copy()
+                                        })
 
 
 def _load_event_group(group: Group, file_root: h5py.File, nexus: LoadFromNexus,
-                      detector_data: DetectorData,
-                      quiet: bool) -> DetectorData:
+                      detector_data: DetectorData, quiet: bool,
+                      transform_cache: TransformationCache) -> DetectorData:
     error_msg = _check_for_missing_fields(group.group, nexus)
     if error_msg:
         raise BadSource(error_msg)
@@ -225,7 +373,11 @@ def _load_event_group(group: Group, file_root: h5py.File, nexus: LoadFromNexus,
     if pixel_positions_found:
         detector_data.pixel_positions = _load_pixel_positions(
             detector_group, detector_data.detector_ids.shape[0], file_root,
-            nexus)
+            nexus, transform_cache)
+    if detector_data.pixel_positions is not None:
+        detector_data.pixel_shape, detector_data.pixel_rotation = \
+            _load_pixel_shape(detector_group, file_root, nexus,
+                              transform_cache)
 
     if not quiet:
         print(f"Loaded event data from "
@@ -258,20 +410,39 @@ def _check_event_ids_and_det_number_types_valid(detector_id_type: Any,
             "NXdetector were not of the same type")
 
 
-def load_detector_data(event_data_groups: List[Group],
-                       detector_groups: List[Group], file_root: h5py.File,
-                       nexus: LoadFromNexus,
-                       quiet: bool) -> Optional[sc.DataArray]:
-    detector_data = _load_data_from_each_nx_detector(detector_groups,
-                                                     file_root, nexus)
+def load_detector_data_in_stages(
+    event_data_groups: List[Group],
+    detector_groups: List[Group],
+    file_root: h5py.File,
+    nexus: LoadFromNexus,
+    quiet: bool,
+    transform_cache: Optional[TransformationCache] = None,
+    dense_positions: bool = True
+) -> Generator[None, None, Optional[sc.DataArray]]:
+    """
+    Yields after loading each group, and after binning the events of
+    each detector, so that the caller can do other work, or stop loading,
+    in between. The loaded data are the return value of the generator,
+    use "yield from" to get them.
+    """
+    if transform_cache is None:
+        transform_cache = TransformationCache()
+    detector_data = yield from _load_data_from_each_nx_detector(
+        detector_groups, file_root, nexus, transform_cache)
+    histogram_data = _pop_histogram_data(detector_data)
 
-    event_data = _load_data_from_each_nx_event_data(detector_data,
-                                                    event_data_groups,
-                                                    file_root, nexus, quiet)
+    event_data = yield from _load_data_from_each_nx_event_data(
+        detector_data, event_data_groups, file_root, nexus, quiet,
+        transform_cache)
 
     if not event_data:
+        if histogram_data:
+            return _concatenate_histogram_data(histogram_data, dense_positions)
         # If there were no data to load we are done
         return
+    if histogram_data:
+        warn("Skipped loading histogram data from NXdetector groups as "
+             "event data were also found, these cannot be combined")
 
     def get_detector_id(data: DetectorData):
         # Assume different detector banks do not have
@@ -284,24 +455,124 @@ def load_detector_data(event_data_groups: List[Group],
 
     pixel_positions_loaded = all(
         [data.pixel_positions is not None for data in event_data])
+    pixel_shape = _common_pixel_shape(event_data)
+    pixel_grids = _pixel_grids(event_data) if pixel_positions_loaded else None
+    # Without dense positions the compact grids must be given instead
+    add_positions = pixel_positions_loaded and (dense_positions
+                                                or pixel_grids is None)
     detector_data = event_data.pop(0)
 
     # Events in the NeXus file are effectively binned by pulse
     # (because they are recorded chronologically)
     # but for reduction it is more useful to bin by detector id
     events = sc.bin(detector_data.events, groups=[detector_data.detector_ids])
-    if pixel_positions_loaded:
-        events.coords['position'] = detector_data.pixel_positions
+    if add_positions:
+        events.coords['position'] = _dense_pixel_positions(
+            detector_data.pixel_positions)
     while event_data:
         detector_data = event_data.pop(0)
         new_events = sc.bin(detector_data.events,
                             groups=[detector_data.detector_ids])
-        if pixel_positions_loaded:
-            new_events.coords['position'] = detector_data.pixel_positions
+        if add_positions:
+            new_events.coords['position'] = _dense_pixel_positions(
+                detector_data.pixel_positions)
         events = sc.concatenate(events, new_events, dim=_detector_dimension)
+        yield None
+    if pixel_grids is not None:
+        events.attrs["pixel_grids"] = sc.Variable(value=pixel_grids)
+    if pixel_positions_loaded and pixel_shape is not None:
+        events.attrs["pixel_shape"] = sc.Variable(value=pixel_shape)
     return events
 
 
+def _common_pixel_shape(
+        event_data: List[DetectorData]) -> Optional[sc.Dataset]:
+    """
+    The pixel shape is shared by all pixels, so it can only be given
+    if every detector has the same pixel shape. Detectors may be rotated
+    differently, in which case the distinct rotations are given as
+    "rotations", and the index of the rotation of each pixel as
+    "rotation_index".
+    """
+    shapes = [data.pixel_shape for data in event_data]
+    if any(shape is None for shape in shapes):
+        return None
+    if not all(sc.identical(shapes[0], shape) for shape in shapes[1:]):
+        warn("Skipped loading pixel shapes as they are not the same "
+             "for all detectors")
+        return None
+    if all(data.pixel_rotation is None for data in event_data):
+        return shapes[0]
+
+    rotations = []
+    rotation_index = []
+    for data in event_data:
+        rotation = data.pixel_rotation if data.pixel_rotation is not None \
+            else np.identity(3)
+        for index, existing_rotation in enumerate(rotations):
+            if np.allclose(existing_rotation, rotation):
+                break
+        else:
+            index = len(rotations)
+            rotations.append(rotation)
+        rotation_index.append(
+            np.full(data.detector_ids.shape[0], index, dtype=np.int64))
+    pixel_shape = shapes[0].copy()
+    pixel_shape["rotations"] = sc.Variable(["rotation"],
+                                           values=np.stack(rotations),
+                                           dtype=sc.dtype.matrix_3_float64)
+    pixel_shape["rotation_index"] = sc.Variable(
+        [_detector_dimension], values=np.concatenate(rotation_index))
+    return pixel_shape
+
+
+def _pop_histogram_data(detector_data: Dict) -> List[DetectorData]:
+    """
+    Detectors with histogram data must not also be given empty event data
+    """
+    histogram_paths = [
+        path for path, data in detector_data.items()
+        if data.histogram is not None
+    ]
+    return [detector_data.pop(path) for path in histogram_paths]
+
+
+def _concatenate_histogram_data(histogram_data: List[DetectorData],
+                                dense_positions: bool) -> sc.DataArray:
+    histogram_data.sort(key=lambda data: data.detector_ids.values[0])
+    # Detectors are skipped before anything else is combined,
+    # so that positions are only given for the detectors kept
+    time_of_flight = histogram_data[0].histogram.coords[_time_of_flight]
+    kept_data = histogram_data[:1]
+    for data in histogram_data[1:]:
+        if sc.identical(data.histogram.coords[_time_of_flight],
+                        time_of_flight):
+            kept_data.append(data)
+        else:
+            warn("Skipped loading histogram data from an NXdetector as its "
+                 "time-of-flight bins differ from those of other detectors")
+    histogram_data = kept_data
+    pixel_positions_loaded = all(
+        [data.pixel_positions is not None for data in histogram_data])
+    pixel_grids = _pixel_grids(histogram_data) \
+        if pixel_positions_loaded else None
+    if pixel_positions_loaded and (dense_positions or pixel_grids is None):
+        for data in histogram_data:
+            data.histogram.coords['position'] = _dense_pixel_positions(
+                data.pixel_positions)
+    histograms = histogram_data[0].histogram
+    for data in histogram_data[1:]:
+        histograms = sc.concatenate(histograms,
+                                    data.histogram,
+                                    dim=_detector_dimension)
+    pixel_shape = _common_pixel_shape(histogram_data)
+    if pixel_grids is not None:
+        histograms.attrs["pixel_grids"] = sc.Variable(value=pixel_grids)
+    if pixel_positions_loaded and pixel_shape is not None:
+        histograms.attrs["pixel_shape"] = sc.Variable(value=pixel_shape)
+    return histograms
+
+
 def _create_empty_event_data(event_data: List[DetectorData]):
     """
     If any NXdetector groups had pixel position data but no events
@@ -338,18 +609,18 @@ def _create_empty_event_data(event_data: List[DetectorData]):
             data.events = empty_events
 
 
-def _load_data_from_each_nx_event_data(detector_data: Dict,
-                                       event_data_groups: List[Group],
-                                       file_root: h5py.File,
-                                       nexus: LoadFromNexus,
-                                       quiet: bool) -> List[DetectorData]:
+def _load_data_from_each_nx_event_data(
+    detector_data: Dict, event_data_groups: List[Group], file_root: h5py.File,
+    nexus: LoadFromNexus, quiet: bool, transform_cache: TransformationCache
+) -> Generator[None, None, List[DetectorData]]:
     event_data = []
     for group in event_data_groups:
         parent_path = "/".join(group.path.split("/")[:-1])
         try:
             new_event_data = _load_event_group(
                 group, file_root, nexus,
-                detector_data.get(parent_path, DetectorData()), quiet)
+                detector_data.get(parent_path, DetectorData()), quiet,
+                transform_cache)
             event_data.append(new_event_data)
             # Only pop from dictionary if we did not raise an
             # exception when loading events
@@ -359,17 +630,20 @@ def _load_data_from_each_nx_event_data(detector_data: Dict,
             detector_data.pop(parent_path, DetectorData())
         except BadSource as e:
             warn(f"Skipped loading {group.path} due to:\n{e}")
+        yield None
     for _, remaining_data in detector_data.items():
         if remaining_data.detector_ids is not None:
             event_data.append(remaining_data)
     return event_data
 
 
-def _load_data_from_each_nx_detector(detector_groups: List[Group],
-                                     file_root: h5py.File,
-                                     nexus: LoadFromNexus) -> Dict:
+def _load_data_from_each_nx_detector(
+        detector_groups: List[Group], file_root: h5py.File,
+        nexus: LoadFromNexus,
+        transform_cache: TransformationCache) -> Generator[None, None, Dict]:
     detector_data = {}
     for detector_group in detector_groups:
         detector_data[detector_group.path] = _load_detector(
-            detector_group, file_root, nexus)
+            detector_group, file_root, nexus, transform_cache)
+        yield None
     return detector_data
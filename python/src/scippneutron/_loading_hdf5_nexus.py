@@ -87,7 +87,8 @@ class LoadFromHdf5:
                      group: h5py.Group,
                      dataset_name: str,
                      dimensions: List[str],
-                     dtype: Optional[Any] = None) -> sc.Variable:
+                     dtype: Optional[Any] = None,
+                     shape: Optional[List[int]] = None) -> sc.Variable:
         """
         Load an HDF5 dataset into a Scipp Variable
         :param group: Group containing dataset to load
@@ -95,6 +96,8 @@ class LoadFromHdf5:
         :param dimensions: Dimensions for the output Variable
         :param dtype: Cast to this dtype during load,
           otherwise retain dataset dtype
+        :param shape: Shape of the output Variable, if different to the
+          dataset shape, it must have the same number of elements
         """
         try:
             dataset = group[dataset_name]
@@ -102,11 +105,15 @@ class LoadFromHdf5:
             raise MissingDataset()
         if dtype is None:
             dtype = _ensure_supported_int_type(dataset.dtype.type)
+        if shape is None:
+            shape = dataset.shape
         variable = sc.empty(dims=dimensions,
-                            shape=dataset.shape,
+                            shape=shape,
                             dtype=dtype,
                             unit=self.get_unit(dataset))
-        dataset.read_direct(variable.values)
+        # Reshaping the values gives a view, so this still reads
+        # directly into the memory of the variable
+        dataset.read_direct(variable.values.reshape(dataset.shape))
         return variable
 
     def load_dataset_from_group_as_numpy_array(self, group: h5py.Group,
@@ -141,6 +148,10 @@ class LoadFromHdf5:
     def get_dataset_numpy_dtype(group: h5py.Group, dataset_name: str) -> Any:
         return _ensure_supported_int_type(group[dataset_name].dtype.type)
 
+    @staticmethod
+    def get_shape(dataset: h5py.Dataset) -> Tuple[int, ...]:
+        return dataset.shape
+
     @staticmethod
     def get_name(group: Union[h5py.Group, h5py.Dataset]) -> str:
         """
@@ -33,6 +33,56 @@ _filewriter_to_supported_numpy_dtype = {
 }
 
 
+def _get_dataset_dtype(dataset: Dict) -> Any:
+    try:
+        return _filewriter_to_supported_numpy_dtype[dataset[_nexus_dataset]
+                                                    ["type"]]
+    except KeyError:
+        return _filewriter_to_supported_numpy_dtype[dataset[_nexus_dataset]
+                                                    ["dtype"]]
+
+
+def _values_as_numpy_array(values: Union[List, np.ndarray],
+                           dtype: Any) -> np.ndarray:
+    """
+    Convert the values of a dataset to a numpy array of the requested
+    dtype in one step, without first making an array with the dtype numpy
+    would infer from the values
+    """
+    if isinstance(values, np.ndarray):
+        return values.astype(dtype, copy=False)
+    try:
+        # fromiter fills the output buffer directly from the list,
+        # but only supports 1D lists
+        return np.fromiter(values, dtype=dtype, count=len(values))
+    except (TypeError, ValueError, OverflowError):
+        pass
+    try:
+        return np.array(values, dtype=dtype)
+    except OverflowError:
+        # Values out of range of the dtype, such as uint32 values loaded
+        # as int32, wrap around as they do when casting an array
+        return np.array(values).astype(dtype)
+
+
+def decode_dataset_values(json_object: Dict) -> Dict:
+    """
+    Use as object_hook when parsing a json NeXus structure.
+    Numeric dataset values are converted to numpy arrays as soon as each
+    dataset has been parsed, so that at most one dataset's values are held
+    as a list of Python numbers at any time during parsing.
+    """
+    try:
+        values = json_object[_nexus_values]
+        if json_object["type"] == _nexus_dataset and isinstance(values, list):
+            json_object[_nexus_values] = _values_as_numpy_array(
+                values, _get_dataset_dtype(json_object))
+    except (KeyError, TypeError, ValueError):
+        # Not a dataset, or not a numeric dataset
+        pass
+    return json_object
+
+
 def _get_attribute_value(element: Dict,
                          attribute_name: str) -> Union[str, float, int, List]:
     """
@@ -101,6 +151,23 @@ def contains_stream(group: Dict) -> bool:
     return False
 
 
+def get_stream(group: Dict) -> Optional[Dict]:
+    """
+    Return the stream information ("topic", "source", etc) of the first
+    stream object in the group, or None if it does not contain one
+    """
+    try:
+        for child in group[_nexus_children]:
+            try:
+                if child["type"] == _nexus_stream:
+                    return child[_nexus_stream]
+            except KeyError:
+                pass
+    except KeyError:
+        pass
+    return None
+
+
 def _find_by_type(type_name: str, root: Dict) -> List[Dict]:
     """
     Finds objects with the requested "type" value
@@ -126,6 +193,34 @@ def _find_by_type(type_name: str, root: Dict) -> List[Dict]:
 class LoadFromJson:
     def __init__(self, root: Dict):
         self._root = root
+        # Children of each group indexed by name, and objects found by
+        # path, these avoid repeating linear searches through "children"
+        # lists which are very long for large instruments.
+        # Keyed by id() of the group, the group itself is also stored
+        # to check the id has not been reused by another object.
+        # The json structure must not be modified after it has been
+        # accessed through this object.
+        self._child_index: Dict[int, Tuple[Dict, Dict[str, List[Dict]]]] = {}
+        self._path_cache: Dict[Tuple[int, str], Tuple[Dict, Dict]] = {}
+
+    def _get_children_by_name(self, group: Dict) -> Dict[str, List[Dict]]:
+        try:
+            indexed_group, children_by_name = self._child_index[id(group)]
+            if indexed_group is group:
+                return children_by_name
+        except KeyError:
+            pass
+        children_by_name = {}
+        for child in group[_nexus_children]:
+            try:
+                children_by_name.setdefault(child[_nexus_name],
+                                            []).append(child)
+            except (KeyError, TypeError):
+                # If the object doesn't have a name then it cannot
+                # be looked up by name
+                pass
+        self._child_index[id(group)] = (group, children_by_name)
+        return children_by_name
 
     def _get_child_from_group(
             self,
@@ -139,16 +234,15 @@ class LoadFromJson:
         if allowed_nexus_classes is None:
             allowed_nexus_classes = (_nexus_dataset, _nexus_group,
                                      _nexus_stream)
-        for child in group[_nexus_children]:
+        for child in self._get_children_by_name(group).get(name, []):
             try:
-                if child[_nexus_name] == name:
-                    if child["type"] == _nexus_link:
-                        child = self.get_object_by_path(
-                            self._root, child["target"])
-                    if child["type"] in allowed_nexus_classes:
-                        return child
+                if child["type"] == _nexus_link:
+                    child = self.get_object_by_path(self._root,
+                                                    child["target"])
+                if child["type"] in allowed_nexus_classes:
+                    return child
             except KeyError:
-                # if name or type are missing then it is
+                # if type is missing then it is
                 # not what we are looking for
                 pass
 
@@ -199,7 +293,8 @@ class LoadFromJson:
                      group: Dict,
                      dataset_name: str,
                      dimensions: List[str],
-                     dtype: Optional[Any] = None) -> sc.Variable:
+                     dtype: Optional[Any] = None,
+                     shape: Optional[List[int]] = None) -> sc.Variable:
         """
         Load a dataset into a Scipp Variable
         :param group: Group containing dataset to load
@@ -207,27 +302,27 @@ class LoadFromJson:
         :param dimensions: Dimensions for the output Variable
         :param dtype: Cast to this dtype during load,
           otherwise retain dataset dtype
+        :param shape: Shape of the output Variable, if different to the
+          dataset shape, it must have the same number of elements
         """
         dataset = self.get_dataset_from_group(group, dataset_name)
         if dataset is None:
             raise MissingDataset()
 
         if dtype is None:
-            try:
-                dtype = _filewriter_to_supported_numpy_dtype[
-                    dataset[_nexus_dataset]["type"]]
-            except KeyError:
-                dtype = _filewriter_to_supported_numpy_dtype[
-                    dataset[_nexus_dataset]["dtype"]]
+            dtype = _get_dataset_dtype(dataset)
 
         try:
             units = _get_attribute_value(dataset, _nexus_units)
         except MissingAttribute:
             units = sc.units.dimensionless
 
-        if isinstance(dataset[_nexus_values], list):
+        if isinstance(dataset[_nexus_values], (list, np.ndarray)):
+            values = _values_as_numpy_array(dataset[_nexus_values], dtype)
+            if shape is not None:
+                values = values.reshape(shape)
             return sc.Variable(dims=dimensions,
-                               values=dataset[_nexus_values],
+                               values=values,
                                dtype=dtype,
                                unit=units)
 
@@ -257,18 +352,16 @@ class LoadFromJson:
         numpy array is required.
         :param dataset: The dataset to load values from
         """
-        try:
-            dtype = _filewriter_to_supported_numpy_dtype[
-                dataset[_nexus_dataset]["type"]]
-        except KeyError:
-            dtype = _filewriter_to_supported_numpy_dtype[
-                dataset[_nexus_dataset]["dtype"]]
-        return np.array(dataset[_nexus_values]).astype(dtype)
+        return _values_as_numpy_array(dataset[_nexus_values],
+                                      _get_dataset_dtype(dataset))
 
     def get_dataset_numpy_dtype(self, group: Dict, dataset_name: str) -> Any:
         dataset = self.get_dataset_from_group(group, dataset_name)
-        return _filewriter_to_supported_numpy_dtype[dataset[_nexus_dataset]
-                                                    ["type"]]
+        return _get_dataset_dtype(dataset)
+
+    @staticmethod
+    def get_shape(dataset: Dict) -> Tuple[int, ...]:
+        return np.shape(dataset[_nexus_values])
 
     @staticmethod
     def get_name(group: Dict) -> str:
@@ -290,11 +383,20 @@ class LoadFromJson:
         return dataset[_nexus_values]
 
     def get_object_by_path(self, group: Dict, path_str: str) -> Dict:
+        cache_key = (id(group), path_str)
+        try:
+            start_group, found_object = self._path_cache[cache_key]
+            if start_group is group:
+                return found_object
+        except KeyError:
+            pass
+        found_object = group
         for node in filter(None, path_str.split("/")):
-            group = self._get_child_from_group(group, node)
-            if group is None:
+            found_object = self._get_child_from_group(found_object, node)
+            if found_object is None:
                 raise MissingDataset()
-        return group
+        self._path_cache[cache_key] = (group, found_object)
+        return found_object
 
     @staticmethod
     def get_attribute_as_numpy_array(node: Dict,
@@ -0,0 +1,135 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2021 Scipp contributors (https://github.com/scipp)
+
+from typing import List, Optional, Dict
+import numpy as np
+import scipp as sc
+from warnings import warn
+from ._loading_common import BadSource, MissingDataset, Group
+from ._loading_nexus import LoadFromNexus, GroupObject, ScippData
+
+_event_dimension = "event"
+_time_of_flight = "tof"
+
+
+def _parent_path(path: str) -> str:
+    return "/".join(path.split("/")[:-1])
+
+
+def split_monitor_event_data(
+        event_data_groups: List[Group],
+        monitor_groups: List[Group]) -> Dict[str, List[Group]]:
+    """
+    NXevent_data groups may be found inside NXmonitor groups, these must
+    not be loaded as detector data.
+    Returns dictionary with "detector" and "monitor" keys, each containing
+    a list of NXevent_data groups
+    """
+    monitor_paths = {group.path for group in monitor_groups}
+    split_groups: Dict[str, List[Group]] = {"detector": [], "monitor": []}
+    for group in event_data_groups:
+        if _parent_path(group.path) in monitor_paths:
+            split_groups["monitor"].append(group)
+        else:
+            split_groups["detector"].append(group)
+    return split_groups
+
+
+def load_monitor_data(loaded_data: ScippData, monitor_groups: List[Group],
+                      monitor_event_data_groups: List[Group],
+                      nexus: LoadFromNexus):
+    """
+    Load data from each NXmonitor and add it as an attribute, with
+    the name of the monitor group, to the loaded data.
+    Monitors recorded in event mode have an NXevent_data group
+    (or the event fields directly in the NXmonitor), monitors recorded
+    in histogram mode have "data" and "time_of_flight" datasets.
+    Only the time-of-flight of monitor events is loaded, event_time_zero
+    and event_index are not, so monitor events are not binned by pulse,
+    as for the event data of detectors.
+    """
+    event_groups_by_monitor = {
+        _parent_path(group.path): group.group
+        for group in monitor_event_data_groups
+    }
+    for group in monitor_groups:
+        event_group = event_groups_by_monitor.get(group.path)
+        try:
+            monitor = _load_monitor(group.group, event_group, nexus)
+        except BadSource as e:
+            warn(f"Skipped loading {group.path} due to:\n{e}")
+            continue
+        if monitor is not None:
+            _add_monitor_to_data(nexus.get_name(group.group), monitor,
+                                 loaded_data)
+
+
+def _load_monitor(group: GroupObject, event_group: Optional[GroupObject],
+                  nexus: LoadFromNexus) -> Optional[sc.DataArray]:
+    if event_group is None:
+        found_events, _ = nexus.dataset_in_group(group, "event_time_offset")
+        if found_events:
+            event_group = group
+    if event_group is not None:
+        return _load_monitor_events(event_group, nexus)
+    found_histogram, _ = nexus.dataset_in_group(group, "data")
+    if found_histogram:
+        return _load_monitor_histogram(group, nexus)
+    # Monitor groups in a json template for streaming may have no data,
+    # that is okay, there is just nothing to load
+    return None
+
+
+def _load_monitor_events(group: GroupObject,
+                         nexus: LoadFromNexus) -> sc.DataArray:
+    try:
+        event_time_offset = nexus.load_dataset(group, "event_time_offset",
+                                               [_event_dimension])
+    except MissingDataset:
+        raise BadSource("missing 'event_time_offset' dataset in monitor "
+                        "event data")
+    # Weights are not stored in NeXus, so use 1s
+    weights = sc.ones(dims=[_event_dimension],
+                      shape=event_time_offset.shape,
+                      dtype=np.float32,
+                      variances=True)
+    return sc.detail.move_to_data_array(
+        data=weights, coords={_time_of_flight: event_time_offset})
+
+
+def _load_monitor_histogram(group: GroupObject,
+                            nexus: LoadFromNexus) -> sc.DataArray:
+    counts = nexus.get_dataset_from_group(group, "data")
+    if counts is None:
+        # "data" may be a group rather than a dataset
+        raise BadSource("monitor 'data' is not a dataset")
+    if len(nexus.get_shape(counts)) != 1:
+        raise BadSource("monitor 'data' dataset has more than 1 dimension, "
+                        "handling this is not yet implemented")
+    counts = nexus.load_dataset(group, "data", [_time_of_flight])
+    try:
+        time_of_flight = nexus.load_dataset(group, "time_of_flight",
+                                            [_time_of_flight])
+    except MissingDataset:
+        raise BadSource("missing 'time_of_flight' dataset in monitor "
+                        "histogram data")
+    n_bins = counts.shape[0]
+    if time_of_flight.shape[0] not in (n_bins, n_bins + 1):
+        raise BadSource("monitor 'time_of_flight' dataset does not match "
+                        "the shape of the 'data' dataset")
+    if counts.unit == sc.units.dimensionless:
+        counts.unit = sc.units.counts
+    return sc.detail.move_to_data_array(
+        data=counts, coords={_time_of_flight: time_of_flight})
+
+
+def _add_monitor_to_data(name: str, monitor: sc.DataArray, data: ScippData):
+    try:
+        data = data.attrs
+    except AttributeError:
+        pass
+    if name in data.keys():
+        warn(f"Skipped loading monitor '{name}' as its name clashes "
+             f"with other loaded data")
+        return
+    data[name] = sc.Variable(value=monitor)
@@ -0,0 +1,118 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2021 Scipp contributors (https://github.com/scipp)
+
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+import numpy as np
+import scipp as sc
+from ._loading_nexus import ScippData
+
+_bank_dimension = "bank"
+_axis_dimension = "axis"
+
+
+@dataclass
+class PixelGrid:
+    """
+    Pixel positions on a regular 2D grid, the position of pixel (i, j)
+    is origin + i * steps[0] + j * steps[1]
+    """
+    origin: np.ndarray
+    steps: np.ndarray
+    shape: Tuple[int, int]
+
+    def scaled(self, factor: float) -> "PixelGrid":
+        return PixelGrid(self.origin * factor, self.steps * factor, self.shape)
+
+    def transformed(self, matrix: np.ndarray) -> "PixelGrid":
+        """
+        Apply a 4x4 transformation matrix, the steps are direction
+        vectors so only the rotation applies to them
+        """
+        rotation = matrix[:3, :3]
+        return PixelGrid(rotation @ self.origin + matrix[:3, 3],
+                         self.steps @ rotation.T, self.shape)
+
+    def positions(self) -> np.ndarray:
+        """
+        Positions of all pixels, flattened in the same order as the
+        offset datasets, with shape (n_pixels, 3)
+        """
+        i = np.arange(self.shape[0])[:, np.newaxis, np.newaxis]
+        j = np.arange(self.shape[1])[np.newaxis, :, np.newaxis]
+        positions = self.origin + i * self.steps[0] + j * self.steps[1]
+        return positions.reshape(-1, 3)
+
+
+def find_pixel_grid(x_offsets: np.ndarray, y_offsets: np.ndarray,
+                    z_offsets: Optional[np.ndarray]) -> Optional[PixelGrid]:
+    """
+    Returns a PixelGrid if the 2D offset arrays form a regular grid,
+    otherwise None
+    """
+    if x_offsets.ndim != 2 or x_offsets.shape != y_offsets.shape:
+        return None
+    if z_offsets is not None and z_offsets.shape != x_offsets.shape:
+        return None
+    if min(x_offsets.shape) < 2:
+        return None
+    components = [x_offsets, y_offsets]
+    if z_offsets is not None:
+        components.append(z_offsets)
+
+    origin = np.zeros(3)
+    steps = np.zeros((2, 3))
+    i = np.arange(x_offsets.shape[0])[:, np.newaxis]
+    j = np.arange(x_offsets.shape[1])[np.newaxis, :]
+    for axis, offsets in enumerate(components):
+        origin[axis] = offsets[0, 0]
+        steps[0, axis] = offsets[1, 0] - offsets[0, 0]
+        steps[1, axis] = offsets[0, 1] - offsets[0, 0]
+        expected = origin[axis] + i * steps[0, axis] + j * steps[1, axis]
+        if not np.allclose(offsets, expected):
+            return None
+    return PixelGrid(origin, steps, x_offsets.shape)
+
+
+def pixel_grids_as_dataset(grids: List[PixelGrid]) -> sc.Dataset:
+    """
+    The grids of consecutive detector banks, in the order of
+    their pixels along the detector_id dimension
+    """
+    return sc.Dataset({
+        "origin":
+        sc.Variable([_bank_dimension],
+                    values=np.array([grid.origin for grid in grids]),
+                    dtype=sc.dtype.vector_3_float64,
+                    unit=sc.units.m),
+        "steps":
+        sc.Variable([_bank_dimension, _axis_dimension],
+                    values=np.array([grid.steps for grid in grids]),
+                    dtype=sc.dtype.vector_3_float64,
+                    unit=sc.units.m),
+        "shape":
+        sc.Variable([_bank_dimension, _axis_dimension],
+                    values=np.array([grid.shape for grid in grids],
+                                    dtype=np.int64))
+    })
+
+
+def positions_from_pixel_grids(data: ScippData) -> sc.Variable:
+    """
+    Positions of all pixels of data which were loaded with
+    dense_positions=False, from the compact "pixel_grids" attribute.
+    The positions are in the order of the detector_id dimension,
+    so can be added as the "position" coord.
+    """
+    grids = data.attrs["pixel_grids"].value
+    origins = np.asarray(grids["origin"].values).reshape(-1, 3)
+    steps = np.asarray(grids["steps"].values).reshape(-1, 2, 3)
+    shapes = grids["shape"].values
+    positions = [
+        PixelGrid(origin, bank_steps, tuple(shape)).positions()
+        for origin, bank_steps, shape in zip(origins, steps, shapes)
+    ]
+    return sc.Variable(["detector_id"],
+                       values=np.concatenate(positions),
+                       dtype=sc.dtype.vector_3_float64,
+                       unit=sc.units.m)
@@ -0,0 +1,142 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2021 Scipp contributors (https://github.com/scipp)
+
+from typing import Optional
+import numpy as np
+import scipp as sc
+from warnings import warn
+from ._loading_common import MissingDataset, MissingAttribute
+from ._loading_nexus import LoadFromNexus, GroupObject
+
+nx_off_geometry = "NXoff_geometry"
+nx_cylindrical_geometry = "NXcylindrical_geometry"
+_vertex_dimension = "vertex"
+_face_dimension = "face"
+_winding_order_dimension = "winding_order"
+_cylinder_dimension = "cylinder"
+
+
+class PixelShapeError(Exception):
+    pass
+
+
+def load_pixel_shape(detector_group: GroupObject,
+                     nexus: LoadFromNexus) -> Optional[sc.Dataset]:
+    """
+    Load the shape of the pixels from the pixel_shape group of an
+    NXdetector, if it has one.
+    The vertices are shared by all pixels of the detector and are given
+    in the frame of the detector, before it is rotated by its
+    transformation, see pixel_vertices.
+    """
+    shape_group = nexus.get_child_from_group(detector_group, "pixel_shape")
+    if shape_group is None or not nexus.is_group(shape_group):
+        return None
+    try:
+        nx_class = nexus.get_string_attribute(shape_group, "NX_class")
+    except MissingAttribute:
+        nx_class = None
+    try:
+        if nx_class == nx_off_geometry:
+            return _load_off_geometry(shape_group, nexus)
+        if nx_class == nx_cylindrical_geometry:
+            return _load_cylindrical_geometry(shape_group, nexus)
+        raise PixelShapeError(f"pixel_shape group is not an {nx_off_geometry}"
+                              f" or {nx_cylindrical_geometry}")
+    except PixelShapeError as e:
+        warn(f"Skipped loading pixel shape of "
+             f"{nexus.get_name(detector_group)} due to:\n{e}")
+        return None
+
+
+def _load_vertices(group: GroupObject, nexus: LoadFromNexus) -> sc.Variable:
+    try:
+        vertices = nexus.load_dataset(group, "vertices",
+                                      [_vertex_dimension, "xyz"], np.float64)
+    except MissingDataset:
+        raise PixelShapeError("missing 'vertices' dataset")
+    if vertices.shape[1] != 3:
+        raise PixelShapeError("'vertices' dataset must have shape (n, 3)")
+    if vertices.unit == sc.units.dimensionless:
+        raise PixelShapeError("missing units on 'vertices' dataset")
+    return sc.Variable([_vertex_dimension],
+                       values=sc.to_unit(vertices, sc.units.m).values,
+                       dtype=sc.dtype.vector_3_float64,
+                       unit=sc.units.m)
+
+
+def _load_indices(group: GroupObject, dataset_name: str, dims: list,
+                  upper_bound: int, nexus: LoadFromNexus) -> sc.Variable:
+    try:
+        indices = nexus.load_dataset(group, dataset_name, dims, np.int64)
+    except MissingDataset:
+        raise PixelShapeError(f"missing '{dataset_name}' dataset")
+    values = indices.values
+    if values.size and (values.min() < 0 or values.max() >= upper_bound):
+        raise PixelShapeError(f"'{dataset_name}' dataset contains indices "
+                              f"out of range")
+    return indices
+
+
+def _load_off_geometry(group: GroupObject, nexus: LoadFromNexus) -> sc.Dataset:
+    vertices = _load_vertices(group, nexus)
+    winding_order = _load_indices(group, "winding_order",
+                                  [_winding_order_dimension],
+                                  vertices.shape[0], nexus)
+    faces = _load_indices(group, "faces", [_face_dimension],
+                          winding_order.shape[0], nexus)
+    return sc.Dataset(data={
+        "vertices": vertices,
+        "winding_order": winding_order,
+        "faces": faces
+    })
+
+
+def _load_cylindrical_geometry(group: GroupObject,
+                               nexus: LoadFromNexus) -> sc.Dataset:
+    vertices = _load_vertices(group, nexus)
+    # Each cylinder is given by the indices of 3 vertices: the centre of
+    # the first face, a point on the edge of the first face and the centre
+    # of the second face
+    cylinders = _load_indices(group, "cylinders",
+                              [_cylinder_dimension, "cylinder_vertex"],
+                              vertices.shape[0], nexus)
+    if cylinders.shape[1] != 3:
+        raise PixelShapeError("'cylinders' dataset must have shape (n, 3)")
+    return sc.Dataset(data={"vertices": vertices, "cylinders": cylinders})
+
+
+def pixel_vertices(positions: sc.Variable,
+                   pixel_shape: sc.Dataset) -> sc.Variable:
+    """
+    Vertices of every pixel, given the pixel positions and the shared
+    pixel shape. The shared vertices are rotated by the rotation of each
+    pixel's detector, if the pixel shape has "rotations", and broadcast
+    against the positions, so the output has the dimensions of positions
+    plus a vertex dimension.
+    """
+    vertices = pixel_shape["vertices"].values
+    if "rotations" in pixel_shape:
+        # One rotation matrix per detector, and the index of the
+        # rotation for each pixel
+        rotations = pixel_shape["rotations"].values[
+            pixel_shape["rotation_index"].values.reshape(positions.shape)]
+        vertices = np.einsum("...ij,vj->...vi", rotations, vertices)
+    values = positions.values[..., np.newaxis, :] + vertices
+    return sc.Variable([*positions.dims, _vertex_dimension],
+                       values=values,
+                       dtype=sc.dtype.vector_3_float64,
+                       unit=sc.units.m)
+
+
+def pixel_size(pixel_shape: sc.Dataset) -> float:
+    """
+    Largest extent of the pixel shape, in metres
+    """
+    vertices = pixel_shape["vertices"].values
+    if "cylinders" in pixel_shape:
+        cylinders = vertices[pixel_shape["cylinders"].values]
+        radii = np.linalg.norm(cylinders[:, 1] - cylinders[:, 0], axis=1)
+        heights = np.linalg.norm(cylinders[:, 2] - cylinders[:, 0], axis=1)
+        return float(np.max(np.maximum(2 * radii, heights)))
+    return float(np.max(np.ptp(vertices, axis=0)))
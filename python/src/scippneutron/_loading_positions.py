@@ -5,7 +5,8 @@ import numpy as np
 import scipp as sc
 from ._loading_common import Group
 from ._loading_transformations import (get_position_from_transformations,
-                                       TransformationError)
+                                       TransformationError,
+                                       TransformationCache)
 from ._loading_nexus import LoadFromNexus, GroupObject
 
 
@@ -20,22 +21,20 @@ def load_position_of_unique_component(
         nx_class: str,
         file_root: h5py.File,
         nexus: LoadFromNexus,
-        default_position: Optional[np.ndarray] = None):
+        default_position: Optional[np.ndarray] = None,
+        transform_cache: Optional[TransformationCache] = None):
     if len(groups) > 1:
         warn(f"More than one {nx_class} found in file, "
              f"skipping loading {name} position")
         return
     try:
-        position, units = _get_position_of_component(groups[0].group, name,
-                                                     nx_class, file_root,
-                                                     nexus, default_position)
+        position, units, times = _get_position_of_component(
+            groups[0].group, name, nx_class, file_root, nexus,
+            default_position, transform_cache)
     except PositionError:
         return
-    _add_attr_to_loaded_data(f"{name}_position",
-                             data,
-                             position,
-                             unit=units,
-                             dtype=sc.dtype.vector_3_float64)
+    _add_position_to_loaded_data(f"{name}_position", data, position, units,
+                                 times)
 
 
 def load_positions_of_components(
@@ -45,26 +44,22 @@ def load_positions_of_components(
         nx_class: str,
         file_root: h5py.File,
         nexus: LoadFromNexus,
-        default_position: Optional[np.ndarray] = None):
+        default_position: Optional[np.ndarray] = None,
+        transform_cache: Optional[TransformationCache] = None):
     for group in groups:
         try:
-            position, units = _get_position_of_component(
+            position, units, times = _get_position_of_component(
                 group.group, name, nx_class, file_root, nexus,
-                default_position)
+                default_position, transform_cache)
         except PositionError:
             continue
         if len(groups) == 1:
-            _add_attr_to_loaded_data(f"{name}_position",
-                                     data,
-                                     position,
-                                     unit=units,
-                                     dtype=sc.dtype.vector_3_float64)
+            _add_position_to_loaded_data(f"{name}_position", data, position,
+                                         units, times)
         else:
-            _add_attr_to_loaded_data(f"{nexus.get_name(group.group)}_position",
-                                     data,
-                                     position,
-                                     unit=units,
-                                     dtype=sc.dtype.vector_3_float64)
+            _add_position_to_loaded_data(
+                f"{nexus.get_name(group.group)}_position", data, position,
+                units, times)
 
 
 def _get_position_of_component(
@@ -73,19 +68,21 @@ def _get_position_of_component(
     nx_class: str,
     file_root: h5py.File,
     nexus: LoadFromNexus,
-    default_position: Optional[np.ndarray] = None
-) -> Tuple[np.ndarray, sc.Unit]:
+    default_position: Optional[np.ndarray] = None,
+    transform_cache: Optional[TransformationCache] = None
+) -> Tuple[np.ndarray, sc.Unit, Optional[sc.Variable]]:
     depends_on_found, _ = nexus.dataset_in_group(group, "depends_on")
     distance_found, _ = nexus.dataset_in_group(group, "distance")
     if depends_on_found:
         try:
-            position = get_position_from_transformations(
-                group, file_root, nexus)
+            position, times = get_position_from_transformations(
+                group, file_root, nexus, transform_cache)
         except TransformationError as e:
             warn(f"Skipping loading {name} position due to error: {e}")
             raise PositionError
         units = sc.units.m
     elif distance_found:
+        times = None
 
         position = np.array([
             0, 0,
@@ -102,8 +99,37 @@ def _get_position_of_component(
     else:
         position = np.array([0, 0, 0])
         units = sc.units.m
+        times = None
 
-    return position, units
+    return position, units, times
+
+
+def _add_position_to_loaded_data(attr_name: str, data: sc.Variable,
+                                 position: np.ndarray, unit: sc.Unit,
+                                 times: Optional[sc.Variable]):
+    if times is None:
+        _add_attr_to_loaded_data(attr_name,
+                                 data,
+                                 position,
+                                 unit=unit,
+                                 dtype=sc.dtype.vector_3_float64)
+        return
+    # Position depends on time-dependent transformations,
+    # store it as a time series like an NXlog
+    position_data = {
+        "data":
+        sc.Variable(dims=["time"],
+                    values=position,
+                    unit=unit,
+                    dtype=sc.dtype.vector_3_float64),
+        "coords": {
+            # Copy as times may be shared with other components
+            "time": times.copy()
+        }
+    }
+    _add_attr_to_loaded_data(
+        attr_name, data,
+        sc.Variable(value=sc.detail.move_to_data_array(**position_data)), None)
 
 
 def _add_attr_to_loaded_data(attr_name: str,
@@ -117,7 +143,9 @@ def _add_attr_to_loaded_data(attr_name: str,
         pass
 
     try:
-        if dtype is not None:
+        if isinstance(value, sc.Variable):
+            data[attr_name] = value
+        elif dtype is not None:
             data[attr_name] = sc.Variable(value=value, dtype=dtype, unit=unit)
         else:
             data[attr_name] = sc.Variable(value=value, unit=unit)
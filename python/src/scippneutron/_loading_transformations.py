@@ -2,45 +2,127 @@
 # Copyright (c) 2021 Scipp contributors (https://github.com/scipp)
 # @author Matthew Jones
 import warnings
+from dataclasses import dataclass
 
 import numpy as np
 from ._loading_common import MissingDataset, MissingAttribute
-from typing import Union, List, Tuple, Dict
+from typing import Union, Tuple, Dict, Optional
 import scipp as sc
 import h5py
 from cmath import isclose
 from ._loading_nexus import LoadFromNexus, GroupObject
-from ._loading_json_nexus import contains_stream
+from ._loading_json_nexus import contains_stream, get_stream
 
 
 class TransformationError(Exception):
     pass
 
 
-def _rotation_matrix_from_axis_and_angle(axis: np.ndarray,
-                                         angle_radians: float) -> np.ndarray:
+def rotation_matrices_from_axes_and_angles(
+        axes: np.ndarray, angles_radians: Union[float,
+                                                np.ndarray]) -> np.ndarray:
+    """
+    Build rotation matrices for rotations by angles_radians about axes.
+    axes has shape (..., 3) and angles_radians has shape (...), leading
+    dimensions are broadcast against each other and a stack of matrices
+    of the broadcast shape + (3, 3) is returned
+    """
     # Following convention for passive transformation
     # Variable naming follows that used in
     # https://doi.org/10.1061/(ASCE)SU.1943-5428.0000247
-    i = np.identity(3)
-    l1, l2, l3 = tuple(axis)
-    ll = np.array([[0, -l3, l2], [l3, 0, -l1], [-l2, l1, 0]])
-    l1l2 = l1 * l2
-    l1l3 = l1 * l3
-    l2l3 = l2 * l3
-    l1_squared = l1 * l1
-    l2_squared = l2 * l2
-    l3_squared = l3 * l3
-    ll_2 = np.array([[-(l2_squared + l3_squared), l1l2, l1l3],
-                     [l1l2, -(l1_squared + l3_squared), l2l3],
-                     [l1l3, l2l3, -(l1_squared + l2_squared)]])
-
-    return i - np.sin(angle_radians) * ll + (1 - np.cos(angle_radians)) * ll_2
-
-
-def get_position_from_transformations(group: GroupObject,
-                                      root: [h5py.File, h5py.Group],
-                                      nexus: LoadFromNexus) -> np.ndarray:
+    axes = np.asarray(axes, dtype=np.float64)
+    l1 = axes[..., 0]
+    l2 = axes[..., 1]
+    l3 = axes[..., 2]
+    zeros = np.zeros_like(l1)
+    row_1 = np.stack((zeros, -l3, l2), axis=-1)
+    row_2 = np.stack((l3, zeros, -l1), axis=-1)
+    row_3 = np.stack((-l2, l1, zeros), axis=-1)
+    ll = np.stack((row_1, row_2, row_3), axis=-2)
+    # Square of the cross product matrix, l l^T - |l|^2 I
+    ll_2 = np.matmul(ll, ll)
+
+    # Trailing axes broadcast the angles over the 3x3 matrices
+    angles_radians = np.asarray(angles_radians)[..., np.newaxis, np.newaxis]
+    sin = np.sin(angles_radians)
+    cos = np.cos(angles_radians)
+    return np.identity(3) - sin * ll + (1 - cos) * ll_2
+
+
+def _affine_matrix(rotation: np.ndarray,
+                   translation: np.ndarray) -> np.ndarray:
+    """
+    Make 4x4 matrices from 3x3 rotation matrices and translation vectors,
+    leading dimensions of the inputs are broadcast against each other
+    """
+    shape = np.broadcast(rotation[..., 0, 0], translation[..., 0]).shape
+    matrix = np.zeros(shape + (4, 4))
+    matrix[..., :3, :3] = rotation
+    matrix[..., :3, 3] = translation
+    matrix[..., 3, 3] = 1.
+    return matrix
+
+
+@dataclass
+class StreamedTransformation:
+    """
+    Transformation from an NXlog with values which are streamed,
+    found in the JSON structure of a run start message
+    """
+    source_name: str
+    topic: str
+    transformation_type: str
+    vector: np.ndarray
+    offset: np.ndarray
+    unit: sc.Unit
+
+    def matrix(self, value: float) -> np.ndarray:
+        """
+        4x4 passive transformation matrix for a streamed value
+        """
+        if self.transformation_type == 'translation':
+            magnitude = sc.to_unit(value * self.unit, sc.units.m).value
+            # -1 as describes passive transformation
+            return _affine_matrix(np.identity(3),
+                                  self.vector * -1. * magnitude + self.offset)
+        angle = np.deg2rad(value) if self.unit == sc.units.deg else value
+        return _affine_matrix(
+            rotation_matrices_from_axes_and_angles(self.vector, angle),
+            self.offset)
+
+
+class TransformationCache:
+    """
+    Resolved nodes of depends_on chains, keyed by the path of the node.
+    For each node the cache holds its own 4x4 matrix and the product
+    of the matrices from that node to the end of its chain, so that
+    components sharing part of a chain (for example detector banks
+    mounted on the same stage) only resolve the shared part once.
+    One instance should only be used for a single file.
+    """
+    def __init__(self):
+        self.matrices: Dict[str, np.ndarray] = {}
+        self.chain_products: Dict[str, np.ndarray] = {}
+        self.depends_on: Dict[str, str] = {}
+        # Times are only present for nodes from multi-valued NXlogs
+        # (or chains containing them), the matrices for these nodes
+        # have an additional leading time dimension
+        self.times: Dict[str, Optional[sc.Variable]] = {}
+        self.chain_times: Dict[str, Optional[sc.Variable]] = {}
+        # Streamed NXlogs, their matrices are the identity as their
+        # values are not known when loading
+        self.streamed: Dict[str, StreamedTransformation] = {}
+
+    def __contains__(self, transform_path: str) -> bool:
+        return transform_path in self.chain_products
+
+
+def get_position_from_transformations(
+    group: GroupObject,
+    root: [h5py.File, h5py.Group],
+    nexus: LoadFromNexus,
+    cache: Optional[TransformationCache] = None
+) -> Tuple[np.ndarray, Optional[sc.Variable]]:
     """
     Get position of a component which has a "depends_on" dataset
 
@@ -48,15 +130,72 @@ def get_position_from_transformations(group: GroupObject,
     :param root: The root of the NeXus file, transformation paths are
       assumed to be relative to this
     :param nexus: wrap data access to hdf file or objects from json
-    :return: Position of the component as a three-element numpy array
+    :param cache: transformations already resolved in this file
+    :return: Position of the component as a three-element numpy array,
+      or an array of shape (n_times, 3) if the chain includes multi-valued
+      NXlogs, in which case the times are also returned
     """
-    total_transform_matrix = get_full_transformation_matrix(group, root, nexus)
+    total_transform_matrix, times = get_full_transformation(
+        group, root, nexus, cache)
     return np.matmul(total_transform_matrix, np.array([0, 0, 0, 1],
-                                                      dtype=float))[0:3]
+                                                      dtype=float))[...,
+                                                                    0:3], times
+
+
+def get_full_transformation_matrix(
+        group: GroupObject,
+        root: h5py.File,
+        nexus: LoadFromNexus,
+        cache: Optional[TransformationCache] = None) -> np.ndarray:
+    """
+    Get the 4x4 transformation matrix for a component, see
+    get_full_transformation, the times of any time-dependent
+    transformations are discarded
+    """
+    return get_full_transformation(group, root, nexus, cache)[0]
+
 
+def transformation_as_dataset(matrix: np.ndarray,
+                              times: Optional[sc.Variable]) -> sc.Dataset:
+    """
+    Split 4x4 transformation matrices, as returned by
+    get_full_transformation, into rotation and translation
 
-def get_full_transformation_matrix(group: GroupObject, root: h5py.File,
-                                   nexus: LoadFromNexus) -> np.ndarray:
+    :return: Dataset containing "rotation" (matrix_3_float64) and
+      "translation" (vector_3_float64, the position of the component),
+      with a time dimension if times are given
+    """
+    if times is None:
+        return sc.Dataset(
+            data={
+                "rotation":
+                sc.Variable(value=matrix[:3, :3],
+                            dtype=sc.dtype.matrix_3_float64),
+                "translation":
+                sc.Variable(value=matrix[:3, 3],
+                            dtype=sc.dtype.vector_3_float64,
+                            unit=sc.units.m)
+            })
+    return sc.Dataset(data={
+        "rotation":
+        sc.Variable(dims=["time"],
+                    values=matrix[:, :3, :3],
+                    dtype=sc.dtype.matrix_3_float64),
+        "translation":
+        sc.Variable(dims=["time"],
+                    values=matrix[:, :3, 3],
+                    dtype=sc.dtype.vector_3_float64,
+                    unit=sc.units.m)
+    },
+                      coords={"time": times.copy()})
+
+
+def get_full_transformation(
+    group: GroupObject,
+    root: h5py.File,
+    nexus: LoadFromNexus,
+    cache: Optional[TransformationCache] = None
+) -> Tuple[np.ndarray, Optional[sc.Variable]]:
     """
     Get the 4x4 transformation matrix for a component, resulting
     from the full chain of transformations linked by "depends_on"
@@ -66,45 +205,90 @@ def get_full_transformation_matrix(group: GroupObject, root: h5py.File,
     :param root: The root of the NeXus file, transformation paths are
       assumed to be relative to this
     :param nexus: wrap data access to hdf file or objects from json
-    :return: 4x4 passive transformation matrix as a numpy array
+    :param cache: transformations already resolved in this file, any
+      newly resolved transformations are added to it
+    :return: 4x4 passive transformation matrix as a numpy array, if the
+      chain includes multi-valued NXlogs then a (n_times, 4, 4) stack of
+      matrices and the times, otherwise times are None
     """
-    transformations = []
     try:
         depends_on = nexus.load_scalar_string(group, "depends_on")
     except MissingDataset:
         depends_on = '.'
-    _get_transformations(depends_on, transformations, root,
-                         nexus.get_name(group), nexus)
-    total_transform_matrix = np.identity(4)
-    for transformation in transformations:
-        total_transform_matrix = np.matmul(transformation,
-                                           total_transform_matrix)
-    return total_transform_matrix
-
-
-def _get_transformations(transform_path: str,
-                         transformations: List[np.ndarray],
-                         root: Union[h5py.File, Dict], group_name: str,
-                         nexus: LoadFromNexus):
+    if cache is None:
+        cache = TransformationCache()
+    return _get_transformations(depends_on, cache, root, nexus.get_name(group),
+                                nexus)
+
+
+def _get_transformations(
+        transform_path: str, cache: TransformationCache,
+        root: Union[h5py.File, Dict], group_name: str,
+        nexus: LoadFromNexus) -> Tuple[np.ndarray, Optional[sc.Variable]]:
     """
-    Get all transformations in the depends_on chain
+    Get the product of all transformations in the depends_on chain,
+    only loading transformations which are not already in the cache
 
     :param transform_path: The first depends_on path string
-    :param transformations: List of transformations to populate
+    :param cache: Resolved transformations, populated with the
+      transformations found in this chain
     :param root: root of the file, depends_on paths assumed to be
       relative to this
     """
-    if transform_path != '.':
+    unresolved_paths = []
+    while transform_path != '.' and transform_path not in cache:
+        if transform_path in unresolved_paths:
+            raise TransformationError(
+                f"Circular depends_on path '{transform_path}' found "
+                f"in transformations chain for {group_name}")
         try:
             transform = nexus.get_object_by_path(root, transform_path)
         except KeyError:
             raise TransformationError(
                 f"Non-existent depends_on path '{transform_path}' found "
                 f"in transformations chain for {group_name}")
-        next_depends_on = _append_transformation(transform, transformations,
-                                                 group_name, nexus)
-        _get_transformations(next_depends_on, transformations, root,
-                             group_name, nexus)
+        if _transformation_is_nx_log_stream(transform, nexus):
+            matrix, times, next_depends_on = _get_streamed_transformation(
+                transform, transform_path, cache, nexus)
+        else:
+            matrix, times, next_depends_on = _get_transformation(
+                transform, group_name, nexus)
+        cache.matrices[transform_path] = matrix
+        cache.times[transform_path] = times
+        cache.depends_on[transform_path] = next_depends_on
+        unresolved_paths.append(transform_path)
+        transform_path = next_depends_on
+
+    if transform_path == '.':
+        chain_product = np.identity(4)
+        chain_times = None
+    else:
+        chain_product = cache.chain_products[transform_path]
+        chain_times = cache.chain_times[transform_path]
+    # Each transformation is applied after those it depends on,
+    # stacks of time-dependent matrices are broadcast by matmul
+    for path in reversed(unresolved_paths):
+        chain_times = _combine_times(chain_times, cache.times[path],
+                                     group_name)
+        chain_product = np.matmul(chain_product, cache.matrices[path])
+        cache.chain_products[path] = chain_product
+        cache.chain_times[path] = chain_times
+    return chain_product, chain_times
+
+
+def _combine_times(times_a: Optional[sc.Variable],
+                   times_b: Optional[sc.Variable],
+                   group_name: str) -> Optional[sc.Variable]:
+    if times_a is None:
+        return times_b
+    if times_b is None:
+        return times_a
+    if times_a.unit != times_b.unit or not np.array_equal(
+            times_a.values, times_b.values):
+        raise TransformationError(
+            f"Found multivalued NXlogs with different times in the "
+            f"transformation chain for {group_name}, this is not supported")
+    return times_a
 
 
 def _transformation_is_nx_log_stream(transform: Union[h5py.Dataset,
@@ -125,49 +309,110 @@ def _transformation_is_nx_log_stream(transform: Union[h5py.Dataset,
     return False
 
 
-def _append_transformation(transform: Union[h5py.Dataset, GroupObject],
-                           transformations: List[np.ndarray], group_name: str,
-                           nexus: LoadFromNexus) -> str:
-    if _transformation_is_nx_log_stream(transform, nexus):
+def _get_depends_on_attribute(transform: Union[h5py.Dataset, GroupObject],
+                              nexus: LoadFromNexus) -> str:
+    try:
+        return nexus.get_string_attribute(transform, "depends_on")
+    except MissingAttribute:
+        return "."
+
+
+def _get_vector_and_offset(
+        transform: Union[h5py.Dataset, GroupObject],
+        nexus: LoadFromNexus) -> Tuple[np.ndarray, np.ndarray]:
+    try:
+        vector = nexus.get_attribute_as_numpy_array(transform,
+                                                    "vector").astype(float)
+        vector = _normalise(vector, nexus.get_name(transform))
+    except MissingAttribute:
+        raise TransformationError(
+            f"Missing 'vector' attribute in transformation "
+            f"at {nexus.get_name(transform)}")
+
+    try:
+        offset = nexus.get_attribute_as_numpy_array(transform,
+                                                    "offset").astype(float)
+    except MissingAttribute:
+        offset = np.array([0., 0., 0.], dtype=float)
+    return vector, offset
+
+
+def _get_streamed_transformation(
+        transform: GroupObject, transform_path: str,
+        cache: TransformationCache,
+        nexus: LoadFromNexus) -> Tuple[np.ndarray, None, str]:
+    """
+    The values of a streamed NXlog are not known when loading, so the
+    transformation is treated as a 0-distance translation. If it has the
+    attributes of a transformation then it is added to the cache, so that
+    positions can be updated as its values are streamed.
+    """
+    try:
+        cache.streamed[transform_path] = _load_streamed_transformation(
+            transform, nexus)
+    except (TransformationError, MissingAttribute, KeyError):
         warnings.warn("Streamed NXlog found in transformation "
-                      "chain, getting its value from stream is "
-                      "not yet implemented and instead it will be "
+                      "chain without the attributes needed to apply "
+                      "its streamed values, instead it will be "
                       "treated as a 0-distance translation")
-        matrix = np.eye(4, dtype=float)
-        transformations.append(matrix)
-    else:
-        try:
-            vector = nexus.get_attribute_as_numpy_array(transform,
-                                                        "vector").astype(float)
-            vector = _normalise(vector, nexus.get_name(transform))
-        except MissingAttribute:
-            raise TransformationError(
-                f"Missing 'vector' attribute in transformation "
-                f"at {nexus.get_name(transform)}")
+    return np.eye(4, dtype=float), None, _get_depends_on_attribute(
+        transform, nexus)
 
-        try:
-            offset = nexus.get_attribute_as_numpy_array(transform,
-                                                        "offset").astype(float)
-        except MissingAttribute:
-            offset = np.array([0., 0., 0.], dtype=float)
-
-        transform_type = nexus.get_string_attribute(transform,
-                                                    "transformation_type")
-        if transform_type == 'translation':
-            _append_translation(offset, transform, transformations, vector,
-                                group_name, nexus)
-        elif transform_type == 'rotation':
-            _append_rotation(offset, transform, transformations, vector,
-                             group_name, nexus)
-        else:
-            raise TransformationError(f"Unknown transformation type "
-                                      f"'{transform_type}'"
-                                      f" at {nexus.get_name(transform)}")
+
+def _load_streamed_transformation(
+        transform: GroupObject,
+        nexus: LoadFromNexus) -> StreamedTransformation:
+    stream = get_stream(transform)
+    vector, offset = _get_vector_and_offset(transform, nexus)
+    transform_type = nexus.get_string_attribute(transform,
+                                                "transformation_type")
     try:
-        depends_on = nexus.get_string_attribute(transform, "depends_on")
-    except MissingAttribute:
-        depends_on = "."
-    return depends_on
+        unit_str = stream["value_units"]
+    except KeyError:
+        unit_str = nexus.get_string_attribute(transform, "units")
+    try:
+        unit = sc.Unit(unit_str)
+    except RuntimeError:
+        raise TransformationError(f"Unrecognised units '{unit_str}' for "
+                                  f"transformation at "
+                                  f"{nexus.get_name(transform)}")
+    if transform_type == 'translation':
+        try:
+            sc.to_unit(1. * unit, sc.units.m)
+        except RuntimeError:
+            raise TransformationError(
+                f"Unit for translation transformation must be a length, "
+                f"problem in {nexus.get_name(transform)}")
+    elif transform_type == 'rotation':
+        if unit not in (sc.units.deg, sc.units.rad):
+            raise TransformationError(
+                f"Unit for rotation transformation must be radians "
+                f"or degrees, problem in {nexus.get_name(transform)}")
+    else:
+        raise TransformationError(f"Unknown transformation type "
+                                  f"'{transform_type}'"
+                                  f" at {nexus.get_name(transform)}")
+    return StreamedTransformation(stream["source"], stream["topic"],
+                                  transform_type, vector, offset, unit)
+
+
+def _get_transformation(
+        transform: Union[h5py.Dataset, GroupObject], group_name: str,
+        nexus: LoadFromNexus) -> Tuple[np.ndarray, Optional[sc.Variable], str]:
+    vector, offset = _get_vector_and_offset(transform, nexus)
+    transform_type = nexus.get_string_attribute(transform,
+                                                "transformation_type")
+    if transform_type == 'translation':
+        matrix, times = _get_translation(offset, transform, vector, group_name,
+                                         nexus)
+    elif transform_type == 'rotation':
+        matrix, times = _get_rotation(offset, transform, vector, group_name,
+                                      nexus)
+    else:
+        raise TransformationError(f"Unknown transformation type "
+                                  f"'{transform_type}'"
+                                  f" at {nexus.get_name(transform)}")
+    return matrix, times, _get_depends_on_attribute(transform, nexus)
 
 
 def _normalise(vector: np.ndarray, transform_name: str) -> np.ndarray:
@@ -179,23 +424,24 @@ def _normalise(vector: np.ndarray, transform_name: str) -> np.ndarray:
     return vector / norm
 
 
-def _append_translation(offset: np.ndarray, transform: GroupObject,
-                        transformations: List[np.ndarray],
-                        direction_unit_vector: np.ndarray, group_name: str,
-                        nexus: LoadFromNexus):
-    magnitude, unit = _get_transformation_magnitude_and_unit(
+def _get_translation(
+        offset: np.ndarray, transform: GroupObject,
+        direction_unit_vector: np.ndarray, group_name: str,
+        nexus: LoadFromNexus) -> Tuple[np.ndarray, Optional[sc.Variable]]:
+    magnitude, unit, times = _get_transformation_magnitude_and_unit(
         group_name, transform, nexus)
 
     if unit != sc.units.m:
-        magnitude_var = magnitude * unit
+        magnitude_var = sc.Variable(dims=["temporary_variable"],
+                                    values=np.atleast_1d(magnitude),
+                                    unit=unit)
         magnitude_var = sc.to_unit(magnitude_var, sc.units.m)
-        magnitude = magnitude_var.value
+        magnitude = magnitude_var.values.reshape(np.shape(magnitude))
     # -1 as describes passive transformation
-    vector = direction_unit_vector * -1. * magnitude
+    vector = direction_unit_vector * -1. * np.asarray(magnitude)[...,
+                                                                 np.newaxis]
     offset_vector = vector + offset
-    matrix = np.block([[np.eye(3), offset_vector[np.newaxis].T],
-                       [0., 0., 0., 1.]])
-    transformations.append(matrix)
+    return _affine_matrix(np.identity(3), offset_vector), times
 
 
 def _get_unit(attributes: h5py.AttributeManager,
@@ -214,20 +460,27 @@ def _get_unit(attributes: h5py.AttributeManager,
 
 
 def _get_transformation_magnitude_and_unit(
-        group_name: str, transform: Union[h5py.Dataset, GroupObject],
-        nexus: LoadFromNexus) -> Tuple[float, sc.Unit]:
+    group_name: str, transform: Union[h5py.Dataset,
+                                      GroupObject], nexus: LoadFromNexus
+) -> Tuple[Union[float, np.ndarray], sc.Unit, Optional[sc.Variable]]:
+    """
+    The magnitude is an array, with the corresponding times, only if
+    the transformation is a multi-valued NXlog
+    """
+    times = None
     if nexus.is_group(transform):
         value = nexus.load_dataset_from_group_as_numpy_array(
             transform, "value")
         try:
-            if value.size > 1:
-                raise TransformationError(f"Found multivalued NXlog as a "
-                                          f"transformation for {group_name}, "
-                                          f"this is not yet supported")
             if value.size == 0:
                 raise TransformationError(f"Found empty NXlog as a "
                                           f"transformation for {group_name}")
-            magnitude = value.astype(float).item()
+            if value.size > 1:
+                magnitude = value.astype(float)
+                times = _load_transformation_times(group_name, transform,
+                                                   magnitude, nexus)
+            else:
+                magnitude = value.astype(float).item()
         except KeyError:
             raise TransformationError(
                 f"Encountered {nexus.get_name(transform)} in transformation "
@@ -248,14 +501,34 @@ def _get_transformation_magnitude_and_unit(
         if unit == sc.units.dimensionless:
             raise TransformationError(f"Missing units for transformation at "
                                       f"{nexus.get_name(transform)}")
-    return magnitude, sc.Unit(unit)
+    return magnitude, sc.Unit(unit), times
+
+
+def _load_transformation_times(group_name: str, transform: GroupObject,
+                               magnitude: np.ndarray,
+                               nexus: LoadFromNexus) -> sc.Variable:
+    if magnitude.ndim != 1:
+        raise TransformationError(
+            f"Found NXlog with multidimensional value dataset as a "
+            f"transformation for {group_name}, this is not supported")
+    try:
+        times = nexus.load_dataset(transform, "time", ["time"])
+    except MissingDataset:
+        raise TransformationError(
+            f"Found multivalued NXlog without a time dataset as a "
+            f"transformation for {group_name}")
+    if tuple(times.shape) != magnitude.shape:
+        raise TransformationError(
+            f"Found NXlog with time and value datasets of different "
+            f"shapes as a transformation for {group_name}")
+    return times
 
 
-def _append_rotation(offset: np.ndarray, transform: GroupObject,
-                     transformations: List[np.ndarray],
-                     rotation_axis: np.ndarray, group_name: str,
-                     nexus: LoadFromNexus):
-    angle, unit = _get_transformation_magnitude_and_unit(
+def _get_rotation(
+        offset: np.ndarray, transform: GroupObject, rotation_axis: np.ndarray,
+        group_name: str,
+        nexus: LoadFromNexus) -> Tuple[np.ndarray, Optional[sc.Variable]]:
+    angle, unit, times = _get_transformation_magnitude_and_unit(
         group_name, transform, nexus)
     if unit == sc.units.deg:
         angle = np.deg2rad(angle)
@@ -263,10 +536,8 @@ def _append_rotation(offset: np.ndarray, transform: GroupObject,
         raise TransformationError(
             f"Unit for rotation transformation must be radians "
             f"or degrees, problem in {transform.name}")
-    rotation_matrix = _rotation_matrix_from_axis_and_angle(
+    rotation_matrix = rotation_matrices_from_axes_and_angles(
         rotation_axis, angle)
     # Make 4x4 matrix from our 3x3 rotation matrix to include
     # possible "offset"
-    matrix = np.block([[rotation_matrix, offset[np.newaxis].T],
-                       [0., 0., 0., 1.]])
-    transformations.append(matrix)
+    return _affine_matrix(rotation_matrix, offset), times
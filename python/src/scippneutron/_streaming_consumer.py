@@ -1,6 +1,7 @@
 from confluent_kafka import Consumer, TopicPartition, KafkaError
-from typing import Callable, List, Dict, Optional, Tuple, Type
+from typing import Callable, List, Dict, Optional, Tuple, Type, Union
 import asyncio
+import threading
 from warnings import warn
 from streaming_data_types.run_start_pl72 import deserialise_pl72
 from streaming_data_types.exceptions import WrongSchemaException
@@ -29,10 +30,14 @@ class RunStartError(Exception):
 
 
 class KafkaConsumer:
-    def __init__(self, topic_partitions: List[TopicPartition], conf: Dict,
-                 callback: Callable, stop_at_end_of_partition: bool):
+    def __init__(self,
+                 topic_partitions: List[TopicPartition],
+                 conf: Dict,
+                 callback: Callable,
+                 stop_at_end_of_partition: bool,
+                 consumer_factory: Callable[[Dict], Consumer] = Consumer):
         conf['enable.partition.eof'] = stop_at_end_of_partition
-        self._consumer = Consumer(conf)
+        self._consumer = consumer_factory(conf)
         # To consume messages the consumer must "subscribe" to one
         # or more topics or "assign" specific topic partitions, the
         # latter allows us to start consuming at an offset specified
@@ -75,14 +80,82 @@ class KafkaConsumer:
         self.stopped = True
 
 
+class KafkaThreadedConsumer:
+    """
+    Consumes in a dedicated thread, fetching batches of messages with
+    consume() rather than polling for one message at a time on the event
+    loop. The callback is called in the consumer thread with a list of
+    message payloads, so it must be thread-safe.
+    """
+    def __init__(self,
+                 topic_partitions: List[TopicPartition],
+                 conf: Dict,
+                 callback: Callable[[List[bytes]], None],
+                 stop_at_end_of_partition: bool,
+                 batch_size: int = 1000,
+                 timeout: float = 0.1,
+                 consumer_factory: Callable[[Dict], Consumer] = Consumer):
+        conf['enable.partition.eof'] = stop_at_end_of_partition
+        self._consumer = consumer_factory(conf)
+        self._consumer.assign(topic_partitions)
+        self._callback = callback
+        self._stop_at_end_of_partition = stop_at_end_of_partition
+        self._batch_size = batch_size
+        self._timeout = timeout
+        self._reached_eop = False
+        self._cancelled = False
+        self._thread: Optional[threading.Thread] = None
+        self.stopped = True
+
+    def start(self):
+        self.stopped = False
+        self._cancelled = False
+        self._thread = threading.Thread(target=self._consume_loop, daemon=True)
+        self._thread.start()
+
+    def _consume_loop(self):
+        while not self._cancelled:
+            messages = self._consumer.consume(num_messages=self._batch_size,
+                                              timeout=self._timeout)
+            payloads = []
+            for msg in messages:
+                if msg.error():
+                    if self._stop_at_end_of_partition and msg.error().code(
+                    ) == KafkaError._PARTITION_EOF:
+                        self._reached_eop = True
+                    else:
+                        warn(f"Message error in consumer: {msg.error()}")
+                    self._cancelled = True
+                    break
+                payloads.append(msg.value())
+            if payloads:
+                self._callback(payloads)
+        # The consumer is not thread-safe, so it is closed by the
+        # thread which uses it
+        self._consumer.close()
+        self.stopped = True
+
+    def stop(self):
+        self._cancelled = True
+        if self._thread is not None and \
+                self._thread is not threading.current_thread():
+            self._thread.join()
+        self.stopped = True
+
+
 class KafkaQueryConsumer:
     """
     Wraps Kafka library consumer methods which query the
     broker for metadata and poll for single messages.
     It is a thin wrapper but allows a fake to be used
     in unit tests.
+    The consumer_factory of this and the other consumers creates the
+    underlying Consumer from its config, the client of a FakeBroker can
+    be used instead to consume without a Kafka cluster.
     """
-    def __init__(self, broker: str):
+    def __init__(self,
+                 broker: str,
+                 consumer_factory: Callable[[Dict], Consumer] = Consumer):
         # Set "queued.min.messages" to 1 as we will consume backwards through
         # the partition one message at a time; we do not want to retrieve
         # multiple messages in the forward direction each time we step
@@ -94,7 +167,7 @@ class KafkaQueryConsumer:
             "enable.auto.commit": False,
             "queued.min.messages": 1
         }
-        self._consumer = Consumer(**conf)
+        self._consumer = consumer_factory(conf)
 
     def get_topic_partitions(self, topic: str, offset: int = -1):
         metadata = self._consumer.list_topics(topic)
@@ -131,13 +204,15 @@ class KafkaQueryConsumer:
 
 
 def create_consumers(
-        start_time: sc.Variable,
-        topics: List[str],
-        kafka_broker: str,
-        query_consumer: KafkaQueryConsumer,
-        consumer_type: Type[KafkaConsumer],  # so we can inject fake consumer
-        callback: Callable,
-        stop_at_end_of_partition: bool = False) -> List[KafkaConsumer]:
+    start_time: sc.Variable,
+    topics: List[str],
+    kafka_broker: str,
+    query_consumer: KafkaQueryConsumer,
+    # so we can inject fake consumer
+    consumer_type: Type[Union[KafkaConsumer, KafkaThreadedConsumer]],
+    callback: Callable,
+    stop_at_end_of_partition: bool = False
+) -> List[Union[KafkaConsumer, KafkaThreadedConsumer]]:
     """
     Creates one consumer per TopicPartition that start consuming
     at specified timestamp in the data stream
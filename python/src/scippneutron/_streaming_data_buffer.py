@@ -1,10 +1,18 @@
 import scipp as sc
 import numpy as np
 import asyncio
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from streaming_data_types.eventdata_ev42 import deserialise_ev42
+from streaming_data_types.logdata_f142 import deserialise_f142
 from streaming_data_types.exceptions import WrongSchemaException
-from typing import Optional
+from typing import Optional, List, Dict
 from warnings import warn
+from ._streaming_histogram import LiveHistogram
+from ._streaming_log_buffer import LogRingBuffer, log_to_variable
+from ._streaming_process_consumer import EventBatch
+from ._streaming_transformations import LivePositions, merge_position_updates
+from ._streaming_queue_policy import QueueFullPolicy
 """
 The ESS data streaming system uses Google FlatBuffers to serialise
 data to transmit in the Kafka message payload. FlatBuffers uses schemas
@@ -18,46 +26,188 @@ Each schema is identified by a 4 character string which is included in:
 - the module name in ess-streaming-data-types.
 """
 
+# Upper limit on the number of pulses (messages) held in the buffer,
+# each needs only a pulse time and the index of its first event
+_max_buffered_pulses = 65536
 
-class StreamedDataBuffer:
+
+def _without_attrs(data: sc.DataArray) -> sc.DataArray:
+    return sc.DataArray(
+        data=data.data,
+        coords={name: data.coords[name]
+                for name in data.coords.keys()})
+
+
+class _EventSlot:
     """
-    This owns the buffer for data consumed from Kafka.
-    It periodically emits accumulated data to a processing pipeline
-    and resets the buffer. If the buffer fills up within the emit time
-    interval then data is emitted more frequently.
+    Storage for events and their pulse times, the StreamedDataBuffer
+    fills one slot while data from another are being emitted.
+    A slot is not reused once its data have been emitted, as the emitted
+    data hold its events.
     """
-    def __init__(self, queue: asyncio.Queue, buffer_size: int,
-                 interval: sc.Variable):
-        self._buffer_mutex = asyncio.Lock()
-        self._interval_s = sc.to_unit(interval, 's').value
-        self._buffer_size = buffer_size
-        tof_buffer = sc.zeros(dims=['event'],
+    def __init__(self, buffer_size: int, pulse_buffer_size: int):
+        self.buffer_size = buffer_size
+        self.pulse_buffer_size = pulse_buffer_size
+        # Only the events which have been added are ever read,
+        # so the buffers are not initialised
+        tof_buffer = sc.empty(dims=['event'],
                               shape=[buffer_size],
                               unit=sc.units.ns,
                               dtype=sc.dtype.int32)
-        id_buffer = sc.zeros(dims=['event'],
+        id_buffer = sc.empty(dims=['event'],
                              shape=[buffer_size],
                              unit=sc.units.one,
                              dtype=sc.dtype.int32)
-        pulse_times = sc.zeros(dims=['event'],
-                               shape=[buffer_size],
-                               unit=sc.units.ns,
-                               dtype=sc.dtype.int64)
         weights = sc.ones(dims=['event'], shape=[buffer_size], variances=True)
-        self._events_buffer = sc.DataArray(weights, {
+        self.events = sc.DataArray(weights, {
             'tof': tof_buffer,
-            'detector_id': id_buffer,
-            'pulse_time': pulse_times
+            'detector_id': id_buffer
         })
-        self._current_event = 0
+        # One entry per message rather than per event
+        self.pulse_times = np.empty(pulse_buffer_size, dtype=np.int64)
+        self.pulse_first_event = np.empty(pulse_buffer_size, dtype=np.int64)
+        self.current_event = 0
+        self.current_pulse = 0
+
+    def has_space_for(self, message_size: int) -> bool:
+        return self.current_event + message_size <= self.buffer_size and \
+            self.current_pulse < self.pulse_buffer_size
+
+    def add(self, detector_id: np.ndarray, time_of_flight: np.ndarray,
+            pulse_time: int):
+        message_size = detector_id.size
+        frame = self.events['event', self.current_event:self.current_event +
+                            message_size]
+        frame.coords['detector_id'].values = detector_id
+        frame.coords['tof'].values = time_of_flight
+        self.pulse_times[self.current_pulse] = pulse_time
+        self.pulse_first_event[self.current_pulse] = self.current_event
+        self.current_pulse += 1
+        self.current_event += message_size
+
+    def pulses_that_fit(self, pulse_end_event: np.ndarray) -> int:
+        """
+        Number of the given pulses, starting from the first, which fit in
+        the slot. pulse_end_event is the end of the events of each pulse,
+        relative to the start of the events of the first pulse.
+        """
+        n_pulses = np.searchsorted(pulse_end_event,
+                                   self.buffer_size - self.current_event,
+                                   side='right')
+        return int(min(n_pulses, self.pulse_buffer_size - self.current_pulse))
+
+    def add_pulses(self, detector_id: np.ndarray, time_of_flight: np.ndarray,
+                   pulse_times: np.ndarray, pulse_first_event: np.ndarray):
+        """
+        Add the events of several pulses in one copy, pulse_first_event
+        is relative to the start of detector_id and time_of_flight
+        """
+        n_events = detector_id.size
+        n_pulses = pulse_times.size
+        frame = self.events['event',
+                            self.current_event:self.current_event + n_events]
+        frame.coords['detector_id'].values = detector_id
+        frame.coords['tof'].values = time_of_flight
+        pulses = slice(self.current_pulse, self.current_pulse + n_pulses)
+        self.pulse_times[pulses] = pulse_times
+        self.pulse_first_event[pulses] = pulse_first_event + \
+            self.current_event
+        self.current_pulse += n_pulses
+        self.current_event += n_events
+
+    def binned_by_pulse(self) -> sc.DataArray:
+        """
+        The events in the slot, binned by pulse. The events are not copied
+        out of the slot, so nothing must be added to it afterwards.
+        """
+        events = self.events['event', :self.current_event]
+        begin = self.pulse_first_event[:self.current_pulse]
+        end = np.append(begin[1:], self.current_event)
+        return sc.DataArray(
+            data=sc.bins(data=events,
+                         dim='event',
+                         begin=sc.Variable(['pulse'], values=begin),
+                         end=sc.Variable(['pulse'], values=end)),
+            coords={
+                'pulse_time':
+                sc.Variable(['pulse'],
+                            values=self.pulse_times[:self.current_pulse],
+                            unit=sc.units.ns,
+                            dtype=sc.dtype.int64)
+            })
+
+
+class StreamedDataBuffer:
+    """
+    This owns the buffer for data consumed from Kafka.
+    It periodically emits accumulated data to a processing pipeline
+    and resets the buffer. If the buffer fills up within the emit time
+    interval then data is emitted more frequently.
+    Emitted events are binned by pulse, with a pulse_time coord.
+
+    Data are double buffered: on emit the filled slot is swapped for an
+    empty one, which is all that is done while holding the mutex.
+    The events of the filled slot are emitted without copying them, and
+    a newly allocated slot is put in its place for the next swap.
+    Ingestion is therefore never blocked on the mutex during a copy.
+
+    Events deserialised by consumers in worker processes are added in
+    batches of pulses (new_event_batch), copying as many pulses as fit in
+    the buffer at once.
+
+    If a LiveHistogram is given then events are accumulated into it
+    instead of being buffered, and the histogram is emitted.
+
+    Log data (f142) are stored in a ring buffer per source, of
+    log_buffer_size values, and emitted as attrs of the event data.
+    If live positions are set then f142 values of streamed
+    transformations update them, and positions which have changed are
+    also emitted as attrs.
+
+    If the queue has a maxsize then queue_full_policy determines what
+    happens when data are emitted while the queue is full: ingestion
+    waits for space, the oldest data on the queue are dropped or all of
+    the data on the queue are merged with the new data. The number of
+    events dropped and merged are counted, and given as attrs of the
+    emitted data once any have been.
+    """
+    def __init__(self,
+                 queue: asyncio.Queue,
+                 buffer_size: int,
+                 interval: sc.Variable,
+                 histogram: Optional[LiveHistogram] = None,
+                 log_buffer_size: int = 10000,
+                 queue_full_policy: QueueFullPolicy = QueueFullPolicy.block):
+        self._buffer_mutex = threading.Lock()
+        self._interval_s = sc.to_unit(interval, 's').value
+        self._buffer_size = buffer_size
+        self._histogram = histogram
+        self._log_buffer_size = log_buffer_size
+        self._logs: Dict[str, LogRingBuffer] = {}
+        self._skipped_log_count = 0
+        self._live_positions: Optional[LivePositions] = None
+        if histogram is None:
+            pulse_buffer_size = min(buffer_size, _max_buffered_pulses)
+            self._active_slot = _EventSlot(buffer_size, pulse_buffer_size)
+            self._free_slots = [_EventSlot(buffer_size, pulse_buffer_size)]
         self._cancelled = False
         self._unrecognised_fb_id_count = 0
         self._periodic_emit: Optional[asyncio.Task] = None
         self._emit_queue = queue
+        self._queue_full_policy = queue_full_policy
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.dropped_chunks = 0
+        self.dropped_events = 0
+        self.merged_chunks = 0
+        self.merged_events = 0
+
+    def set_live_positions(self, live_positions: Optional[LivePositions]):
+        self._live_positions = live_positions
 
     def start(self):
         self._cancelled = False
         self._unrecognised_fb_id_count = 0
+        self._loop = asyncio.get_running_loop()
         self._periodic_emit = asyncio.create_task(self._emit_loop())
 
     def stop(self):
@@ -65,51 +215,320 @@ class StreamedDataBuffer:
         if self._periodic_emit is not None:
             self._periodic_emit.cancel()
 
-    async def _emit_data(self):
-        async with self._buffer_mutex:
+    def _take_logs(self) -> Dict[str, sc.Variable]:
+        with self._buffer_mutex:
             if self._unrecognised_fb_id_count:
                 warn(f"Received {self._unrecognised_fb_id_count}"
                      " messages with unrecognised FlatBuffer ids")
                 self._unrecognised_fb_id_count = 0
-            if self._current_event == 0:
-                return
-            new_data = self._events_buffer[
-                'event', :self._current_event].copy()
-            self._current_event = 0
+            if self._skipped_log_count:
+                warn(f"Skipped {self._skipped_log_count} log messages with "
+                     "non-numeric values, values of more than 1 dimension "
+                     "or values which differ in dtype or shape from "
+                     "previous values of the same source")
+                self._skipped_log_count = 0
+            taken_logs = {name: log.take() for name, log in self._logs.items()}
+        logs = {}
+        for name, taken_log in taken_logs.items():
+            if taken_log is None:
+                continue
+            times, values, overwritten = taken_log
+            if overwritten:
+                warn(f"{overwritten} values of log '{name}' were "
+                     "overwritten before being emitted, please restart "
+                     "with a larger log_buffer_size")
+            logs[name] = log_to_variable(times, values)
+        return logs
+
+    def _swap_slots(self, force: bool) -> Optional[_EventSlot]:
+        """
+        Returns the filled slot, or None if there are no data to emit,
+        if force is True the slot is returned even if it is empty
+        """
+        with self._buffer_mutex:
+            filled_slot = self._active_slot
+            if filled_slot.current_pulse == 0 and not force:
+                return None
+            if self._free_slots:
+                self._active_slot = self._free_slots.pop()
+            else:
+                # All other slots are still being emitted from
+                self._active_slot = _EventSlot(filled_slot.buffer_size,
+                                               filled_slot.pulse_buffer_size)
+        return filled_slot
+
+    def _take_data(self) -> Optional[sc.DataArray]:
+        """
+        Data to emit, or None if there are none
+        """
+        attrs = self._take_logs()
+        if self._live_positions is not None:
+            attrs.update(self._live_positions.take_updated())
+        # Logs and positions are emitted even if there are no new events
+        if self._histogram is not None:
+            new_data = self._take_histogram(force=bool(attrs))
+        else:
+            new_data = self._take_events(force=bool(attrs))
+        if new_data is None:
+            return None
+        for name, attr in attrs.items():
+            new_data.attrs[name] = attr
+        return new_data
+
+    def _take_events(self, force: bool) -> Optional[sc.DataArray]:
+        filled_slot = self._swap_slots(force)
+        if filled_slot is None:
+            return None
+        new_data = filled_slot.binned_by_pulse()
+        # The emitted data hold the events of the filled slot,
+        # so it is replaced rather than reused
+        new_slot = _EventSlot(filled_slot.buffer_size,
+                              filled_slot.pulse_buffer_size)
+        with self._buffer_mutex:
+            self._free_slots.append(new_slot)
+        return new_data
+
+    def _take_histogram(self, force: bool) -> Optional[sc.DataArray]:
+        with self._buffer_mutex:
+            histogram = self._histogram.take(force)
+        if histogram is None:
+            return None
+        return self._histogram.to_data_array(*histogram)
+
+    def _event_count(self, data: sc.DataArray) -> int:
+        if self._histogram is not None:
+            return int(np.sum(data.values))
+        return int(np.sum(data.bins.size().values))
+
+    def _merge(self, queued_data: List[sc.DataArray]) -> sc.DataArray:
+        """
+        Merge data in the order they were emitted, logs are concatenated,
+        updates of detector pixel positions are combined and for other
+        attrs the latest value is kept
+        """
+        attrs = {}
+        merged = None
+        for data in queued_data:
+            for name in data.attrs.keys():
+                attr = data.attrs[name]
+                if name in attrs and name in self._logs:
+                    attr = sc.Variable(value=sc.concatenate(
+                        attrs[name].value, attr.value, 'time'))
+                elif name in attrs and name == "position":
+                    attr = sc.Variable(value=merge_position_updates(
+                        attrs[name].value, attr.value))
+                attrs[name] = attr
+            if merged is None:
+                merged = data
+            elif self._histogram is not None:
+                merged = self._histogram.merge(merged, data)
+            else:
+                merged = sc.concatenate(_without_attrs(merged),
+                                        _without_attrs(data), 'pulse')
+        merged = _without_attrs(merged)
+        for name, attr in attrs.items():
+            merged.attrs[name] = attr
+        return merged
+
+    def _put_nowait(self, new_data: sc.DataArray):
+        """
+        Put data on the queue, dropping or merging queued data if
+        the queue is full. Call from the event loop thread.
+        """
+        if self._emit_queue.full():
+            if self._queue_full_policy == QueueFullPolicy.drop_oldest:
+                dropped_data = self._emit_queue.get_nowait()
+                self.dropped_chunks += 1
+                self.dropped_events += self._event_count(dropped_data)
+            elif self._queue_full_policy == QueueFullPolicy.merge:
+                queued_data = [
+                    self._emit_queue.get_nowait()
+                    for _ in range(self._emit_queue.qsize())
+                ]
+                # Count the new data, which are merged into queued data,
+                # so that events are not counted again if merged again
+                self.merged_chunks += 1
+                self.merged_events += self._event_count(new_data)
+                new_data = self._merge(queued_data + [new_data])
+        if self.dropped_chunks or self.merged_chunks:
+            new_data.attrs['dropped_events'] = sc.Variable(
+                value=self.dropped_events)
+            new_data.attrs['merged_events'] = sc.Variable(
+                value=self.merged_events)
         self._emit_queue.put_nowait(new_data)
 
+    async def _put_on_queue(self, new_data: sc.DataArray):
+        if self._queue_full_policy == QueueFullPolicy.block:
+            await self._emit_queue.put(new_data)
+        else:
+            self._put_nowait(new_data)
+
+    def _put_on_queue_from_thread(self, new_data: sc.DataArray):
+        """
+        The queue is not thread-safe, so data from a consumer thread are
+        put on the queue by the event loop. With the block policy the
+        consumer thread waits until there is space on the queue.
+        """
+        if self._queue_full_policy != QueueFullPolicy.block or \
+                self._emit_queue.maxsize <= 0:
+            self._loop.call_soon_threadsafe(self._put_nowait, new_data)
+            return
+        future = asyncio.run_coroutine_threadsafe(
+            self._emit_queue.put(new_data), self._loop)
+        while True:
+            try:
+                future.result(timeout=self._interval_s)
+                return
+            except FutureTimeoutError:
+                if self._cancelled:
+                    future.cancel()
+                    return
+
+    async def _emit_data(self):
+        new_data = self._take_data()
+        if new_data is not None:
+            await self._put_on_queue(new_data)
+
     async def _emit_loop(self):
         while not self._cancelled:
             await asyncio.sleep(self._interval_s)
             await self._emit_data()
 
     async def new_data(self, new_data: bytes):
+        for emitted_data in self._ingest(new_data):
+            await self._put_on_queue(emitted_data)
+
+    def new_data_batch(self, messages: List[bytes]):
+        """
+        Add a batch of messages, this can be called from a consumer thread
+        """
+        for message in messages:
+            for emitted_data in self._ingest(message):
+                self._put_on_queue_from_thread(emitted_data)
+
+    def new_event_batch(self, messages: List[bytes],
+                        events: Optional[EventBatch]):
+        """
+        Add events which were deserialised by a consumer's worker process,
+        and messages which it did not deserialise. This can be called from
+        a consumer thread. The events may be in shared memory which the
+        worker reuses after this returns, so they are copied.
+        """
+        emitted_data = []
+        if events is not None:
+            emitted_data.extend(self._ingest_event_batch(events))
+        for message in messages:
+            emitted_data.extend(self._ingest(message))
+        for data in emitted_data:
+            self._put_on_queue_from_thread(data)
+
+    def _ingest_event_batch(self, events: EventBatch) -> List[sc.DataArray]:
+        emitted_data = []
+        pulse_end_event = np.append(events.pulse_first_event[1:],
+                                    events.detector_id.size)
+        if self._histogram is not None:
+            for pulse_time, begin, end in zip(events.pulse_times,
+                                              events.pulse_first_event,
+                                              pulse_end_event):
+                bins, counts = self._histogram.bin_events(
+                    events.detector_id[begin:end],
+                    events.time_of_flight[begin:end])
+                with self._buffer_mutex:
+                    self._histogram.add(bins, counts, int(pulse_time))
+            return emitted_data
+        first_pulse = 0
+        n_pulses = events.pulse_times.size
+        while first_pulse < n_pulses:
+            begin = events.pulse_first_event[first_pulse]
+            if pulse_end_event[first_pulse] - begin > self._buffer_size:
+                self._warn_message_too_large(pulse_end_event[first_pulse] -
+                                             begin)
+                first_pulse += 1
+                continue
+            with self._buffer_mutex:
+                n_fit = self._active_slot.pulses_that_fit(
+                    pulse_end_event[first_pulse:] - begin)
+                if n_fit > 0:
+                    last_pulse = first_pulse + n_fit
+                    end = pulse_end_event[last_pulse - 1]
+                    self._active_slot.add_pulses(
+                        events.detector_id[begin:end],
+                        events.time_of_flight[begin:end],
+                        events.pulse_times[first_pulse:last_pulse],
+                        events.pulse_first_event[first_pulse:last_pulse] -
+                        begin)
+                    first_pulse = last_pulse
+                    continue
+            # Emit the data in the buffer to make space for the rest
+            data = self._take_data()
+            if data is not None:
+                emitted_data.append(data)
+        return emitted_data
+
+    def _warn_message_too_large(self, message_size: int):
+        warn("Single message would overflow NewDataBuffer, "
+             "please restart with a larger buffer_size:\n"
+             f"message_size: {message_size}, buffer_size:"
+             f" {self._buffer_size}. These data have been "
+             f"skipped!")
+
+    def _ingest(self, new_data: bytes) -> List[sc.DataArray]:
+        """
+        Returns any data which had to be emitted to make space for the
+        new data, for the caller to put on the queue
+        """
+        emitted_data = []
         # Are they event data?
         try:
             deserialised_data = deserialise_ev42(new_data)
-            message_size = deserialised_data.detector_id.size
-            if message_size > self._buffer_size:
-                warn("Single message would overflow NewDataBuffer, "
-                     "please restart with a larger buffer_size:\n"
-                     f"message_size: {message_size}, buffer_size:"
-                     f" {self._buffer_size}. These data have been "
-                     f"skipped!")
-                return
+        except WrongSchemaException:
+            self._ingest_log(new_data)
+            return emitted_data
+        if self._histogram is not None:
+            # Binning does not need the mutex, only adding the counts does
+            bins, counts = self._histogram.bin_events(
+                deserialised_data.detector_id,
+                deserialised_data.time_of_flight)
+            with self._buffer_mutex:
+                self._histogram.add(bins, counts, deserialised_data.pulse_time)
+            return emitted_data
+        message_size = deserialised_data.detector_id.size
+        if message_size > self._buffer_size:
+            self._warn_message_too_large(message_size)
+            return emitted_data
+        while True:
+            with self._buffer_mutex:
+                if self._active_slot.has_space_for(message_size):
+                    self._active_slot.add(deserialised_data.detector_id,
+                                          deserialised_data.time_of_flight,
+                                          deserialised_data.pulse_time)
+                    return emitted_data
             # If new data would overfill buffer then emit data
             # currently in buffer first
-            if self._current_event + message_size > self._buffer_size:
-                await self._emit_data()
-            async with self._buffer_mutex:
-                frame = self._events_buffer[
-                    'event',
-                    self._current_event:self._current_event + message_size]
-                frame.coords[
-                    'detector_id'].values = deserialised_data.detector_id
-                frame.coords['tof'].values = deserialised_data.time_of_flight
-                frame.coords['pulse_time'].values = \
-                    deserialised_data.pulse_time * \
-                    np.ones_like(deserialised_data.time_of_flight)
-                self._current_event += message_size
-            return
+            data = self._take_data()
+            if data is not None:
+                emitted_data.append(data)
+
+    def _ingest_log(self, new_data: bytes):
+        try:
+            deserialised_data = deserialise_f142(new_data)
         except WrongSchemaException:
-            self._unrecognised_fb_id_count += 1
+            with self._buffer_mutex:
+                self._unrecognised_fb_id_count += 1
+            return
+        source_name = deserialised_data.source_name
+        value = deserialised_data.value
+        with self._buffer_mutex:
+            try:
+                if source_name not in self._logs:
+                    self._logs[source_name] = LogRingBuffer(
+                        source_name, self._log_buffer_size, value)
+                self._logs[source_name].add(
+                    deserialised_data.timestamp_unix_ns, value)
+            except ValueError:
+                self._skipped_log_count += 1
+        live_positions = self._live_positions
+        if live_positions is not None and \
+                source_name in live_positions.source_names and \
+                value.size == 1:
+            live_positions.set_value(source_name, float(value))
@@ -0,0 +1,281 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2021 Scipp contributors (https://github.com/scipp)
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from confluent_kafka import (TopicPartition, KafkaError, OFFSET_BEGINNING,
+                             OFFSET_END, TIMESTAMP_CREATE_TIME)
+"""
+An in-process stand-in for a Kafka broker, for benchmarking and testing
+data_stream without a Kafka cluster.
+
+Messages are produced to the FakeBroker, and consumed through clients
+which implement the parts of the confluent-kafka Consumer interface used
+by KafkaConsumer, KafkaThreadedConsumer and KafkaQueryConsumer. Those
+consumers create their Consumer with a consumer_factory, for which
+FakeBroker.client can be given, so the consuming code is the same as
+with a real broker.
+Messages are kept in memory and never deleted, so the first offset of
+each partition is always 0.
+"""
+
+
+class _FakePartitionEOF:
+    def __init__(self, topic: str, partition: int):
+        self._topic = topic
+        self._partition = partition
+
+    @staticmethod
+    def code() -> int:
+        return KafkaError._PARTITION_EOF
+
+    def __str__(self) -> str:
+        return (f"Reached end of partition {self._partition} "
+                f"of topic '{self._topic}'")
+
+
+class FakeMessage:
+    def __init__(self,
+                 topic: str,
+                 partition: int,
+                 offset: int,
+                 payload: Optional[bytes],
+                 timestamp_ms: int,
+                 error: Optional[_FakePartitionEOF] = None):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._payload = payload
+        self._timestamp_ms = timestamp_ms
+        self._error = error
+
+    def value(self) -> Optional[bytes]:
+        return self._payload
+
+    def error(self) -> Optional[_FakePartitionEOF]:
+        return self._error
+
+    def timestamp(self) -> Tuple[int, int]:
+        return TIMESTAMP_CREATE_TIME, self._timestamp_ms
+
+    def topic(self) -> str:
+        return self._topic
+
+    def partition(self) -> int:
+        return self._partition
+
+    def offset(self) -> int:
+        return self._offset
+
+
+class _PartitionMetadata:
+    def __init__(self, partition_id: int):
+        self.id = partition_id
+
+
+class _TopicMetadata:
+    def __init__(self, n_partitions: int):
+        self.partitions = {
+            partition_id: _PartitionMetadata(partition_id)
+            for partition_id in range(n_partitions)
+        }
+
+
+class _ClusterMetadata:
+    def __init__(self, topics: Dict[str, int]):
+        self.topics = {
+            topic: _TopicMetadata(n_partitions)
+            for topic, n_partitions in topics.items()
+        }
+
+
+class FakeBroker:
+    """
+    Holds the messages of each partition of each topic. Producing is
+    thread-safe, and wakes clients which are waiting for messages.
+    Topics are created with one partition when first used, unless
+    they are created with more partitions beforehand.
+    """
+    def __init__(self):
+        self._partitions: Dict[str, List[List[FakeMessage]]] = {}
+        self._new_messages = threading.Condition()
+
+    @property
+    def topics(self) -> Dict[str, int]:
+        """
+        Number of partitions of each topic
+        """
+        with self._new_messages:
+            return {
+                topic: len(partitions)
+                for topic, partitions in self._partitions.items()
+            }
+
+    def create_topic(self, topic: str, n_partitions: int = 1):
+        with self._new_messages:
+            if topic in self._partitions:
+                raise ValueError(f"Topic '{topic}' already exists")
+            self._partitions[topic] = [[] for _ in range(n_partitions)]
+
+    def _get_partitions(self, topic: str) -> List[List[FakeMessage]]:
+        try:
+            return self._partitions[topic]
+        except KeyError:
+            self._partitions[topic] = [[]]
+            return self._partitions[topic]
+
+    def produce(self,
+                topic: str,
+                payload: bytes,
+                partition: int = 0,
+                timestamp_ms: Optional[int] = None):
+        if timestamp_ms is None:
+            timestamp_ms = int(time.time() * 1000)
+        with self._new_messages:
+            messages = self._get_partitions(topic)[partition]
+            messages.append(
+                FakeMessage(topic, partition, len(messages), payload,
+                            timestamp_ms))
+            self._new_messages.notify_all()
+
+    def client(self, conf: Optional[Dict] = None) -> "FakeBrokerClient":
+        """
+        Use as the consumer_factory of the streaming consumers
+        """
+        return FakeBrokerClient(self, {} if conf is None else conf)
+
+
+class FakeBrokerClient:
+    """
+    Implements the methods of confluent_kafka.Consumer which are used
+    by the streaming consumers, for consuming from a FakeBroker
+    """
+    def __init__(self, broker: FakeBroker, conf: Dict):
+        self._broker = broker
+        self._partition_eof = conf.get('enable.partition.eof', False)
+        # Next offset to consume from each assigned (topic, partition)
+        self._offsets: Dict[Tuple[str, int], int] = {}
+        # Partitions whose end has been reported since the last message
+        self._reported_eof = set()
+        self._closed = False
+
+    def _end_offset(self, topic: str, partition: int) -> int:
+        return len(self._broker._get_partitions(topic)[partition])
+
+    def _start_offset(self, partition: TopicPartition) -> int:
+        if partition.offset == OFFSET_BEGINNING:
+            return 0
+        if partition.offset < 0:
+            # OFFSET_END, or an offset which is not otherwise specified
+            return self._end_offset(partition.topic, partition.partition)
+        return partition.offset
+
+    def assign(self, partitions: List[TopicPartition]):
+        with self._broker._new_messages:
+            self._offsets = {(partition.topic, partition.partition):
+                             self._start_offset(partition)
+                             for partition in partitions}
+            self._reported_eof = set()
+
+    def seek(self, partition: TopicPartition):
+        with self._broker._new_messages:
+            key = (partition.topic, partition.partition)
+            self._offsets[key] = self._start_offset(partition)
+            self._reported_eof.discard(key)
+
+    def _take_available(self, num_messages: int) -> List[FakeMessage]:
+        messages = []
+        for key, offset in self._offsets.items():
+            topic, partition = key
+            partition_messages = self._broker._get_partitions(topic)[partition]
+            new_messages = partition_messages[offset:offset + num_messages -
+                                              len(messages)]
+            if new_messages:
+                messages.extend(new_messages)
+                self._offsets[key] = offset + len(new_messages)
+                self._reported_eof.discard(key)
+            elif self._partition_eof and key not in self._reported_eof:
+                messages.append(
+                    FakeMessage(topic, partition, offset, None, 0,
+                                _FakePartitionEOF(topic, partition)))
+                self._reported_eof.add(key)
+            if len(messages) >= num_messages:
+                break
+        return messages
+
+    def consume(self,
+                num_messages: int = 1,
+                timeout: Optional[float] = None) -> List[FakeMessage]:
+        """
+        Waits up to timeout seconds for at least one message,
+        no timeout or a negative one waits indefinitely
+        """
+        if timeout is not None and timeout >= 0:
+            deadline = time.monotonic() + timeout
+        else:
+            deadline = None
+        with self._broker._new_messages:
+            while True:
+                messages = self._take_available(num_messages)
+                if messages or self._closed:
+                    return messages
+                if deadline is None:
+                    self._broker._new_messages.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0.:
+                    return messages
+                self._broker._new_messages.wait(remaining)
+
+    def poll(self, timeout: Optional[float] = None) -> Optional[FakeMessage]:
+        messages = self.consume(1, timeout)
+        return messages[0] if messages else None
+
+    def close(self):
+        with self._broker._new_messages:
+            self._closed = True
+            self._broker._new_messages.notify_all()
+
+    def list_topics(self,
+                    topic: Optional[str] = None,
+                    timeout: Optional[float] = None) -> _ClusterMetadata:
+        with self._broker._new_messages:
+            if topic is not None:
+                self._broker._get_partitions(topic)
+            return _ClusterMetadata({
+                name: len(partitions)
+                for name, partitions in self._broker._partitions.items()
+                if topic is None or name == topic
+            })
+
+    def get_watermark_offsets(self,
+                              partition: TopicPartition,
+                              timeout: Optional[float] = None,
+                              cached: bool = False) -> Tuple[int, int]:
+        with self._broker._new_messages:
+            return 0, self._end_offset(partition.topic, partition.partition)
+
+    def offsets_for_times(
+            self,
+            partitions: List[TopicPartition],
+            timeout: Optional[float] = None) -> List[TopicPartition]:
+        """
+        The offset of each given partition is a timestamp in milliseconds,
+        returns the partitions with the offset of the first message at or
+        after that time, or the end of the partition if there is none
+        """
+        found_offsets = []
+        with self._broker._new_messages:
+            for partition in partitions:
+                messages = self._broker._get_partitions(
+                    partition.topic)[partition.partition]
+                offset = next((message.offset() for message in messages
+                               if message.timestamp()[1] >= partition.offset),
+                              OFFSET_END)
+                if offset == OFFSET_END:
+                    offset = len(messages)
+                found_offsets.append(
+                    TopicPartition(partition.topic, partition.partition,
+                                   offset))
+        return found_offsets
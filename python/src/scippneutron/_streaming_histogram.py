@@ -0,0 +1,262 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2021 Scipp contributors (https://github.com/scipp)
+
+from typing import Optional, Tuple
+import numpy as np
+import scipp as sc
+
+# Limit on the exponent of the event weights in a DecayedHistogram
+# before the histogram is renormalised, e^50 is far from overflowing
+_max_decay_exponent = 50.
+
+
+class LiveHistogram:
+    """
+    Preallocated (detector_id, tof) histogram which streamed events are
+    accumulated into, so the memory used does not depend on the event
+    rate. Events with a detector_id which is not in the histogram or
+    a time-of-flight outside of the edges are dropped.
+
+    Binning events (bin_events) does not modify the histogram, so it can
+    be done without holding the buffer's mutex, only add and take need it.
+    take only swaps or copies the accumulated counts, the data array is
+    made from them by to_data_array after the mutex is released.
+    """
+    def __init__(self,
+                 detector_ids: sc.Variable,
+                 tof_edges: sc.Variable,
+                 cumulative: bool = True):
+        ids = np.asarray(detector_ids.values, dtype=np.int64).ravel()
+        if ids.size == 0:
+            raise ValueError("At least one detector_id must be given")
+        if tof_edges.shape[0] < 2:
+            raise ValueError("At least two time-of-flight edges must be "
+                             "given")
+        self._detector_ids = sc.Variable(['detector_id'],
+                                         values=ids,
+                                         unit=sc.units.one,
+                                         dtype=sc.dtype.int32)
+        self._tof_edges = sc.to_unit(
+            sc.Variable(['tof'],
+                        values=np.asarray(tof_edges.values, np.float64),
+                        unit=tof_edges.unit), sc.units.ns)
+        # Lookup table from detector_id to row of the histogram,
+        # -1 for ids which are not in the histogram
+        self._min_id = ids.min()
+        self._row_of_id = np.full(ids.max() - self._min_id + 1,
+                                  -1,
+                                  dtype=np.int64)
+        self._row_of_id[ids - self._min_id] = np.arange(ids.size)
+
+        edges = self._tof_edges.values
+        if np.any(np.diff(edges) <= 0.):
+            raise ValueError("Time-of-flight edges must be sorted in "
+                             "ascending order")
+        self._edges = edges
+        self._n_tof = edges.size - 1
+        widths = np.diff(edges)
+        # For evenly spaced edges the bin is computed directly rather
+        # than by searching the edges
+        self._bin_width = widths[0] if np.allclose(widths, widths[0]) \
+            else None
+
+        self._cumulative = cumulative
+        self._counts = np.zeros(ids.size * self._n_tof, dtype=np.float64)
+        self._has_new_data = False
+
+    def bin_events(
+            self, detector_id: np.ndarray,
+            time_of_flight: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the (flattened) histogram bins which the events fall in,
+        and the number of events in each of those bins
+        """
+        id_index = detector_id.astype(np.int64) - self._min_id
+        in_id_range = (id_index >= 0) & (id_index < self._row_of_id.size)
+        rows = np.full(id_index.shape, -1, dtype=np.int64)
+        rows[in_id_range] = self._row_of_id[id_index[in_id_range]]
+
+        if self._bin_width is not None:
+            tof_bins = np.floor(
+                (time_of_flight - self._edges[0]) / self._bin_width)
+            tof_bins = tof_bins.astype(np.int64)
+        else:
+            tof_bins = np.searchsorted(
+                self._edges, time_of_flight, side='right') - 1
+        # The last edge is included in the last bin
+        tof_bins[time_of_flight == self._edges[-1]] = self._n_tof - 1
+
+        in_histogram = (rows >= 0) & (tof_bins >= 0) & (tof_bins < self._n_tof)
+        flat_bins = rows[in_histogram] * self._n_tof + tof_bins[in_histogram]
+        return np.unique(flat_bins, return_counts=True)
+
+    def add(self, bins: np.ndarray, counts: np.ndarray, pulse_time: int):
+        # Bins are unique, so fancy indexing does not drop counts
+        self._counts[bins] += counts
+        self._has_new_data = True
+
+    def take(
+        self,
+        force: bool = False
+    ) -> Optional[Tuple[np.ndarray, Optional[np.ndarray], float]]:
+        """
+        Snapshot of the histogram to emit, to pass to to_data_array,
+        or None if no events were added since the last take and force
+        is False. In delta mode the histogram is reset.
+        At most one copy of the accumulated counts is made, of a size
+        which depends only on the histogram size.
+        """
+        if not (self._has_new_data or force):
+            return None
+        self._has_new_data = False
+        return self._take()
+
+    def _take(self) -> Tuple[np.ndarray, Optional[np.ndarray], float]:
+        """
+        Counts, their variances, or None if they are equal to the counts,
+        and a scale to apply to the counts
+        """
+        if self._cumulative:
+            return self._counts.copy(), None, 1.
+        counts = self._counts
+        self._counts = np.zeros_like(counts)
+        return counts, None, 1.
+
+    def merge(self, older: sc.DataArray, newer: sc.DataArray) -> sc.DataArray:
+        """
+        Merge histograms in the order they were emitted. Cumulative
+        histograms already include the events of older histograms.
+        """
+        if self._cumulative:
+            return newer
+        return sc.DataArray(data=older.data + newer.data,
+                            coords={
+                                'detector_id': newer.coords['detector_id'],
+                                'tof': newer.coords['tof']
+                            })
+
+    def to_data_array(self, counts: np.ndarray,
+                      variances: Optional[np.ndarray],
+                      scale: float) -> sc.DataArray:
+        """
+        Make the histogram to emit from a snapshot returned by take,
+        the snapshot is modified
+        """
+        if scale != 1.:
+            counts *= scale
+            variances *= scale**2
+        if variances is None:
+            # Counts of unweighted events
+            variances = counts
+        shape = (self._detector_ids.shape[0], self._n_tof)
+        return sc.DataArray(data=sc.Variable(
+            ['detector_id', 'tof'],
+            values=counts.reshape(shape),
+            variances=variances.reshape(shape),
+            unit=sc.units.counts),
+                            coords={
+                                'detector_id': self._detector_ids.copy(),
+                                'tof': self._tof_edges.copy()
+                            })
+
+
+class RollingWindowHistogram(LiveHistogram):
+    """
+    Histogram of the events in the last window of pulse time.
+    The window is split into buckets, each with its own partial histogram,
+    and the sum over the buckets is kept up to date. Advancing the window
+    by a bucket subtracts the expired bucket from the sum, so the cost
+    does not depend on the number of buckets or the number of events
+    in the window.
+    """
+    def __init__(self,
+                 detector_ids: sc.Variable,
+                 tof_edges: sc.Variable,
+                 window: sc.Variable,
+                 n_buckets: int = 10):
+        super().__init__(detector_ids, tof_edges, cumulative=True)
+        if n_buckets < 1:
+            raise ValueError("The window must have at least one bucket")
+        window_ns = sc.to_unit(window, sc.units.ns).value
+        if window_ns <= 0:
+            raise ValueError("The window must be longer than zero")
+        self._bucket_ns = max(int(window_ns // n_buckets), 1)
+        self._buckets = np.zeros((n_buckets, self._counts.size),
+                                 dtype=np.float64)
+        self._current_bucket: Optional[int] = None
+
+    def _advance(self, bucket: int):
+        if self._current_bucket is None:
+            self._current_bucket = bucket
+            return
+        # Late messages are counted in the current bucket
+        steps = bucket - self._current_bucket
+        if steps <= 0:
+            return
+        n_buckets = self._buckets.shape[0]
+        if steps >= n_buckets:
+            self._buckets[...] = 0.
+            self._counts[...] = 0.
+        else:
+            for step in range(1, steps + 1):
+                expired = (self._current_bucket + step) % n_buckets
+                self._counts -= self._buckets[expired]
+                self._buckets[expired] = 0.
+        self._current_bucket = bucket
+        # Emit the reduced window even if no events fall in it
+        self._has_new_data = True
+
+    def add(self, bins: np.ndarray, counts: np.ndarray, pulse_time: int):
+        self._advance(pulse_time // self._bucket_ns)
+        n_buckets = self._buckets.shape[0]
+        self._buckets[self._current_bucket % n_buckets, bins] += counts
+        super().add(bins, counts, pulse_time)
+
+
+class DecayedHistogram(LiveHistogram):
+    """
+    Histogram in which each event is weighted by exp(-age / decay_time),
+    with age the pulse time since the event relative to the latest
+    pulse time.
+    Rather than decaying the whole histogram on every message, new events
+    are given a weight which grows with pulse time and the histogram is
+    scaled down only when it is emitted or the weights get large.
+    """
+    def __init__(self, detector_ids: sc.Variable, tof_edges: sc.Variable,
+                 decay_time: sc.Variable):
+        super().__init__(detector_ids, tof_edges, cumulative=True)
+        self._decay_time_ns = sc.to_unit(decay_time, sc.units.ns).value
+        if self._decay_time_ns <= 0:
+            raise ValueError("The decay time must be longer than zero")
+        self._variances = np.zeros_like(self._counts)
+        # Pulse time at which event weights are 1
+        self._reference_time: Optional[int] = None
+        self._latest_time: Optional[int] = None
+
+    def _exponent(self, pulse_time: int) -> float:
+        return (pulse_time - self._reference_time) / self._decay_time_ns
+
+    def _renormalise(self, pulse_time: int):
+        exponent = self._exponent(pulse_time)
+        self._counts *= np.exp(-exponent)
+        self._variances *= np.exp(-2. * exponent)
+        self._reference_time = pulse_time
+
+    def add(self, bins: np.ndarray, counts: np.ndarray, pulse_time: int):
+        if self._reference_time is None:
+            self._reference_time = pulse_time
+            self._latest_time = pulse_time
+        self._latest_time = max(self._latest_time, pulse_time)
+        if self._exponent(self._latest_time) > _max_decay_exponent:
+            self._renormalise(self._latest_time)
+        weight = np.exp(self._exponent(pulse_time))
+        self._counts[bins] += weight * counts
+        self._variances[bins] += weight**2 * counts
+        self._has_new_data = True
+
+    def _take(self) -> Tuple[np.ndarray, Optional[np.ndarray], float]:
+        if self._latest_time is None:
+            return self._counts.copy(), self._variances.copy(), 1.
+        # Scaled by to_data_array, after the mutex is released
+        scale = np.exp(-self._exponent(self._latest_time))
+        return self._counts.copy(), self._variances.copy(), scale
@@ -0,0 +1,78 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2021 Scipp contributors (https://github.com/scipp)
+
+from typing import Optional, Tuple
+import numpy as np
+import scipp as sc
+
+
+class LogRingBuffer:
+    """
+    Preallocated ring buffer of (time, value) for one log source, such
+    as a sample environment device streamed as f142 messages.
+    The dtype and shape of the values are fixed by the first value.
+    If more values arrive between emits than fit in the buffer then the
+    oldest are overwritten, as the latest values are most useful.
+    """
+    def __init__(self, source_name: str, capacity: int,
+                 first_value: np.ndarray):
+        if not (np.issubdtype(first_value.dtype, np.number)
+                or first_value.dtype == np.bool_):
+            raise ValueError(f"Log '{source_name}' has non-numeric values")
+        if first_value.ndim > 1:
+            raise ValueError(f"Log '{source_name}' has values with more "
+                             f"than 1 dimension")
+        self.source_name = source_name
+        self._times = np.zeros(capacity, dtype=np.int64)
+        self._values = np.zeros((capacity, *first_value.shape),
+                                dtype=first_value.dtype)
+        # Number of values added since the last take
+        self._count = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._times.size
+
+    def add(self, time: int, value: np.ndarray):
+        if value.shape != self._values.shape[1:] or not np.can_cast(
+                value.dtype, self._values.dtype, casting='same_kind'):
+            raise ValueError(f"Log '{self.source_name}' value does not have "
+                             f"the dtype and shape of previous values")
+        index = self._count % self.capacity
+        self._times[index] = time
+        self._values[index] = value
+        self._count += 1
+
+    def take(self) -> Optional[Tuple[np.ndarray, np.ndarray, int]]:
+        """
+        Copy of the times and values added since the last take, in the
+        order they were added, and the number of values which were
+        overwritten. Returns None if nothing was added.
+        """
+        if self._count == 0:
+            return None
+        if self._count <= self.capacity:
+            times = self._times[:self._count].copy()
+            values = self._values[:self._count].copy()
+        else:
+            oldest = self._count % self.capacity
+            times = np.roll(self._times, -oldest)
+            values = np.roll(self._values, -oldest, axis=0)
+        overwritten = max(self._count - self.capacity, 0)
+        self._count = 0
+        return times, values, overwritten
+
+
+def log_to_variable(times: np.ndarray, values: np.ndarray) -> sc.Variable:
+    """
+    Time-series DataArray of the log, wrapped in a Variable in the same
+    way as logs loaded from NeXus files so it can be stored as an attr
+    """
+    dims = ['time'] if values.ndim == 1 else ['time', 'value']
+    return sc.Variable(value=sc.DataArray(
+        data=sc.Variable(dims, values=values),
+        coords={
+            'time':
+            sc.Variable(
+                ['time'], values=times, unit=sc.units.ns, dtype=sc.dtype.int64)
+        }))
@@ -0,0 +1,295 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2021 Scipp contributors (https://github.com/scipp)
+
+import multiprocessing
+import queue
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from warnings import warn
+import numpy as np
+from confluent_kafka import Consumer, TopicPartition, KafkaError
+from streaming_data_types.eventdata_ev42 import deserialise_ev42
+from streaming_data_types.exceptions import WrongSchemaException
+"""
+Consumers which deserialise event (ev42) messages in worker processes,
+so that deserialisation is not limited to the one core which runs the
+Python interpreter of the main process.
+
+Each worker writes the deserialised events into blocks of shared memory
+and sends only the index of the filled block to the main process, which
+reads the events directly from the shared memory. Messages which are not
+event data are sent to the main process as they are.
+The worker has a fixed number of blocks, and waits for the main process
+to release one if they are all filled, so memory use is bounded.
+"""
+
+# Processes are spawned rather than forked as the main process has
+# threads and an asyncio event loop, which are not safe to fork
+_context = multiprocessing.get_context("spawn")
+
+# Number of events and pulses (messages) in each shared memory block
+_default_block_size = 262144
+_default_block_pulses = 4096
+_default_n_blocks = 4
+
+
+@dataclass
+class EventBatch:
+    """
+    Events of consecutive messages, pulse_first_event is the index of the
+    first event of each pulse in detector_id and time_of_flight.
+    The arrays may be views of shared memory, which is reused once the
+    consumer's callback returns.
+    """
+    pulse_times: np.ndarray
+    pulse_first_event: np.ndarray
+    detector_id: np.ndarray
+    time_of_flight: np.ndarray
+
+
+class _SharedEventBlock:
+    """
+    Arrays in shared memory for one batch of events,
+    they can be passed to a worker process when it is started
+    """
+    def __init__(self, size: int, n_pulses: int):
+        self.pulse_times = _context.RawArray('q', n_pulses)
+        self.pulse_first_event = _context.RawArray('q', n_pulses)
+        self.detector_id = _context.RawArray('i', size)
+        self.time_of_flight = _context.RawArray('i', size)
+
+    def arrays(self) -> EventBatch:
+        """
+        Numpy views of the full block, no data are copied
+        """
+        return EventBatch(
+            np.frombuffer(self.pulse_times, dtype=np.int64),
+            np.frombuffer(self.pulse_first_event, dtype=np.int64),
+            np.frombuffer(self.detector_id, dtype=np.int32),
+            np.frombuffer(self.time_of_flight, dtype=np.int32))
+
+    def batch(self, n_pulses: int, n_events: int) -> EventBatch:
+        arrays = self.arrays()
+        return EventBatch(arrays.pulse_times[:n_pulses],
+                          arrays.pulse_first_event[:n_pulses],
+                          arrays.detector_id[:n_events],
+                          arrays.time_of_flight[:n_events])
+
+
+class _EventBlockWriter:
+    """
+    Writes deserialised event messages into a shared block,
+    used in the worker process
+    """
+    def __init__(self, block: _SharedEventBlock):
+        self._arrays = block.arrays()
+        self.n_pulses = 0
+        self.n_events = 0
+
+    @property
+    def size(self) -> int:
+        return self._arrays.detector_id.size
+
+    def add(self, detector_id: np.ndarray, time_of_flight: np.ndarray,
+            pulse_time: int) -> bool:
+        """
+        Returns False, without adding the events, if they do not fit
+        """
+        message_size = detector_id.size
+        if self.n_events + message_size > self.size or \
+                self.n_pulses == self._arrays.pulse_times.size:
+            return False
+        end = self.n_events + message_size
+        self._arrays.detector_id[self.n_events:end] = detector_id
+        self._arrays.time_of_flight[self.n_events:end] = time_of_flight
+        self._arrays.pulse_times[self.n_pulses] = pulse_time
+        self._arrays.pulse_first_event[self.n_pulses] = self.n_events
+        self.n_pulses += 1
+        self.n_events = end
+        return True
+
+
+# Kinds of result sent from the worker to the main process
+_batch_result = "batch"
+_warning_result = "warning"
+_stopped_result = "stopped"
+
+
+def _get_free_block(free_blocks: multiprocessing.Queue,
+                    stop_event: multiprocessing.Event,
+                    timeout: float) -> Optional[int]:
+    while not stop_event.is_set():
+        try:
+            return free_blocks.get(timeout=timeout)
+        except queue.Empty:
+            pass
+    return None
+
+
+def _consume_in_process(topic_partitions: List[Tuple[str, int, int]],
+                        conf: Dict, stop_at_end_of_partition: bool,
+                        blocks: List[_SharedEventBlock],
+                        free_blocks: multiprocessing.Queue,
+                        results: multiprocessing.Queue,
+                        stop_event: multiprocessing.Event, batch_size: int,
+                        timeout: float, consumer_factory: Callable):
+    """
+    Target of the worker process, consumes messages and sends batches
+    of deserialised events and other payloads to the main process
+    """
+    conf['enable.partition.eof'] = stop_at_end_of_partition
+    consumer = consumer_factory(conf)
+    consumer.assign([
+        TopicPartition(topic, partition, offset=offset)
+        for topic, partition, offset in topic_partitions
+    ])
+    reached_eop = False
+    block_index = _get_free_block(free_blocks, stop_event, timeout)
+    while block_index is not None and not stop_event.is_set():
+        messages = consumer.consume(num_messages=batch_size, timeout=timeout)
+        writer = _EventBlockWriter(blocks[block_index])
+        payloads = []
+        for msg in messages:
+            if msg.error():
+                if stop_at_end_of_partition and msg.error().code(
+                ) == KafkaError._PARTITION_EOF:
+                    reached_eop = True
+                else:
+                    results.put((_warning_result,
+                                 f"Message error in consumer: {msg.error()}"))
+                stop_event.set()
+                break
+            try:
+                events = deserialise_ev42(msg.value())
+            except WrongSchemaException:
+                payloads.append(msg.value())
+                continue
+            if writer.add(events.detector_id, events.time_of_flight,
+                          events.pulse_time):
+                continue
+            if events.detector_id.size > writer.size:
+                # Too large for any block, the main process deals with it
+                payloads.append(msg.value())
+                continue
+            results.put((_batch_result, block_index, writer.n_pulses,
+                         writer.n_events, payloads))
+            payloads = []
+            block_index = _get_free_block(free_blocks, stop_event, timeout)
+            if block_index is None:
+                break
+            writer = _EventBlockWriter(blocks[block_index])
+            writer.add(events.detector_id, events.time_of_flight,
+                       events.pulse_time)
+        if block_index is None:
+            break
+        if writer.n_pulses:
+            results.put((_batch_result, block_index, writer.n_pulses,
+                         writer.n_events, payloads))
+            block_index = _get_free_block(free_blocks, stop_event, timeout)
+        elif payloads:
+            results.put((_batch_result, None, 0, 0, payloads))
+    # The consumer is not process-safe, so it is closed by the
+    # process which uses it
+    consumer.close()
+    results.put((_stopped_result, reached_eop))
+
+
+class KafkaProcessConsumer:
+    """
+    Consumes in a worker process, which deserialises event messages into
+    shared memory. A thread in the main process receives the batches and
+    calls the callback with a list of payloads which were not event data
+    and an EventBatch, or None if there were no events. The arrays of the
+    EventBatch are views of shared memory which is reused as soon as the
+    callback returns, so the callback must copy what it keeps.
+    The consumer_factory is called in the worker process, so it must be
+    picklable, for example a class or function defined at module level.
+    """
+    def __init__(self,
+                 topic_partitions: List[TopicPartition],
+                 conf: Dict,
+                 callback: Callable[[List[bytes], Optional[EventBatch]], None],
+                 stop_at_end_of_partition: bool,
+                 batch_size: int = 1000,
+                 timeout: float = 0.1,
+                 block_size: int = _default_block_size,
+                 block_pulses: int = _default_block_pulses,
+                 n_blocks: int = _default_n_blocks,
+                 consumer_factory: Callable[[Dict], Consumer] = Consumer):
+        # TopicPartition cannot be pickled to pass to the worker process
+        self._topic_partitions = [(partition.topic, partition.partition,
+                                   partition.offset)
+                                  for partition in topic_partitions]
+        self._conf = dict(conf)
+        self._callback = callback
+        self._stop_at_end_of_partition = stop_at_end_of_partition
+        self._batch_size = batch_size
+        self._timeout = timeout
+        self._consumer_factory = consumer_factory
+        self._blocks = [
+            _SharedEventBlock(block_size, block_pulses)
+            for _ in range(n_blocks)
+        ]
+        self._free_blocks: Optional[multiprocessing.Queue] = None
+        self._results: Optional[multiprocessing.Queue] = None
+        self._stop_event: Optional[multiprocessing.Event] = None
+        self._process: Optional[multiprocessing.Process] = None
+        self._thread: Optional[threading.Thread] = None
+        self._reached_eop = False
+        self.stopped = True
+
+    def start(self):
+        self.stopped = False
+        self._free_blocks = _context.Queue()
+        for block_index in range(len(self._blocks)):
+            self._free_blocks.put(block_index)
+        self._results = _context.Queue()
+        self._stop_event = _context.Event()
+        self._process = _context.Process(
+            target=_consume_in_process,
+            args=(self._topic_partitions, self._conf,
+                  self._stop_at_end_of_partition, self._blocks,
+                  self._free_blocks, self._results, self._stop_event,
+                  self._batch_size, self._timeout, self._consumer_factory),
+            daemon=True)
+        self._process.start()
+        self._thread = threading.Thread(target=self._receive_loop, daemon=True)
+        self._thread.start()
+
+    def _receive_loop(self):
+        while True:
+            try:
+                result = self._results.get(timeout=self._timeout)
+            except queue.Empty:
+                if not self._process.is_alive():
+                    break
+                continue
+            if result[0] == _batch_result:
+                _, block_index, n_pulses, n_events, payloads = result
+                if block_index is None:
+                    self._callback(payloads, None)
+                    continue
+                self._callback(
+                    payloads,
+                    self._blocks[block_index].batch(n_pulses, n_events))
+                # The main process has finished with the block
+                self._free_blocks.put(block_index)
+            elif result[0] == _warning_result:
+                warn(result[1])
+            elif result[0] == _stopped_result:
+                self._reached_eop = result[1]
+                break
+        self.stopped = True
+
+    def stop(self):
+        if self._stop_event is not None:
+            self._stop_event.set()
+        if self._thread is not None and \
+                self._thread is not threading.current_thread():
+            self._thread.join()
+        if self._process is not None:
+            self._process.join(timeout=10 * self._timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+        self.stopped = True
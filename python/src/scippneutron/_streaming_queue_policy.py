@@ -0,0 +1,15 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2021 Scipp contributors (https://github.com/scipp)
+
+from enum import Enum
+
+
+class QueueFullPolicy(Enum):
+    """
+    What the StreamedDataBuffer does when the queue of data waiting to be
+    yielded is full: wait for space, drop the oldest queued data, or
+    merge the queued data with the new data
+    """
+    block = "block"
+    drop_oldest = "drop_oldest"
+    merge = "merge"
@@ -0,0 +1,344 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2021 Scipp contributors (https://github.com/scipp)
+
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple, Union
+from warnings import warn
+import h5py
+import numpy as np
+import scipp as sc
+from streaming_data_types.eventdata_ev42 import serialise_ev42
+from streaming_data_types.logdata_f142 import serialise_f142
+from streaming_data_types.run_start_pl72 import serialise_pl72
+from ._loading_common import MissingDataset
+from ._loading_hdf5_nexus import LoadFromHdf5, _ensure_str
+from ._loading_json_nexus import _filewriter_to_supported_numpy_dtype
+from ._streaming_fake_broker import FakeBroker
+from .load_nexus import _find_groups, _open_if_path, nx_event_data, nx_log
+"""
+Replays the event data and logs of a NeXus file as streamed messages,
+as they would have been published during the run: a run start (pl72)
+message with the structure of the file, an event (ev42) message per
+pulse of each NXevent_data group and a log (f142) message per value of
+each NXlog group. Together with a FakeBroker this gives a repeatable
+setup for throughput and latency benchmarks of data_stream.
+"""
+
+
+def _start_offset_ns(dataset: h5py.Dataset) -> int:
+    """
+    Times in NeXus files may be relative to an ISO8601 date and time,
+    given by a "start" or "offset" attribute
+    """
+    for attribute_name in ("start", "offset"):
+        try:
+            start = _ensure_str(dataset.attrs[attribute_name])
+        except KeyError:
+            continue
+        try:
+            return int(
+                np.datetime64(start.replace("Z", ""), "ns").astype(np.int64))
+        except ValueError:
+            warn(f"Unable to parse {attribute_name} attribute '{start}' of "
+                 f"{dataset.name}, the times are replayed without it")
+    return 0
+
+
+def _load_times_ns(group: h5py.Group,
+                   dataset_name: str,
+                   nexus: LoadFromHdf5,
+                   absolute: bool = True) -> np.ndarray:
+    times = nexus.load_dataset(group, dataset_name, ["time"])
+    if times.unit == sc.units.ns:
+        values = times.values.astype(np.int64)
+    else:
+        times = sc.Variable(["time"],
+                            values=times.values.astype(np.float64),
+                            unit=times.unit)
+        values = np.round(sc.to_unit(times,
+                                     sc.units.ns).values).astype(np.int64)
+    if absolute:
+        values += _start_offset_ns(group[dataset_name])
+    return values
+
+
+def _load_event_messages(
+        group: h5py.Group,
+        nexus: LoadFromHdf5) -> Tuple[List[Tuple[int, bytes]], int]:
+    """
+    An ev42 message per pulse, with its pulse time,
+    and the number of events in the group
+    """
+    source_name = nexus.get_name(group)
+    event_id = nexus.load_dataset_from_group_as_numpy_array(group, "event_id")
+    event_time_offset = _load_times_ns(group,
+                                       "event_time_offset",
+                                       nexus,
+                                       absolute=False)
+    event_time_zero = _load_times_ns(group, "event_time_zero", nexus)
+    event_index = nexus.load_dataset_from_group_as_numpy_array(
+        group, "event_index").astype(np.int64)
+    # As when loading, the last index may not be the end of the last pulse
+    pulse_end = np.minimum(np.append(event_index[1:], event_id.size),
+                           event_id.size)
+    messages = []
+    for message_id, (pulse_time, begin, end) in enumerate(
+            zip(event_time_zero, event_index, pulse_end)):
+        messages.append(
+            (int(pulse_time),
+             serialise_ev42(source_name, message_id, int(pulse_time),
+                            event_time_offset[begin:end],
+                            event_id[begin:end])))
+    return messages, int(event_id.size)
+
+
+def _load_log_messages(group: h5py.Group,
+                       nexus: LoadFromHdf5) -> List[Tuple[int, bytes]]:
+    """
+    An f142 message per value of the log, with its time
+    """
+    source_name = nexus.get_name(group)
+    values = nexus.load_dataset_from_group_as_numpy_array(group, "value")
+    times = _load_times_ns(group, "time", nexus)
+    if values.ndim not in (1, 2) or values.shape[0] != times.size:
+        warn(f"Skipped replaying log {group.name} as its values are not "
+             f"a time series of scalars or 1D arrays")
+        return []
+    return [(int(log_time), serialise_f142(value, source_name, int(log_time)))
+            for log_time, value in zip(times, values)]
+
+
+def _attribute_to_json(name: str, value: Any) -> Dict:
+    if isinstance(value, (str, bytes)):
+        return {"name": name, "type": "string", "values": _ensure_str(value)}
+    value = np.asarray(value)
+    if value.dtype.kind in ("S", "O", "U"):
+        strings = [_ensure_str(item) for item in value.ravel()]
+        return {
+            "name": name,
+            "type": "string",
+            "values": strings[0] if value.ndim == 0 else strings
+        }
+    return {"name": name, "type": value.dtype.name, "values": value.tolist()}
+
+
+def _dataset_to_json(name: str, dataset: h5py.Dataset) -> Optional[Dict]:
+    values = dataset[...]
+    if values.dtype.kind in ("S", "O", "U"):
+        strings = [_ensure_str(item) for item in values.ravel()]
+        dataset_info = {"type": "string"}
+        values = strings[0] if values.ndim == 0 else strings
+    elif values.dtype.name in _filewriter_to_supported_numpy_dtype:
+        dataset_info = {"type": values.dtype.name, "size": list(values.shape)}
+        values = values.tolist()
+    else:
+        # Not supported by the json loader, for example boolean datasets
+        return None
+    return {
+        "type":
+        "dataset",
+        "name":
+        name,
+        "dataset":
+        dataset_info,
+        "values":
+        values,
+        "attributes": [
+            _attribute_to_json(attr_name, value)
+            for attr_name, value in dataset.attrs.items()
+        ]
+    }
+
+
+def _group_to_json(name: str, group: h5py.Group, streams: Dict[str,
+                                                               Dict]) -> Dict:
+    """
+    Groups which are streamed contain only a stream object, in place of
+    the datasets which would be written from the stream
+    """
+    json_group = {
+        "type":
+        "group",
+        "name":
+        name,
+        "children": [],
+        "attributes": [
+            _attribute_to_json(attr_name, value)
+            for attr_name, value in group.attrs.items()
+        ]
+    }
+    if group.name in streams:
+        json_group["children"].append({
+            "type": "stream",
+            "stream": streams[group.name]
+        })
+        return json_group
+    for child_name in group:
+        link = group.get(child_name, getlink=True)
+        if isinstance(link, h5py.SoftLink):
+            json_group["children"].append({
+                "type": "link",
+                "name": child_name,
+                "target": link.path
+            })
+            continue
+        if isinstance(link, h5py.ExternalLink):
+            continue
+        child = group[child_name]
+        if isinstance(child, h5py.Group):
+            json_group["children"].append(
+                _group_to_json(child_name, child, streams))
+        else:
+            json_dataset = _dataset_to_json(child_name, child)
+            if json_dataset is not None:
+                json_group["children"].append(json_dataset)
+    return json_group
+
+
+def _log_stream(group: h5py.Group, topic: str) -> Dict:
+    stream = {
+        "topic": topic,
+        "source": LoadFromHdf5.get_name(group),
+        "writer_module": "f142"
+    }
+    try:
+        value = group["value"]
+        stream["type"] = value.dtype.name
+        stream["value_units"] = _ensure_str(value.attrs["units"])
+    except KeyError:
+        pass
+    return stream
+
+
+class NexusReplay:
+    """
+    Streamed messages of the run recorded in a NeXus file, serialised
+    when the file is loaded so that serialisation does not limit the
+    rate at which they can be replayed.
+    Pulse and log times are kept as they are in the file, the broker
+    timestamps of the messages are those times in milliseconds.
+
+    :param nexus_file: Path of NeXus file, or an open h5py.File
+    :param event_topic: Topic for the event (ev42) messages
+    :param log_topic: Topic for the log (f142) messages
+    :param run_info_topic: Topic for the run start (pl72) message
+    :param n_event_partitions: The event messages are distributed over
+      this many partitions of the event topic, in turn
+    :param root: Path of group in file, only replay data from the
+      subtree of this group
+    """
+    def __init__(self,
+                 nexus_file: Union[str, h5py.File],
+                 event_topic: str = "events",
+                 log_topic: str = "logs",
+                 run_info_topic: str = "run_info",
+                 n_event_partitions: int = 1,
+                 root: Optional[str] = None):
+        self.event_topic = event_topic
+        self.log_topic = log_topic
+        self.run_info_topic = run_info_topic
+        self.n_event_partitions = n_event_partitions
+        self.n_events = 0
+        # (time in ns, topic, partition, payload), in time order
+        self.messages: List[Tuple[int, str, int, bytes]] = []
+
+        nexus = LoadFromHdf5()
+        with _open_if_path(nexus_file) as opened_file:
+            groups = _find_groups(opened_file, root, nexus,
+                                  (nx_event_data, nx_log))
+            streams = {}
+            for group in groups[nx_event_data]:
+                try:
+                    event_messages, n_events = _load_event_messages(
+                        group.group, nexus)
+                except MissingDataset:
+                    warn(f"Skipped replaying {group.path} as it is "
+                         f"missing event datasets")
+                    continue
+                self.n_events += n_events
+                self.messages.extend((pulse_time, event_topic, 0, payload)
+                                     for pulse_time, payload in event_messages)
+                streams[group.group.name] = {
+                    "topic": event_topic,
+                    "source": nexus.get_name(group.group),
+                    "writer_module": "ev42"
+                }
+            for group in groups[nx_log]:
+                try:
+                    log_messages = _load_log_messages(group.group, nexus)
+                except MissingDataset:
+                    # Not a time series, written to the structure as it is
+                    continue
+                if not log_messages:
+                    continue
+                self.messages.extend((log_time, log_topic, 0, payload)
+                                     for log_time, payload in log_messages)
+                streams[group.group.name] = _log_stream(group.group, log_topic)
+            root_group = opened_file if root is None else opened_file[root]
+            structure = _group_to_json("", root_group, streams)
+            self.nexus_structure = json.dumps(
+                {"children": structure["children"]})
+            filename = opened_file.filename
+
+        self.messages.sort(key=lambda message: message[0])
+        # Distribute the event messages over the partitions in turn
+        event_count = 0
+        for index, (message_time, topic, _,
+                    payload) in enumerate(self.messages):
+            if topic == event_topic:
+                self.messages[index] = (message_time, topic,
+                                        event_count % n_event_partitions,
+                                        payload)
+                event_count += 1
+        self.start_time = self.messages[0][0] if self.messages else 0
+        self.run_start = serialise_pl72("",
+                                        filename,
+                                        start_time=self.start_time //
+                                        1_000_000,
+                                        nexus_structure=self.nexus_structure)
+
+    def produce_run_start(self, broker: FakeBroker):
+        """
+        Create the topics, if they do not already exist,
+        and produce the run start message
+        """
+        for topic, n_partitions in ((self.event_topic,
+                                     self.n_event_partitions),
+                                    (self.log_topic, 1), (self.run_info_topic,
+                                                          1)):
+            if topic not in broker.topics:
+                broker.create_topic(topic, n_partitions)
+        broker.produce(self.run_info_topic,
+                       self.run_start,
+                       timestamp_ms=self.start_time // 1_000_000)
+
+    def replay(self,
+               broker: FakeBroker,
+               speed: Optional[float] = 1.,
+               start_time: Optional[float] = None):
+        """
+        Produce the messages, this blocks until all have been produced.
+
+        :param broker: Broker to produce the messages to
+        :param speed: Messages are produced at this multiple of the rate
+          at which they were recorded, if None they are produced as
+          quickly as possible
+        :param start_time: Wall clock time (time.time()) at which the
+          first message is produced, now by default. The time at which
+          each message is due is then start_time plus its time since
+          the first message divided by speed, for latency measurements.
+        """
+        if start_time is None:
+            start_time = time.time()
+        for message_time, topic, partition, payload in self.messages:
+            if speed is not None:
+                due_time = start_time + (message_time -
+                                         self.start_time) * 1e-9 / speed
+                wait_time = due_time - time.time()
+                if wait_time > 0.:
+                    time.sleep(wait_time)
+            broker.produce(topic,
+                           payload,
+                           partition,
+                           timestamp_ms=message_time // 1_000_000)
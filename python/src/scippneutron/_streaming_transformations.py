@@ -0,0 +1,273 @@
+# SPDX-License-Identifier: BSD-3-Clause
+# Copyright (c) 2021 Scipp contributors (https://github.com/scipp)
+
+import threading
+import warnings
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Union
+import numpy as np
+import scipp as sc
+from ._loading_common import MissingDataset
+from ._loading_json_nexus import LoadFromJson
+from ._loading_nexus import GroupObject, ScippData
+from ._loading_transformations import (TransformationCache,
+                                       TransformationError,
+                                       StreamedTransformation,
+                                       _get_transformations)
+from .load_nexus import _find_groups, nx_detector, nx_sample, nx_source
+
+
+@dataclass
+class _LiveComponent:
+    """
+    A component with streamed transformations in its depends_on chain.
+    local_positions are the positions in the frame of the first streamed
+    transformation in the chain, the factors are the 4x4 matrices and
+    streamed transformations which are applied to them, in order.
+    For detectors the detector_ids are the ids of the pixels,
+    in the order of local_positions.
+    """
+    name: str
+    local_positions: np.ndarray
+    factors: List[Union[np.ndarray, StreamedTransformation]]
+    detector_ids: Optional[np.ndarray] = None
+
+    @property
+    def source_names(self) -> Set[str]:
+        return {
+            factor.source_name
+            for factor in self.factors
+            if isinstance(factor, StreamedTransformation)
+        }
+
+    def positions(self, values: Dict[str, float]) -> np.ndarray:
+        matrix = np.identity(4)
+        for factor in self.factors:
+            if isinstance(factor, StreamedTransformation):
+                if factor.source_name not in values:
+                    # Treated as 0-distance translation, as when loading
+                    continue
+                factor = factor.matrix(values[factor.source_name])
+            matrix = factor @ matrix
+        return self.local_positions @ matrix[:3, :3].T + matrix[:3, 3]
+
+
+class LivePositions:
+    """
+    Positions of the components which depend on streamed transformations,
+    updated from the latest streamed values. Setting a value is cheap,
+    positions are only recomputed when the updated positions are taken,
+    and then only those of components which depend on a transformation
+    with a new value. The part of each depends_on chain before the first
+    streamed transformation is applied once, on construction.
+    """
+    def __init__(self, components: List[_LiveComponent]):
+        self._components = components
+        self.source_names: Set[str] = set().union(
+            *(component.source_names for component in components))
+        self._values: Dict[str, float] = {}
+        self._updated_sources: Set[str] = set()
+        self._value_mutex = threading.Lock()
+
+    def copy(self) -> "LivePositions":
+        """
+        Copy without any streamed values, components are shared as they
+        are not modified
+        """
+        return LivePositions(self._components)
+
+    def set_value(self, source_name: str, value: float):
+        with self._value_mutex:
+            self._values[source_name] = value
+            self._updated_sources.add(source_name)
+
+    def take_updated(self) -> Dict[str, sc.Variable]:
+        """
+        Positions which have changed since the last take, with the names
+        used for them by load_nexus. Detector pixel positions are a
+        DataArray with a detector_id coord, wrapped in a Variable, which
+        only holds the pixels of the detectors which have moved.
+        """
+        with self._value_mutex:
+            if not self._updated_sources:
+                return {}
+            values = dict(self._values)
+            updated_sources = self._updated_sources
+            self._updated_sources = set()
+
+        updated_positions = {}
+        detector_positions = []
+        detector_ids = []
+        for component in self._components:
+            if not component.source_names & updated_sources:
+                continue
+            positions = component.positions(values)
+            if component.detector_ids is None:
+                updated_positions[component.name] = sc.Variable(
+                    value=positions[0],
+                    dtype=sc.dtype.vector_3_float64,
+                    unit=sc.units.m)
+            else:
+                detector_positions.append(positions)
+                detector_ids.append(component.detector_ids)
+        if detector_positions:
+            updated_positions["position"] = sc.Variable(
+                value=_detector_positions(np.concatenate(detector_ids),
+                                          np.concatenate(detector_positions)))
+        return updated_positions
+
+
+def _detector_positions(detector_ids: np.ndarray,
+                        positions: np.ndarray) -> sc.DataArray:
+    return sc.DataArray(data=sc.Variable(['detector_id'],
+                                         values=positions,
+                                         dtype=sc.dtype.vector_3_float64,
+                                         unit=sc.units.m),
+                        coords={
+                            'detector_id':
+                            sc.Variable(['detector_id'], values=detector_ids)
+                        })
+
+
+def merge_position_updates(earlier: sc.DataArray,
+                           later: sc.DataArray) -> sc.DataArray:
+    """
+    Combine two updates of detector pixel positions, where a pixel is in
+    both the position from the later update is kept
+    """
+    earlier_ids = earlier.coords['detector_id'].values
+    later_ids = later.coords['detector_id'].values
+    kept = ~np.isin(earlier_ids, later_ids)
+    return _detector_positions(
+        np.concatenate((earlier_ids[kept], later_ids)),
+        np.concatenate((np.asarray(earlier.values).reshape(-1, 3)[kept],
+                        np.asarray(later.values).reshape(-1, 3))))
+
+
+def _loaded_position(loaded_data: ScippData,
+                     name: str) -> Optional[np.ndarray]:
+    try:
+        container = loaded_data.attrs
+    except AttributeError:
+        container = loaded_data
+    try:
+        position = container[name]
+        if not position.dims and isinstance(position.value, sc.DataArray):
+            # Time-dependent positions are a time series, like an NXlog,
+            # the last value is the latest position
+            position = position.value.data["time", -1]
+        return np.asarray(position.values, dtype=np.float64).reshape(-1, 3)
+    except (KeyError, IndexError):
+        return None
+
+
+def _live_component(name: str, group: GroupObject, positions: np.ndarray,
+                    root: Dict, cache: TransformationCache,
+                    nexus: LoadFromJson) -> Optional[_LiveComponent]:
+    try:
+        depends_on = nexus.load_scalar_string(group, "depends_on")
+    except MissingDataset:
+        return None
+    try:
+        # Warnings were already given when the structure was loaded
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            _get_transformations(depends_on, cache, root,
+                                 nexus.get_name(group), nexus)
+    except TransformationError:
+        return None
+
+    chain = []
+    while depends_on != '.':
+        chain.append(depends_on)
+        depends_on = cache.depends_on[depends_on]
+    streamed_indices = [
+        index for index, path in enumerate(chain) if path in cache.streamed
+    ]
+    if not streamed_indices:
+        return None
+    if any(cache.times[path] is not None for path in chain):
+        warnings.warn(f"Positions of {name} are not updated from streamed "
+                      f"transformations as its transformations also "
+                      f"include multi-valued NXlogs")
+        return None
+
+    factors = []
+    fixed_product = np.identity(4)
+    for path in chain[streamed_indices[0]:]:
+        if path in cache.streamed:
+            factors.append(cache.streamed[path])
+        else:
+            matrix = cache.matrices[path]
+            fixed_product = matrix @ fixed_product
+            if factors and isinstance(factors[-1], np.ndarray):
+                factors[-1] = matrix @ factors[-1]
+            else:
+                factors.append(matrix)
+    # Loaded positions have the streamed transformations as identities,
+    # so undo the rest of the chain to get the local positions
+    inverse = np.linalg.inv(fixed_product)
+    local_positions = positions @ inverse[:3, :3].T + inverse[:3, 3]
+    return _LiveComponent(name, local_positions, factors)
+
+
+def load_live_positions(root: Dict, loaded_data: Optional[ScippData],
+                        cache: TransformationCache) -> Optional[LivePositions]:
+    """
+    Find the components in the parsed structure of a run start message
+    whose positions depend on streamed transformations. The positions of
+    these components in loaded_data, loaded from the same structure, are
+    the starting point for the live positions. The cache holds the
+    transformations resolved when loaded_data were loaded, including
+    the streamed ones.
+    Returns None if no positions depend on streamed transformations.
+    """
+    if loaded_data is None:
+        return None
+    nexus = LoadFromJson(root)
+    groups = _find_groups(root, None, nexus,
+                          (nx_detector, nx_sample, nx_source))
+    components = []
+
+    if "position" in loaded_data.coords and \
+            "detector_id" in loaded_data.coords:
+        detector_positions = np.array(loaded_data.coords["position"].values,
+                                      dtype=np.float64).reshape(-1, 3)
+        detector_ids = np.asarray(loaded_data.coords["detector_id"].values)
+        sorter = np.argsort(detector_ids)
+        for group in groups[nx_detector]:
+            try:
+                bank_ids = nexus.load_dataset_from_group_as_numpy_array(
+                    group.group, "detector_number").ravel()
+            except MissingDataset:
+                continue
+            rows = sorter[np.minimum(
+                np.searchsorted(detector_ids, bank_ids, sorter=sorter),
+                sorter.size - 1)]
+            if not np.array_equal(detector_ids[rows], bank_ids):
+                continue
+            component = _live_component(nexus.get_name(group.group),
+                                        group.group, detector_positions[rows],
+                                        root, cache, nexus)
+            if component is not None:
+                component.detector_ids = bank_ids
+                components.append(component)
+
+    # Names of the positions are those given by load_nexus
+    position_names = [(group, "sample_position" if len(groups[nx_sample]) == 1
+                       else f"{nexus.get_name(group.group)}_position")
+                      for group in groups[nx_sample]]
+    if len(groups[nx_source]) == 1:
+        position_names.append((groups[nx_source][0], "source_position"))
+    for group, name in position_names:
+        position = _loaded_position(loaded_data, name)
+        if position is None:
+            continue
+        component = _live_component(name, group.group, position, root, cache,
+                                    nexus)
+        if component is not None:
+            components.append(component)
+
+    if not components:
+        return None
+    return LivePositions(components)
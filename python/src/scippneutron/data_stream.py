@@ -1,9 +1,15 @@
 import numpy as np
 import time
-from typing import List, Generator, Callable, Optional, Type
+from typing import List, Generator, Callable, Optional, Type, Tuple
 import asyncio
+import hashlib
+import json
+from collections import OrderedDict
 import scipp as sc
-from .load_nexus import _load_nexus_json
+from ._loading_json_nexus import decode_dataset_values
+from ._loading_transformations import TransformationCache
+from .load_nexus import _load_nexus_json_structure
+from ._streaming_queue_policy import QueueFullPolicy
 from enum import Enum
 """
 Some type names are included as strings as imports are done in
@@ -24,6 +30,49 @@ def _consumers_all_stopped(consumers: List["KafkaConsumer"]):  # noqa: F821
     return True
 
 
+# Data loaded from the nexus_structure of recent run start messages,
+# keyed by hash of the structure. The instrument geometry is usually
+# the same from one run to the next, so the structure does not need to
+# be parsed again when a stream is restarted for a new run.
+_run_start_cache: "OrderedDict[str, Tuple]" = OrderedDict()
+_run_start_cache_size = 4
+
+
+def _load_run_start_structure(
+    nexus_structure: str
+) -> Tuple[Optional[sc.DataArray], Optional[List[str]],
+           Optional["LivePositions"]]:  # noqa: F821
+    """
+    Returns the data loaded from the structure, the topics of its streams,
+    and the positions which depend on streamed transformations
+    """
+    from ._streaming_transformations import load_live_positions
+
+    structure_hash = hashlib.sha256(nexus_structure.encode()).hexdigest()
+    try:
+        loaded_data, topics, live_positions = _run_start_cache[structure_hash]
+        _run_start_cache.move_to_end(structure_hash)
+    except KeyError:
+        # The parsed structure and the transformations resolved while
+        # loading are reused to find the live positions
+        root = json.loads(nexus_structure, object_hook=decode_dataset_values)
+        transform_cache = TransformationCache()
+        loaded_data, topics = _load_nexus_json_structure(
+            root, get_start_info=True, transform_cache=transform_cache)
+        live_positions = load_live_positions(root, loaded_data,
+                                             transform_cache)
+        _run_start_cache[structure_hash] = (loaded_data, topics,
+                                            live_positions)
+        if len(_run_start_cache) > _run_start_cache_size:
+            _run_start_cache.popitem(last=False)
+    # Return copies so that the cached data are not modified by the user
+    if loaded_data is not None:
+        loaded_data = loaded_data.copy()
+    if live_positions is not None:
+        live_positions = live_positions.copy()
+    return loaded_data, list(topics), live_positions
+
+
 _missing_dependency_message = (
     "Confluent Kafka Python library and/or serialisation library"
     "not found, please install confluent-kafka and "
@@ -39,12 +88,25 @@ async def data_stream(
     interval: sc.Variable = 2. * sc.units.s,
     run_info_topic: Optional[str] = None,
     start_time: StartTime = StartTime.now,
+    threaded_consumers: bool = False,
+    process_consumers: bool = False,
+    tof_edges: Optional[sc.Variable] = None,
+    detector_ids: Optional[sc.Variable] = None,
+    cumulative: bool = True,
+    window: Optional[sc.Variable] = None,
+    decay_time: Optional[sc.Variable] = None,
+    log_buffer_size: int = 10000,
+    queue_size: int = 8,
+    queue_full_policy: QueueFullPolicy = QueueFullPolicy.block,
 ) -> Generator[sc.DataArray, None, None]:
     """
     Periodically yields accumulated data from stream.
     If the buffer fills up more frequently than the set interval
     then data is yielded more frequently.
-    1048576 event buffer is around 24 MB (with pulse_time, id, weights, etc)
+    Event data are yielded binned by pulse, with a pulse_time coord.
+    1048576 event buffer is around 24 MB (with tof, id, weights, etc),
+    there are two buffers so that one can be filled while the other is
+    emitted
     :param kafka_broker: Address of the Kafka broker to stream data from
     :param topics: Kafka topics to consume data from
     :param buffer_size: Size of buffer to accumulate data in
@@ -54,20 +116,96 @@ async def data_stream(
       data_stream will be from the last available run start message in
       the topic
     :param start_time: Get data from now or from start of the last run
+    :param threaded_consumers: If True each consumer runs in its own
+      thread and fetches messages in batches, this supports much higher
+      message rates than consuming on the asyncio event loop
+    :param process_consumers: If True each consumer runs in its own
+      process, which deserialises event messages into shared memory, so
+      that deserialisation uses as many cores as there are partitions.
+      Only assembling and yielding the data is done in this process.
+    :param tof_edges: If provided, events are accumulated into a
+      (detector_id, tof) histogram with these bin edges as they are
+      consumed, and the histogram is yielded instead of the events.
+      Memory use then does not depend on the event rate.
+    :param detector_ids: Detector ids of the histogram, required if
+      tof_edges are provided
+    :param cumulative: If True the histogram yielded contains all events
+      since the start of the stream, otherwise only the events since the
+      previous histogram was yielded
+    :param window: If provided, the histogram yielded contains only the
+      events with a pulse time in this window before the latest pulse
+      time. The window advances in steps of a tenth of its length.
+    :param decay_time: If provided, events in the histogram yielded are
+      weighted by exp(-age / decay_time), where age is the pulse time
+      of the event before the latest pulse time
+    :param log_buffer_size: Number of values of each log (f142) source
+      to buffer between yields. Logs are yielded as time-series attrs
+      of the event data.
+      If run_info_topic is provided then positions of components which
+      depend on streamed transformations are updated from their log
+      values and yielded as attrs when they change, with the names used
+      in the data loaded from the run start message.
+    :param queue_size: Maximum number of data chunks waiting to be
+      yielded, if the caller falls behind. Use 0 for no limit.
+    :param queue_full_policy: What to do when data are emitted and the
+      queue is full. With block, consuming waits until there is space.
+      With drop_oldest, the oldest chunk waiting to be yielded is
+      dropped. With merge, all chunks waiting to be yielded are merged
+      with the new one. The numbers of events dropped and merged so far
+      are given by dropped_events and merged_events attrs of the data,
+      once any have been dropped or merged.
     """
     try:
         from ._streaming_data_buffer import StreamedDataBuffer
+        from ._streaming_histogram import (LiveHistogram,
+                                           RollingWindowHistogram,
+                                           DecayedHistogram)
     except ImportError:
         raise ImportError(_missing_dependency_message)
 
-    queue = asyncio.Queue()
-    buffer = StreamedDataBuffer(queue, buffer_size, interval)
+    if threaded_consumers and process_consumers:
+        raise ValueError("Only one of 'threaded_consumers' and "
+                         "'process_consumers' can be True")
+
+    histogram = None
+    if tof_edges is not None:
+        if detector_ids is None:
+            raise ValueError("'detector_ids' must be specified to "
+                             "histogram the streamed events")
+        if window is not None and decay_time is not None:
+            raise ValueError("Only one of 'window' and 'decay_time' can be "
+                             "specified")
+        if not cumulative and (window is not None or decay_time is not None):
+            raise ValueError("'window' and 'decay_time' apply only to "
+                             "cumulative histograms")
+        if window is not None:
+            histogram = RollingWindowHistogram(detector_ids, tof_edges, window)
+        elif decay_time is not None:
+            histogram = DecayedHistogram(detector_ids, tof_edges, decay_time)
+        else:
+            histogram = LiveHistogram(detector_ids, tof_edges, cumulative)
+
+    queue = asyncio.Queue(maxsize=queue_size)
+    buffer = StreamedDataBuffer(queue, buffer_size, interval, histogram,
+                                log_buffer_size, queue_full_policy)
 
     # Use "async for" as "yield from" cannot be used in an async function, see
     # https://www.python.org/dev/peps/pep-0525/#asynchronous-yield-from
-    async for data_chunk in _data_stream(buffer, queue, kafka_broker, topics,
-                                         interval, run_info_topic, start_time):
-        yield data_chunk
+    stream = _data_stream(buffer,
+                          queue,
+                          kafka_broker,
+                          topics,
+                          interval,
+                          run_info_topic,
+                          start_time,
+                          threaded_consumers=threaded_consumers,
+                          process_consumers=process_consumers)
+    try:
+        async for data_chunk in stream:
+            yield data_chunk
+    finally:
+        # If the caller stops iterating, the consumers must still be stopped
+        await stream.aclose()
 
 
 async def _data_stream(
@@ -80,16 +218,21 @@ async def _data_stream(
     start_at: StartTime = StartTime.now,
     query_consumer: Optional["KafkaQueryConsumer"] = None,  # noqa: F821
     consumer_type: Optional[Type["KafkaConsumer"]] = None,  # noqa: F821
-    max_iterations: int = np.iinfo(np.int32).max  # for testability
+    max_iterations: int = np.iinfo(np.int32).max,  # for testability
+    threaded_consumers: bool = False,
+    process_consumers: bool = False,
 ) -> Generator[sc.DataArray, None, None]:
     """
     Main implementation of data stream is extracted to this function so that
     fake consumers can be injected for unit tests
     """
     try:
-        from ._streaming_consumer import (start_consumers, create_consumers,
+        from ._streaming_consumer import (start_consumers, stop_consumers,
+                                          create_consumers,
                                           get_run_start_message,
-                                          KafkaQueryConsumer, KafkaConsumer)
+                                          KafkaQueryConsumer, KafkaConsumer,
+                                          KafkaThreadedConsumer)
+        from ._streaming_process_consumer import KafkaProcessConsumer
     except ImportError:
         raise ImportError(_missing_dependency_message)
 
@@ -102,16 +245,29 @@ async def _data_stream(
     if query_consumer is None:
         query_consumer = KafkaQueryConsumer(kafka_broker)
     if consumer_type is None:
-        consumer_type = KafkaConsumer
+        if process_consumers:
+            consumer_type = KafkaProcessConsumer
+        elif threaded_consumers:
+            consumer_type = KafkaThreadedConsumer
+        else:
+            consumer_type = KafkaConsumer
+    # Threaded consumers pass batches of messages from their own thread,
+    # process consumers also pass batches of deserialised events
+    if process_consumers:
+        callback = buffer.new_event_batch
+    elif threaded_consumers:
+        callback = buffer.new_data_batch
+    else:
+        callback = buffer.new_data
 
     if run_info_topic is not None:
         run_start_info = get_run_start_message(run_info_topic, query_consumer)
+        loaded_data, run_start_topics, live_positions = \
+            _load_run_start_structure(run_start_info.nexus_structure)
+        # Positions are updated from streamed transformation values
+        buffer.set_live_positions(live_positions)
         if topics is None:
-            loaded_data, topics = _load_nexus_json(
-                run_start_info.nexus_structure, get_start_info=True)
-        else:
-            loaded_data, _ = _load_nexus_json(run_start_info.nexus_structure,
-                                              get_start_info=False)
+            topics = run_start_topics
         yield loaded_data
 
     if start_at == StartTime.start_of_run:
@@ -124,29 +280,35 @@ async def _data_stream(
                                  kafka_broker,
                                  query_consumer,
                                  consumer_type,
-                                 buffer.new_data,
+                                 callback,
                                  stop_at_end_of_partition=False)
 
-    start_consumers(consumers)
+    # The buffer must be started first, consumer threads may fill it
+    # and emit data as soon as they are started
     buffer.start()
+    try:
+        start_consumers(consumers)
 
-    # If we wait twice the expected interval and have not got
-    # any new data in the queue then check if it is because all
-    # the consumers have stopped, if so, we are done. Otherwise
-    # it could just be that we have not received any new data.
-    iterations = 0
-    while not _consumers_all_stopped(
-            consumers) and iterations < max_iterations:
-        try:
-            new_data = await asyncio.wait_for(queue.get(),
-                                              timeout=2 *
-                                              sc.to_unit(interval, 's').value)
-            iterations += 1
-            yield new_data
-        except asyncio.TimeoutError:
-            pass
-
-    buffer.stop()
+        # If we wait twice the expected interval and have not got
+        # any new data in the queue then check if it is because all
+        # the consumers have stopped, if so, we are done. Otherwise
+        # it could just be that we have not received any new data.
+        iterations = 0
+        while not _consumers_all_stopped(
+                consumers) and iterations < max_iterations:
+            try:
+                new_data = await asyncio.wait_for(
+                    queue.get(), timeout=2 * sc.to_unit(interval, 's').value)
+                iterations += 1
+                yield new_data
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        # Also when the generator is closed early or cancelled. The buffer
+        # is stopped first so that consumer threads waiting for space on
+        # the queue give up, then they can be joined.
+        buffer.stop()
+        stop_consumers(consumers)
 
 
 def start_stream(user_function: Callable) -> asyncio.Task:
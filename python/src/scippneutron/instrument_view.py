@@ -3,6 +3,7 @@
 # @author Neil Vaytet
 
 import numpy as np
+from ._loading_pixel_shape import pixel_size as _pixel_size_from_shape
 
 
 def instrument_view(scipp_obj=None,
@@ -17,14 +18,18 @@ def instrument_view(scipp_obj=None,
     Spatial slicing and pixel opacity control is available using the controls
     below the scene.
     Use the `pixel_size` argument to specify the size of the detectors.
-    If no `pixel_size` is given, a guess is performed based on the distance
-    between the positions of the first two pixel positions.
+    If no `pixel_size` is given, it is taken from the `pixel_shape`
+    attribute loaded from NeXus files if present, otherwise a guess is
+    performed based on the distance between the first two pixel positions.
     The aspect ratio of the positions is preserved by default, but this can
     be changed to automatic scaling using `aspect="equal"`.
     """
 
     from scipp.plotting import plot
 
+    if pixel_size is None and "pixel_shape" in scipp_obj.meta:
+        pixel_size = _pixel_size_from_shape(
+            scipp_obj.meta["pixel_shape"].value)
     if pixel_size is None:
         pos_array = scipp_obj.meta[positions].values
         if len(pos_array) > 1:
@@ -5,19 +5,27 @@ import json
 
 import scipp as sc
 from ._loading_common import Group, MissingDataset
-from ._loading_detector_data import load_detector_data
+from ._loading_detector_data import load_detector_data_in_stages
 from ._loading_log_data import load_logs
+from ._loading_monitor_data import load_monitor_data, split_monitor_event_data
 from ._loading_hdf5_nexus import LoadFromHdf5
-from ._loading_json_nexus import LoadFromJson, get_topics_from_streams
+from ._loading_json_nexus import (LoadFromJson, get_topics_from_streams,
+                                  decode_dataset_values)
 from ._loading_nexus import LoadFromNexus, GroupObject, ScippData
 import h5py
 from timeit import default_timer as timer
-from typing import Union, List, Optional, Dict, Tuple
+from typing import Union, List, Optional, Dict, Tuple, Iterator, Callable
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 from warnings import warn
 import numpy as np
 from ._loading_positions import (load_position_of_unique_component,
                                  load_positions_of_components)
+from ._loading_transformations import (TransformationCache,
+                                       TransformationError,
+                                       get_full_transformation,
+                                       transformation_as_dataset)
 
 nx_event_data = "NXevent_data"
 nx_log = "NXlog"
@@ -26,21 +34,137 @@ nx_instrument = "NXinstrument"
 nx_sample = "NXsample"
 nx_source = "NXsource"
 nx_detector = "NXdetector"
+nx_monitor = "NXmonitor"
+
+_mebibyte = 1024**2
+
+# Keyword arguments for h5py.File for each I/O profile
+_io_profiles = {
+    # HDF5 default chunk cache (1 MiB, 521 slots)
+    "default": {
+        "libver": "latest",
+        "swmr": True
+    },
+    # Chunk cache big enough to hold many chunks of large datasets
+    "large_cache": {
+        "libver": "latest",
+        "swmr": True,
+        "rdcc_nbytes": 64 * _mebibyte,
+        "rdcc_nslots": 100_003
+    },
+    # Large chunk cache and a page buffer, to make fewer and larger reads,
+    # this suits parallel filesystems. Page buffering requires files
+    # written with the paged file space strategy.
+    "paged": {
+        "libver": "latest",
+        "swmr": True,
+        "rdcc_nbytes": 64 * _mebibyte,
+        "rdcc_nslots": 100_003,
+        "page_buf_size": 16 * _mebibyte
+    },
+    # Read the whole file into memory when it is opened
+    "in_memory": {
+        "driver": "core",
+        "backing_store": False
+    },
+}
 
 
 @contextmanager
-def _open_if_path(file_in: Union[str, h5py.File]):
+def _open_if_path(file_in: Union[str, h5py.File], io_profile: str = "default"):
     """
     Open if file path is provided,
     otherwise yield the existing h5py.File object
     """
+    _check_io_profile(io_profile)
     if isinstance(file_in, str):
-        with h5py.File(file_in, "r", libver='latest', swmr=True) as nexus_file:
+        with _open_nexus_file(file_in, io_profile) as nexus_file:
             yield nexus_file
     else:
         yield file_in
 
 
+def _check_io_profile(io_profile: str):
+    if io_profile != "auto" and io_profile not in _io_profiles:
+        raise ValueError(f"Unrecognised value '{io_profile}' for 'io_profile' "
+                         f"argument, expected 'auto' or one of "
+                         f"{list(_io_profiles.keys())}")
+
+
+def _open_nexus_file(file_path: str, io_profile: str = "default") -> h5py.File:
+    if io_profile == "auto":
+        options = _auto_tuned_io_options(file_path)
+    else:
+        options = _io_profiles[io_profile]
+    try:
+        return h5py.File(file_path, "r", **options)
+    except OSError as error:
+        if "page_buf_size" not in options:
+            raise
+        page_buffer_error = error
+    # Page buffering fails for files which were not written with the paged
+    # file space strategy, the file is then opened without it. Any other
+    # error, for example if the file does not exist, is passed on.
+    options = {
+        key: value
+        for key, value in options.items() if key != "page_buf_size"
+    }
+    try:
+        nexus_file = h5py.File(file_path, "r", **options)
+    except OSError:
+        raise page_buffer_error from None
+    if _is_paged(nexus_file):
+        nexus_file.close()
+        raise page_buffer_error
+    warn(f"Unable to use page buffering for {file_path}, it was not "
+         f"written with the paged file space strategy")
+    return nexus_file
+
+
+def _is_paged(nexus_file: h5py.File) -> bool:
+    strategy, *_ = nexus_file.id.get_create_plist().get_file_space_strategy()
+    return strategy == h5py.h5f.FSPACE_STRATEGY_PAGE
+
+
+def _auto_tuned_io_options(file_path: str) -> Dict:
+    """
+    Size the chunk cache from the chunk layout of the datasets in the file
+    """
+    chunk_sizes = []
+
+    def _add_chunk_size(_, node):
+        if isinstance(node, h5py.Dataset) and node.chunks is not None:
+            chunk_sizes.append(int(np.prod(node.chunks)) * node.dtype.itemsize)
+
+    with h5py.File(file_path, "r", **_io_profiles["default"]) as nexus_file:
+        nexus_file.visititems(_add_chunk_size)
+    if not chunk_sizes:
+        return _io_profiles["default"]
+
+    # Enough space to hold several of the largest chunks
+    largest_chunk = max(chunk_sizes)
+    rdcc_nbytes = int(np.clip(8 * largest_chunk, _mebibyte, 256 * _mebibyte))
+    # HDF5 recommends a prime number of slots, around 100 times the
+    # number of chunks which fit in the cache
+    typical_chunk = int(np.median(chunk_sizes))
+    rdcc_nslots = _next_prime(
+        min(100 * max(rdcc_nbytes // typical_chunk, 1), 1_000_000))
+    return {
+        **_io_profiles["default"], "rdcc_nbytes": rdcc_nbytes,
+        "rdcc_nslots": rdcc_nslots
+    }
+
+
+def _next_prime(number: int) -> int:
+    def _is_prime(candidate: int) -> bool:
+        divisors = range(2, int(candidate**0.5) + 1)
+        return all(candidate % divisor for divisor in divisors)
+
+    while not _is_prime(number):
+        number += 1
+    return number
+
+
 def _add_string_attr_to_loaded_data(group: GroupObject, dataset_name: str,
                                     attr_name: str, data: ScippData,
                                     nexus: LoadFromNexus):
@@ -66,20 +190,28 @@ def _load_instrument_name(instrument_groups: List[Group], data: ScippData,
 
 
 def _load_sample(sample_groups: List[Group], data: ScippData,
-                 file_root: h5py.File, nexus: LoadFromNexus):
+                 file_root: h5py.File, nexus: LoadFromNexus,
+                 transform_cache: TransformationCache):
     load_positions_of_components(sample_groups,
                                  data,
                                  "sample",
                                  nx_sample,
                                  file_root,
                                  nexus,
-                                 default_position=np.array([0, 0, 0]))
+                                 default_position=np.array([0, 0, 0]),
+                                 transform_cache=transform_cache)
 
 
 def _load_source(source_groups: List[Group], data: ScippData,
-                 file_root: h5py.File, nexus: LoadFromNexus):
-    load_position_of_unique_component(source_groups, data, "source", nx_source,
-                                      file_root, nexus)
+                 file_root: h5py.File, nexus: LoadFromNexus,
+                 transform_cache: TransformationCache):
+    load_position_of_unique_component(source_groups,
+                                      data,
+                                      "source",
+                                      nx_source,
+                                      file_root,
+                                      nexus,
+                                      transform_cache=transform_cache)
 
 
 def _load_title(entry_group: Group, data: ScippData, nexus: LoadFromNexus):
@@ -87,9 +219,14 @@ def _load_title(entry_group: Group, data: ScippData, nexus: LoadFromNexus):
                                     "experiment_title", data, nexus)
 
 
-def load_nexus(data_file: Union[str, h5py.File],
-               root: str = "/",
-               quiet=True) -> Optional[ScippData]:
+def load_nexus(
+    data_file: Union[str, h5py.File],
+    root: str = "/",
+    quiet=True,
+    entries: Optional[str] = None,
+    io_profile: str = "default",
+    dense_positions: bool = True
+) -> Union[Optional[ScippData], Dict[str, Optional[ScippData]]]:
     """
     Load a NeXus file and return required information.
 
@@ -97,29 +234,115 @@ def load_nexus(data_file: Union[str, h5py.File],
     :param root: path of group in file, only load data from the subtree of
       this group
     :param quiet: if False prints some details of what is being loaded
+    :param entries: if "all" then data are loaded from every NXentry
+      in the subtree of root and returned in a dictionary with the
+      entry name as the key, otherwise there must be at most one NXentry
+    :param io_profile: HDF5 settings used to open the file if a path is
+      given: "default", "large_cache" (64 MiB chunk cache), "paged"
+      (large chunk cache and a page buffer, for parallel filesystems),
+      "in_memory" (read the whole file into memory) or "auto" (chunk cache
+      sized from the chunk layout of the datasets in the file)
+    :param dense_positions: if False, and the pixels of every detector
+      are on a regular grid, the pixel positions are given only by the
+      compact "pixel_grids" attribute rather than a "position" coord,
+      use positions_from_pixel_grids to compute them when needed
 
     Usage example:
       data = sc.neutron.load_nexus('PG3_4844_event.nxs')
     """
     total_time = timer()
 
-    with _open_if_path(data_file) as nexus_file:
-        loaded_data = _load_data(nexus_file, root, LoadFromHdf5(), quiet)
+    with _open_if_path(data_file, io_profile) as nexus_file:
+        if entries is None:
+            loaded_data = _load_data(nexus_file, root, LoadFromHdf5(), quiet,
+                                     dense_positions)
+        elif entries == "all":
+            loaded_data = _load_all_entries(nexus_file, root, LoadFromHdf5(),
+                                            quiet, dense_positions)
+        else:
+            raise ValueError(f"Unrecognised value '{entries}' for 'entries' "
+                             f"argument, expected None or 'all'")
 
     if not quiet:
         print("Total time:", timer() - total_time)
     return loaded_data
 
 
-def _load_data(nexus_file: Union[h5py.File, Dict], root: Optional[str],
-               nexus: LoadFromNexus, quiet: bool) -> Optional[ScippData]:
+_all_nx_classes = (nx_event_data, nx_log, nx_entry, nx_instrument, nx_sample,
+                   nx_source, nx_detector, nx_monitor)
+
+
+def _find_groups(
+        nexus_file: Union[h5py.File, Dict],
+        root: Optional[str],
+        nexus: LoadFromNexus,
+        nx_classes: Tuple[str,
+                          ...] = _all_nx_classes) -> Dict[str, List[Group]]:
     if root is not None:
         root_node = nexus_file[root]
     else:
         root_node = nexus_file
-    groups = nexus.find_by_nx_class(
-        (nx_event_data, nx_log, nx_entry, nx_instrument, nx_sample, nx_source,
-         nx_detector), root_node)
+    return nexus.find_by_nx_class(nx_classes, root_node)
+
+
+def load_transformations(data_file: Union[str, h5py.File],
+                         root: str = "/") -> Dict[str, sc.Dataset]:
+    """
+    Load the full transformation, given by the chain of depends_on
+    transformations, of every NXsample, NXsource, NXmonitor and
+    NXdetector in a NeXus file. Parts of chains which are shared between
+    components are only loaded once.
+
+    :param data_file: path of NeXus file containing data to load
+    :param root: path of group in file, only load transformations of
+      components in the subtree of this group
+    :return: Dictionary with the path of each component as the key and
+      a Dataset containing "rotation" and "translation" as the value.
+      The translation is the position of the component. If the
+      transformations are time-dependent then these have a time dimension.
+      Components without a depends_on dataset are not included.
+
+    Usage example:
+      transformations = sc.neutron.load_transformations('LOKI_example.nxs')
+    """
+    with _open_if_path(data_file) as nexus_file:
+        return _load_transformations(nexus_file, root, LoadFromHdf5())
+
+
+def _load_transformations(nexus_file: Union[h5py.File,
+                                            Dict], root: Optional[str],
+                          nexus: LoadFromNexus) -> Dict[str, sc.Dataset]:
+    groups = _find_groups(nexus_file, root, nexus,
+                          (nx_sample, nx_source, nx_monitor, nx_detector))
+    transform_cache = TransformationCache()
+    transformations = {}
+    for class_groups in groups.values():
+        for group in class_groups:
+            depends_on_found, _ = nexus.dataset_in_group(
+                group.group, "depends_on")
+            if not depends_on_found:
+                continue
+            try:
+                matrix, times = get_full_transformation(
+                    group.group, nexus_file, nexus, transform_cache)
+            except TransformationError as e:
+                warn(f"Skipping loading transformations of {group.path} "
+                     f"due to error: {e}")
+                continue
+            transformations[group.path] = transformation_as_dataset(
+                matrix, times)
+    return transformations
+
+
+def _load_data(
+    nexus_file: Union[h5py.File, Dict],
+    root: Optional[str],
+    nexus: LoadFromNexus,
+    quiet: bool,
+    dense_positions: bool = True,
+    transform_cache: Optional[TransformationCache] = None
+) -> Optional[ScippData]:
+    groups = _find_groups(nexus_file, root, nexus)
     if len(groups[nx_entry]) > 1:
         # We can't sensibly load from multiple NXentry, for example each
         # could could contain a description of the same detector bank
@@ -127,20 +350,104 @@ def _load_data(nexus_file: Union[h5py.File, Dict], root: Optional[str],
         raise RuntimeError(
             f"More than one {nx_entry} group in file, use 'root' argument "
             "to specify which to load data from, for example"
-            f"{__name__}('my_file.nxs', '/entry_2')")
-    loaded_data = load_detector_data(groups[nx_event_data],
-                                     groups[nx_detector], nexus_file, nexus,
-                                     quiet)
+            f"{__name__}('my_file.nxs', '/entry_2'), or use "
+            f"entries='all' to load data from every {nx_entry}")
+    # Components often share the tail of their depends_on chains,
+    # each transformation in the file only needs to be resolved once
+    if transform_cache is None:
+        transform_cache = TransformationCache()
+    return _load_data_from_groups(groups, nexus_file, nexus, quiet,
+                                  transform_cache, dense_positions)
+
+
+def _load_all_entries(
+        nexus_file: Union[h5py.File, Dict],
+        root: Optional[str],
+        nexus: LoadFromNexus,
+        quiet: bool,
+        dense_positions: bool = True) -> Dict[str, Optional[ScippData]]:
+    """
+    Load data from each NXentry separately. The file is only searched
+    once, the groups found are then divided between the entries which
+    contain them.
+    """
+    groups = _find_groups(nexus_file, root, nexus)
+    # Transformation paths are absolute, so the cache
+    # can be shared between entries
+    transform_cache = TransformationCache()
+    entry_groups = {
+        entry.path: {nx_class: []
+                     for nx_class in groups.keys()}
+        for entry in groups[nx_entry]
+    }
+    for nx_class, class_groups in groups.items():
+        for group in class_groups:
+            entry_path = _containing_entry_path(group.path, entry_groups)
+            if entry_path is not None:
+                entry_groups[entry_path][nx_class].append(group)
+    loaded_entries = {}
+    for entry in groups[nx_entry]:
+        loaded_entries[nexus.get_name(entry.group)] = _load_data_from_groups(
+            entry_groups[entry.path], nexus_file, nexus, quiet,
+            transform_cache, dense_positions)
+    return loaded_entries
+
+
+def _containing_entry_path(path: str, entry_paths: Dict) -> Optional[str]:
+    path_split = path.split("/")
+    for depth in range(1, len(path_split) + 1):
+        parent_path = "/".join(path_split[:depth])
+        if parent_path in entry_paths:
+            return parent_path
+    return None
+
+
+def _load_data_from_groups(
+        groups: Dict[str, List[Group]],
+        nexus_file: Union[h5py.File, Dict],
+        nexus: LoadFromNexus,
+        quiet: bool,
+        transform_cache: TransformationCache,
+        dense_positions: bool = True) -> Optional[ScippData]:
+    *_, loaded_data = _load_data_in_stages(groups, nexus_file, nexus, quiet,
+                                           transform_cache, dense_positions)
+    return loaded_data
+
+
+def _load_data_in_stages(
+        groups: Dict[str, List[Group]],
+        nexus_file: Union[h5py.File, Dict],
+        nexus: LoadFromNexus,
+        quiet: bool,
+        transform_cache: TransformationCache,
+        dense_positions: bool = True) -> Iterator[Optional[ScippData]]:
+    """
+    Yields after each stage of loading, so that the caller can do other
+    work, or stop loading, in between. The last value yielded is the
+    loaded data, the values yielded before that should be ignored.
+    """
+    event_data_groups = split_monitor_event_data(groups[nx_event_data],
+                                                 groups[nx_monitor])
+    loaded_data = yield from load_detector_data_in_stages(
+        event_data_groups["detector"], groups[nx_detector], nexus_file, nexus,
+        quiet, transform_cache, dense_positions)
     if loaded_data is None:
         no_event_data = True
         loaded_data = sc.Dataset({})
     else:
         no_event_data = False
-    load_logs(loaded_data, groups[nx_log], nexus)
+    for log_group in groups[nx_log]:
+        load_logs(loaded_data, [log_group], nexus)
+        yield None
+    load_monitor_data(loaded_data, groups[nx_monitor],
+                      event_data_groups["monitor"], nexus)
+    yield None
     if groups[nx_sample]:
-        _load_sample(groups[nx_sample], loaded_data, nexus_file, nexus)
+        _load_sample(groups[nx_sample], loaded_data, nexus_file, nexus,
+                     transform_cache)
     if groups[nx_source]:
-        _load_source(groups[nx_source], loaded_data, nexus_file, nexus)
+        _load_source(groups[nx_source], loaded_data, nexus_file, nexus,
+                     transform_cache)
     if groups[nx_instrument]:
         _load_instrument_name(groups[nx_instrument], loaded_data, nexus)
     if groups[nx_entry]:
@@ -148,9 +455,88 @@ def _load_data(nexus_file: Union[h5py.File, Dict], root: Optional[str],
     # Return None if we have an empty dataset at this point
     if no_event_data and not loaded_data.keys():
         loaded_data = None
+    yield loaded_data
+
+
+# Returned by next() when all loading stages are done
+_stages_complete = object()
+
+
+async def load_nexus_async(
+        data_file: Union[str, h5py.File],
+        root: str = "/",
+        quiet=True,
+        io_profile: str = "default",
+        dense_positions: bool = True) -> Optional[ScippData]:
+    """
+    Load a NeXus file without blocking the asyncio event loop.
+    File access is done in a worker thread, one stage of loading
+    at a time, and control is returned to the event loop in between.
+    The load can be cancelled, it then stops after the current stage.
+
+    :param data_file: path of NeXus file containing data to load
+    :param root: path of group in file, only load data from the subtree of
+      this group
+    :param quiet: if False prints some details of what is being loaded
+    :param io_profile: HDF5 settings used to open the file if a path is
+      given, see load_nexus
+    :param dense_positions: see load_nexus
+
+    Usage example:
+      data = await sc.neutron.load_nexus_async('PG3_4844_event.nxs')
+    """
+    _check_io_profile(io_profile)
+    # A single worker thread so that file access is never concurrent
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        if isinstance(data_file, str):
+            nexus_file = await _run_in_executor(executor, _open_nexus_file,
+                                                data_file, io_profile)
+        else:
+            nexus_file = data_file
+        try:
+            nexus = LoadFromHdf5()
+            groups = await _run_in_executor(executor, _find_groups, nexus_file,
+                                            root, nexus)
+            if len(groups[nx_entry]) > 1:
+                raise RuntimeError(
+                    f"More than one {nx_entry} group in file, use 'root' "
+                    "argument to specify which to load data from")
+            stages = _load_data_in_stages(groups, nexus_file, nexus, quiet,
+                                          TransformationCache(),
+                                          dense_positions)
+            loaded_data = None
+            stage_result = None
+            try:
+                # The last result before all stages are complete
+                # is the loaded data
+                while stage_result is not _stages_complete:
+                    loaded_data = stage_result
+                    stage_result = await _run_in_executor(
+                        executor, next, stages, _stages_complete)
+            finally:
+                stages.close()
+        finally:
+            if isinstance(data_file, str):
+                await _run_in_executor(executor, nexus_file.close)
     return loaded_data
 
 
+async def _run_in_executor(executor: ThreadPoolExecutor, function: Callable,
+                           *args):
+    """
+    If the calling task is cancelled, wait for the function to finish
+    before passing on the cancellation, the file must not be closed
+    while it is still being read from
+    """
+    future = asyncio.get_running_loop().run_in_executor(
+        executor, function, *args)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait({future})
+        raise
+
+
 def _load_nexus_json(
     json_template: str,
     get_start_info: bool = False
@@ -158,18 +544,39 @@ def _load_nexus_json(
     """
     Use this function for testing so that file io is not required
     """
-    # We do not use cls to convert value lists to sc.Variable at this
-    # point because we do not know what dimension names to use here
-    loaded_json = json.loads(json_template)
+    # We do not convert value lists to sc.Variable at this point because
+    # we do not know what dimension names to use here, but numeric
+    # values are converted to numpy arrays as they are parsed
+    loaded_json = json.loads(json_template, object_hook=decode_dataset_values)
+    return _load_nexus_json_structure(loaded_json, get_start_info)
+
+
+def _load_nexus_json_structure(
+    loaded_json: Dict,
+    get_start_info: bool = False,
+    transform_cache: Optional[TransformationCache] = None
+) -> Tuple[Optional[ScippData], Optional[List[str]]]:
+    """
+    As _load_nexus_json, for a structure which has already been parsed.
+    The transformations resolved while loading are left in
+    transform_cache, if it is given.
+    """
     topics = None
     if get_start_info:
         topics = get_topics_from_streams(loaded_json)
-    return _load_data(loaded_json, None, LoadFromJson(loaded_json),
-                      True), topics
+    return _load_data(loaded_json,
+                      None,
+                      LoadFromJson(loaded_json),
+                      True,
+                      transform_cache=transform_cache), topics
 
 
 def load_nexus_json(json_filename: str) -> Optional[ScippData]:
     with open(json_filename, 'r') as json_file:
-        json_string = json_file.read()
-    loaded_data, _ = _load_nexus_json(json_string)
-    return loaded_data
+        # json.load reads all of the text before parsing it, so the text
+        # and the parsed structure are both held until parsing finishes.
+        # The values of each dataset are converted to a numpy array as
+        # soon as the dataset is parsed, so the Python lists of values are
+        # never all held at once.
+        loaded_json = json.load(json_file, object_hook=decode_dataset_values)
+    return _load_data(loaded_json, None, LoadFromJson(loaded_json), True)
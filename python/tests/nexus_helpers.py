@@ -65,6 +65,21 @@ class Transformation:
     time_units: Optional[str] = None
 
 
+@dataclass
+class OffGeometry:
+    vertices: np.ndarray
+    winding_order: np.ndarray
+    faces: np.ndarray
+    units: Optional[str] = None
+
+
+@dataclass
+class CylindricalGeometry:
+    vertices: np.ndarray
+    cylinders: np.ndarray
+    units: Optional[str] = None
+
+
 @dataclass
 class Detector:
     detector_numbers: Optional[np.ndarray] = None
@@ -75,6 +90,20 @@ class Detector:
     z_offsets: Optional[np.ndarray] = None
     offsets_unit: Optional[str] = None
     depends_on: Optional[Transformation] = None
+    pixel_shape: Union[OffGeometry, CylindricalGeometry, None] = None
+    data: Optional[np.ndarray] = None
+    time_of_flight: Optional[np.ndarray] = None
+    time_of_flight_units: Optional[str] = None
+
+
+@dataclass
+class Monitor:
+    name: str
+    data: Optional[np.ndarray] = None
+    time_of_flight: Optional[np.ndarray] = None
+    data_units: Optional[str] = None
+    time_of_flight_units: Optional[str] = None
+    event_data: Optional[EventData] = None
 
 
 @dataclass
@@ -137,6 +166,9 @@ class Stream:
     type: str = "double"
     # Values have these units
     value_units: str = "m"
+    # Attributes of the group containing the stream, for example
+    # "vector" and "transformation_type" for a streamed transformation
+    attributes: Optional[Dict[str, Any]] = None
 
 
 class InMemoryNeXusWriter:
@@ -295,6 +327,9 @@ class JsonWriter:
         parent, name = _parent_and_name_from_path(file_root, stream.path)
         stream_group = self.add_group(parent, name)
         stream_group["children"].append(new_stream)
+        if stream.attributes is not None:
+            for attr_name, value in stream.attributes.items():
+                self.add_attribute(stream_group, attr_name, value)
 
 
 class NumpyEncoder(json.JSONEncoder):
@@ -311,6 +346,7 @@ class NexusBuilder:
     def __init__(self):
         self._event_data: List[EventData] = []
         self._detectors: List[Detector] = []
+        self._monitors: List[Monitor] = []
         self._logs: List[Log] = []
         self._instrument_name: Optional[str] = None
         self._title: Optional[str] = None
@@ -337,6 +373,9 @@ class NexusBuilder:
     def add_detector(self, detector: Detector):
         self._detectors.append(detector)
 
+    def add_monitor(self, monitor: Monitor):
+        self._monitors.append(monitor)
+
     def add_event_data(self, event_data: EventData):
         self._event_data.append(event_data)
 
@@ -426,6 +465,7 @@ class NexusBuilder:
             parent_group = self._write_instrument(entry_group)
             parent_path = "/entry/instrument"
         self._write_detectors(parent_group, parent_path)
+        self._write_monitors(parent_group)
         self._write_datasets(nexus_file)
         self._write_streams(nexus_file)
         self._write_links(nexus_file)
@@ -519,6 +559,24 @@ class NexusBuilder:
                                          "depends_on",
                                          data=depends_on)
 
+    def _write_monitors(self, parent_group: Union[h5py.Group, Dict]):
+        for monitor in self._monitors:
+            monitor_group = self._create_nx_class(monitor.name, "NXmonitor",
+                                                  parent_group)
+            for dataset_name, array, units in (("data", monitor.data,
+                                                monitor.data_units),
+                                               ("time_of_flight",
+                                                monitor.time_of_flight,
+                                                monitor.time_of_flight_units)):
+                if array is not None:
+                    dataset = self._writer.add_dataset(monitor_group,
+                                                       dataset_name, array)
+                    if units is not None:
+                        self._writer.add_attribute(dataset, "units", units)
+            if monitor.event_data is not None:
+                self._add_event_data_group_to_file(monitor.event_data,
+                                                   monitor_group, "events")
+
     def _write_event_data(self, parent_group: Union[h5py.Group, Dict]):
         for event_data_index, event_data in enumerate(self._event_data):
             self._add_event_data_group_to_file(event_data, parent_group,
@@ -633,8 +691,38 @@ class NexusBuilder:
                 if detector.offsets_unit is not None:
                     self._writer.add_attribute(offsets_ds, "units",
                                                detector.offsets_unit)
+        if detector.pixel_shape is not None:
+            self._add_pixel_shape_to_file(detector.pixel_shape, detector_group)
+        if detector.data is not None:
+            self._writer.add_dataset(detector_group, "data", detector.data)
+        if detector.time_of_flight is not None:
+            tof_ds = self._writer.add_dataset(detector_group, "time_of_flight",
+                                              detector.time_of_flight)
+            if detector.time_of_flight_units is not None:
+                self._writer.add_attribute(tof_ds, "units",
+                                           detector.time_of_flight_units)
         return detector_group
 
+    def _add_pixel_shape_to_file(self, shape: Union[OffGeometry,
+                                                    CylindricalGeometry],
+                                 detector_group: Union[h5py.Group, Dict]):
+        if isinstance(shape, OffGeometry):
+            shape_group = self._create_nx_class("pixel_shape",
+                                                "NXoff_geometry",
+                                                detector_group)
+            self._writer.add_dataset(shape_group, "winding_order",
+                                     shape.winding_order)
+            self._writer.add_dataset(shape_group, "faces", shape.faces)
+        else:
+            shape_group = self._create_nx_class("pixel_shape",
+                                                "NXcylindrical_geometry",
+                                                detector_group)
+            self._writer.add_dataset(shape_group, "cylinders", shape.cylinders)
+        vertices = self._writer.add_dataset(shape_group, "vertices",
+                                            shape.vertices)
+        if shape.units is not None:
+            self._writer.add_attribute(vertices, "units", shape.units)
+
     def _add_transform_attributes(self, added_transform: Union[h5py.Group,
                                                                h5py.Dataset],
                                   depends_on: Optional[str],
@@ -1,21 +1,47 @@
 import datetime
+import functools
+from time import monotonic, sleep
 import pytest
 import scipp as sc
 import asyncio
-from typing import List, Tuple, Callable, Dict, Optional
+import threading
+from typing import List, Tuple, Callable, Dict, Optional, Type
 import numpy as np
-from .nexus_helpers import NexusBuilder, Stream
+from .nexus_helpers import (NexusBuilder, Stream, Source, EventData, Log,
+                            Detector, Transformation, TransformationType)
 
 try:
     import streaming_data_types  # noqa: F401
     from confluent_kafka import TopicPartition  # noqa: F401
-    from scippneutron.data_stream import _data_stream, StartTime  # noqa: E402
+    from scippneutron.data_stream import (  # noqa: E402
+        _data_stream, StartTime, _load_run_start_structure, QueueFullPolicy)
     from scippneutron._streaming_data_buffer import \
         StreamedDataBuffer  # noqa: E402
+    from scippneutron._streaming_histogram import (LiveHistogram,
+                                                   RollingWindowHistogram,
+                                                   DecayedHistogram)
     from streaming_data_types.eventdata_ev42 import \
         serialise_ev42  # noqa: E402
     from streaming_data_types.run_start_pl72 import serialise_pl72
-    from scippneutron._streaming_consumer import RunStartError
+    from streaming_data_types.logdata_f142 import serialise_f142
+    from scippneutron._streaming_consumer import (RunStartError,
+                                                  KafkaQueryConsumer,
+                                                  KafkaThreadedConsumer,
+                                                  create_consumers,
+                                                  get_run_start_message)
+    from scippneutron._streaming_fake_broker import (FakeBroker, FakeMessage as
+                                                     BrokerMessage,
+                                                     _FakePartitionEOF)
+    from scippneutron._streaming_replay import NexusReplay
+    from scippneutron._streaming_transformations import \
+        merge_position_updates
+    from scippneutron.load_nexus import _load_nexus_json
+    from streaming_data_types.eventdata_ev42 import deserialise_ev42
+    from streaming_data_types.logdata_f142 import deserialise_f142
+    from scippneutron._streaming_process_consumer import (_SharedEventBlock,
+                                                          _EventBlockWriter,
+                                                          KafkaProcessConsumer,
+                                                          EventBatch)
 except ImportError:
     pytest.skip("Kafka or Serialisation module is unavailable",
                 allow_module_level=True)
@@ -108,6 +134,49 @@ class FakeQueryConsumer:
         return partitions
 
 
+class PayloadSource:
+    """
+    Use as the consumer_factory of KafkaProcessConsumer, it is picklable
+    so it can be passed to the worker process. The consumer it creates
+    gives the payloads, then reports the end of the partition if that
+    is enabled.
+    """
+    def __init__(self, payloads: List[bytes]):
+        self._payloads = payloads
+
+    def __call__(self, conf: Dict) -> "PayloadSourceConsumer":
+        return PayloadSourceConsumer(self._payloads, conf)
+
+
+class PayloadSourceConsumer:
+    def __init__(self, payloads: List[bytes], conf: Dict):
+        self._messages = [
+            BrokerMessage("events", 0, offset, payload, 0)
+            for offset, payload in enumerate(payloads)
+        ]
+        self._partition_eof = conf.get('enable.partition.eof', False)
+
+    def assign(self, partitions: List[TopicPartition]):
+        pass
+
+    def consume(self, num_messages: int = 1, timeout: float = 0.):
+        messages = self._messages[:num_messages]
+        del self._messages[:num_messages]
+        if messages:
+            return messages
+        if self._partition_eof:
+            self._partition_eof = False
+            return [
+                BrokerMessage("events", 0, 0, None, 0,
+                              _FakePartitionEOF("events", 0))
+            ]
+        sleep(timeout)
+        return []
+
+    def close(self):
+        pass
+
+
 # Short time to use for buffer emit and data_stream interval in tests
 # pass or fail fast!
 SHORT_TEST_INTERVAL = 1. * sc.Unit('milliseconds')
@@ -115,6 +184,13 @@ SHORT_TEST_INTERVAL = 1. * sc.Unit('milliseconds')
 TEST_BUFFER_SIZE = 20
 
 
+def _events(data: sc.DataArray) -> sc.DataArray:
+    """
+    Events from the data emitted by the buffer, which are binned by pulse
+    """
+    return data.bins.constituents['data']
+
+
 @pytest.mark.asyncio
 async def test_data_stream_returns_data_from_single_event_message():
     queue = asyncio.Queue()
@@ -133,7 +209,7 @@ async def test_data_stream_returns_data_from_single_event_message():
                                    query_consumer=FakeQueryConsumer(),
                                    consumer_type=FakeConsumer,
                                    max_iterations=1):
-        assert np.allclose(data.coords['tof'].values, time_of_flight)
+        assert np.allclose(_events(data).coords['tof'].values, time_of_flight)
         reached_assert = True
     assert reached_assert
 
@@ -162,14 +238,263 @@ async def test_data_stream_returns_data_from_multiple_event_messages():
                                    consumer_type=FakeConsumer,
                                    max_iterations=1):
         expected_tofs = np.concatenate((first_tof, second_tof))
-        assert np.allclose(data.coords['tof'].values, expected_tofs)
+        assert np.allclose(_events(data).coords['tof'].values, expected_tofs)
         expected_ids = np.concatenate(
             (first_detector_ids, second_detector_ids))
-        assert np.array_equal(data.coords['detector_id'].values, expected_ids)
+        assert np.array_equal(
+            _events(data).coords['detector_id'].values, expected_ids)
         reached_asserts = True
     assert reached_asserts
 
 
+@pytest.mark.asyncio
+async def test_emitted_events_are_binned_by_pulse():
+    queue = asyncio.Queue()
+    buffer = StreamedDataBuffer(queue, TEST_BUFFER_SIZE, SHORT_TEST_INTERVAL)
+    first_pulse_time = 1000
+    second_pulse_time = 2000
+    await buffer.new_data(
+        serialise_ev42("detector", 0, first_pulse_time, np.array([1, 2, 3]),
+                       np.array([4, 5, 6])))
+    await buffer.new_data(
+        serialise_ev42("detector", 1, second_pulse_time, np.array([7, 8]),
+                       np.array([4, 5])))
+
+    await buffer._emit_data()
+    data = queue.get_nowait()
+
+    assert np.array_equal(data.coords['pulse_time'].values,
+                          [first_pulse_time, second_pulse_time])
+    assert np.array_equal(data.bins.size().values, [3, 2])
+    assert "pulse_time" not in _events(data).coords
+
+
+@pytest.mark.asyncio
+async def test_emitted_data_are_not_modified_by_later_events():
+    queue = asyncio.Queue()
+    buffer = StreamedDataBuffer(queue, TEST_BUFFER_SIZE, SHORT_TEST_INTERVAL)
+    emitted_data = []
+    # More emits than there are buffer slots, so the events of emitted
+    # data would be overwritten if their slots were reused
+    for message_index in range(3):
+        tof = np.array([1, 2, 3]) + 10 * message_index
+        await buffer.new_data(
+            serialise_ev42("detector", message_index, 0, tof,
+                           np.array([4, 5, 6])))
+        await buffer._emit_data()
+        emitted_data.append(queue.get_nowait())
+
+    for message_index, data in enumerate(emitted_data):
+        assert np.array_equal(
+            _events(data).coords['tof'].values,
+            np.array([1, 2, 3]) + 10 * message_index)
+
+
+_histogram_detector_ids = sc.Variable(['detector_id'], values=[4, 5, 6])
+_histogram_tof_edges = sc.Variable(['tof'],
+                                   values=[0., 10., 20.],
+                                   unit=sc.units.ns)
+
+
+def _histogram_buffer(queue: asyncio.Queue,
+                      cumulative: bool) -> StreamedDataBuffer:
+    histogram = LiveHistogram(detector_ids=_histogram_detector_ids,
+                              tof_edges=_histogram_tof_edges,
+                              cumulative=cumulative)
+    return StreamedDataBuffer(queue, TEST_BUFFER_SIZE, SHORT_TEST_INTERVAL,
+                              histogram)
+
+
+@pytest.mark.asyncio
+async def test_events_are_accumulated_into_histogram():
+    queue = asyncio.Queue()
+    buffer = _histogram_buffer(queue, cumulative=True)
+    # Events with id 7 or tof 25 are outside of the histogram
+    await buffer.new_data(
+        serialise_ev42("detector", 0, 0, np.array([1, 2, 15, 5, 25]),
+                       np.array([4, 4, 4, 7, 6])))
+    await buffer._emit_data()
+    first_data = queue.get_nowait()
+    await buffer.new_data(
+        serialise_ev42("detector", 1, 0, np.array([12]), np.array([6])))
+    await buffer._emit_data()
+    second_data = queue.get_nowait()
+
+    assert first_data.dims == ['detector_id', 'tof']
+    assert first_data.unit == sc.units.counts
+    assert np.array_equal(first_data.coords['detector_id'].values, [4, 5, 6])
+    assert np.array_equal(first_data.values, [[2, 1], [0, 0], [0, 0]])
+    # Cumulative histograms include events from previous emits
+    assert np.array_equal(second_data.values, [[2, 1], [0, 0], [0, 1]])
+
+
+@pytest.mark.asyncio
+async def test_delta_histograms_contain_only_events_since_last_emit():
+    queue = asyncio.Queue()
+    buffer = _histogram_buffer(queue, cumulative=False)
+    await buffer.new_data(
+        serialise_ev42("detector", 0, 0, np.array([1, 15]), np.array([4, 5])))
+    await buffer._emit_data()
+    first_data = queue.get_nowait()
+    await buffer.new_data(
+        serialise_ev42("detector", 1, 0, np.array([12]), np.array([6])))
+    await buffer._emit_data()
+    second_data = queue.get_nowait()
+
+    assert np.array_equal(first_data.values, [[1, 0], [0, 1], [0, 0]])
+    assert np.array_equal(second_data.values, [[0, 0], [0, 0], [0, 1]])
+    # Nothing is emitted if there were no new events
+    await buffer._emit_data()
+    assert queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_rolling_window_histogram_contains_only_events_in_window():
+    queue = asyncio.Queue()
+    histogram = RollingWindowHistogram(_histogram_detector_ids,
+                                       _histogram_tof_edges,
+                                       window=4 * sc.Unit('ns'),
+                                       n_buckets=4)
+    buffer = StreamedDataBuffer(queue, TEST_BUFFER_SIZE, SHORT_TEST_INTERVAL,
+                                histogram)
+    for pulse_time, detector_id in ((0, 4), (2, 5), (5, 6)):
+        await buffer.new_data(
+            serialise_ev42("detector", 0, pulse_time, np.array([1]),
+                           np.array([detector_id])))
+    await buffer._emit_data()
+    data = queue.get_nowait()
+
+    # The event at pulse time 0 is no longer in the window
+    assert np.array_equal(data.values, [[0, 0], [1, 0], [1, 0]])
+
+
+@pytest.mark.asyncio
+async def test_decayed_histogram_weights_events_by_age():
+    queue = asyncio.Queue()
+    decay_time = 10 * sc.Unit('ns')
+    histogram = DecayedHistogram(_histogram_detector_ids, _histogram_tof_edges,
+                                 decay_time)
+    buffer = StreamedDataBuffer(queue, TEST_BUFFER_SIZE, SHORT_TEST_INTERVAL,
+                                histogram)
+    for pulse_time in (0, 10):
+        await buffer.new_data(
+            serialise_ev42("detector", 0, pulse_time, np.array([1]),
+                           np.array([4])))
+    await buffer._emit_data()
+    data = queue.get_nowait()
+
+    assert np.isclose(data.values[0, 0], 1. + np.exp(-1.))
+    assert np.isclose(data.variances[0, 0], 1. + np.exp(-2.))
+
+
+@pytest.mark.asyncio
+async def test_log_data_are_emitted_as_attrs_of_event_data():
+    queue = asyncio.Queue()
+    buffer = StreamedDataBuffer(queue, TEST_BUFFER_SIZE, SHORT_TEST_INTERVAL)
+    await buffer.new_data(
+        serialise_ev42("detector", 0, 0, np.array([1, 2]), np.array([4, 5])))
+    log_times = [1000, 2000]
+    log_values = [273.1, 274.2]
+    for time, value in zip(log_times, log_values):
+        await buffer.new_data(
+            serialise_f142(np.array(value),
+                           "temperature",
+                           timestamp_unix_ns=time))
+
+    await buffer._emit_data()
+    data = queue.get_nowait()
+
+    log = data.attrs["temperature"].value
+    assert np.array_equal(log.coords["time"].values, log_times)
+    assert np.allclose(log.values, log_values)
+    assert np.array_equal(_events(data).coords['tof'].values, [1, 2])
+
+
+@pytest.mark.asyncio
+async def test_log_ring_buffer_keeps_latest_values_and_warns_on_overwrite():
+    queue = asyncio.Queue()
+    buffer = StreamedDataBuffer(queue,
+                                TEST_BUFFER_SIZE,
+                                SHORT_TEST_INTERVAL,
+                                log_buffer_size=2)
+    for time in range(3):
+        await buffer.new_data(
+            serialise_f142(np.array(time), "field", timestamp_unix_ns=time))
+
+    # Log data are emitted even if there are no event data
+    with pytest.warns(UserWarning):
+        await buffer._emit_data()
+    data = queue.get_nowait()
+
+    log = data.attrs["field"].value
+    assert np.array_equal(log.coords["time"].values, [1, 2])
+    assert np.array_equal(log.values, [1, 2])
+    assert data.shape == [0]
+
+
+async def _emit_messages(buffer: StreamedDataBuffer, tofs: List[np.ndarray]):
+    for message_index, tof in enumerate(tofs):
+        await buffer.new_data(
+            serialise_ev42("detector", message_index, message_index, tof,
+                           np.full(tof.size, 4)))
+        await buffer._emit_data()
+
+
+@pytest.mark.asyncio
+async def test_oldest_data_are_dropped_if_queue_is_full():
+    queue = asyncio.Queue(maxsize=1)
+    buffer = StreamedDataBuffer(queue,
+                                TEST_BUFFER_SIZE,
+                                SHORT_TEST_INTERVAL,
+                                queue_full_policy=QueueFullPolicy.drop_oldest)
+    await _emit_messages(buffer, [np.array([1, 2]), np.array([3])])
+
+    data = queue.get_nowait()
+    assert queue.empty()
+    assert np.array_equal(_events(data).coords['tof'].values, [3])
+    assert buffer.dropped_events == 2
+    assert data.attrs['dropped_events'].value == 2
+
+
+@pytest.mark.asyncio
+async def test_queued_data_are_merged_if_queue_is_full():
+    queue = asyncio.Queue(maxsize=1)
+    buffer = StreamedDataBuffer(queue,
+                                TEST_BUFFER_SIZE,
+                                SHORT_TEST_INTERVAL,
+                                queue_full_policy=QueueFullPolicy.merge)
+    await _emit_messages(
+        buffer,
+        [np.array([1, 2]), np.array([3]),
+         np.array([4, 5])])
+
+    data = queue.get_nowait()
+    assert queue.empty()
+    assert np.array_equal(_events(data).coords['tof'].values, [1, 2, 3, 4, 5])
+    assert np.array_equal(data.coords['pulse_time'].values, [0, 1, 2])
+    assert buffer.merged_events == 3
+    assert data.attrs['merged_events'].value == 3
+
+
+@pytest.mark.asyncio
+async def test_ingestion_waits_for_space_on_queue_with_block_policy():
+    queue = asyncio.Queue(maxsize=1)
+    buffer = StreamedDataBuffer(queue,
+                                TEST_BUFFER_SIZE,
+                                SHORT_TEST_INTERVAL,
+                                queue_full_policy=QueueFullPolicy.block)
+    await _emit_messages(buffer, [np.array([1, 2])])
+    second_emit = asyncio.create_task(_emit_messages(buffer, [np.array([3])]))
+    await asyncio.sleep(0.01)
+    assert not second_emit.done()
+
+    first_data = queue.get_nowait()
+    await asyncio.wait_for(second_emit, timeout=1.)
+    second_data = queue.get_nowait()
+    assert np.array_equal(_events(first_data).coords['tof'].values, [1, 2])
+    assert np.array_equal(_events(second_data).coords['tof'].values, [3])
+
+
 @pytest.mark.asyncio
 async def test_warn_on_data_emit_if_unrecognised_message_was_encountered():
     queue = asyncio.Queue()
@@ -231,6 +556,213 @@ async def test_buffer_size_exceeded_by_messages_causes_early_data_emit():
                               "queue as buffer size was exceeded"
 
 
+@pytest.mark.asyncio
+async def test_data_from_message_batch_ingested_in_another_thread_are_emitted(
+):
+    queue = asyncio.Queue()
+    buffer_size_5_events = 5
+    buffer = StreamedDataBuffer(queue,
+                                buffer_size=buffer_size_5_events,
+                                interval=SHORT_TEST_INTERVAL)
+    first_tof = np.array([1, 2, 3])
+    second_tof = np.array([4, 5, 6])
+    messages = [
+        serialise_ev42("detector", 0, 0, tof, np.array([4, 5, 6]))
+        for tof in (first_tof, second_tof)
+    ]
+    buffer.start()
+    # Consumer threads pass batches of messages to the buffer
+    consumer_thread = threading.Thread(target=buffer.new_data_batch,
+                                       args=(messages, ))
+    consumer_thread.start()
+    consumer_thread.join()
+
+    # The second message did not fit in the buffer, so the first was
+    # emitted from the consumer thread
+    first_data = await asyncio.wait_for(queue.get(), timeout=1.)
+    second_data = await asyncio.wait_for(queue.get(), timeout=1.)
+    buffer.stop()
+
+    assert np.array_equal(_events(first_data).coords['tof'].values, first_tof)
+    assert np.array_equal(
+        _events(second_data).coords['tof'].values, second_tof)
+
+
+@pytest.mark.asyncio
+async def test_events_deserialised_into_shared_memory_are_emitted():
+    queue = asyncio.Queue()
+    buffer_size_5_events = 5
+    # Long interval so that data are only emitted when the test does it
+    buffer = StreamedDataBuffer(queue,
+                                buffer_size=buffer_size_5_events,
+                                interval=10. * sc.units.s)
+    # Worker processes write the events of each message into a block
+    block = _SharedEventBlock(size=10, n_pulses=4)
+    writer = _EventBlockWriter(block)
+    for pulse_time, tof in ((1, [1, 2]), (2, [3, 4]), (3, [5, 6, 7])):
+        assert writer.add(np.array([4] * len(tof)), np.array(tof), pulse_time)
+    # Messages which are not event data are passed on as they are
+    log_message = serialise_f142(np.array(1.5), "temperature", 3)
+    buffer.start()
+    consumer_thread = threading.Thread(
+        target=buffer.new_event_batch,
+        args=([log_message], block.batch(writer.n_pulses, writer.n_events)))
+    consumer_thread.start()
+    consumer_thread.join()
+
+    # The third pulse did not fit in the buffer, so the first two were
+    # emitted from the consumer thread
+    first_data = await asyncio.wait_for(queue.get(), timeout=1.)
+    await buffer._emit_data()
+    second_data = queue.get_nowait()
+    buffer.stop()
+
+    assert np.array_equal(first_data.coords['pulse_time'].values, [1, 2])
+    assert np.array_equal(
+        _events(first_data).coords['tof'].values, [1, 2, 3, 4])
+    assert np.array_equal(second_data.coords['pulse_time'].values, [3])
+    assert np.array_equal(_events(second_data).coords['tof'].values, [5, 6, 7])
+    assert np.array_equal(second_data.attrs['temperature'].value.values, [1.5])
+
+
+def _start_process_consumer(payloads: List[bytes],
+                            stop_at_end_of_partition: bool):
+    """
+    Starts a worker process with room for one message of
+    3 events in each of its 2 shared memory blocks
+    """
+    received = {"payloads": [], "pulse_times": [], "tof": [], "blocks": set()}
+
+    def callback(batch_payloads: List[bytes], batch: Optional[EventBatch]):
+        received["payloads"].extend(batch_payloads)
+        if batch is not None:
+            # The block is reused once the callback returns
+            received["pulse_times"].extend(batch.pulse_times.tolist())
+            received["tof"].extend(batch.time_of_flight.tolist())
+            received["blocks"].add(
+                batch.detector_id.__array_interface__["data"][0])
+
+    consumer = KafkaProcessConsumer([TopicPartition("events", 0, 0)], {},
+                                    callback,
+                                    stop_at_end_of_partition,
+                                    batch_size=4,
+                                    block_size=4,
+                                    block_pulses=4,
+                                    n_blocks=2,
+                                    consumer_factory=PayloadSource(payloads))
+    consumer.start()
+    return consumer, received
+
+
+def test_process_consumer_reuses_shared_memory_blocks():
+    n_messages = 10
+    payloads = [
+        serialise_ev42("detector", message_id, message_id,
+                       np.array([message_id, message_id, message_id]),
+                       np.array([1, 2, 3])) for message_id in range(n_messages)
+    ]
+    log_payload = serialise_f142(np.array(1.5), "temperature", 3)
+    consumer, received = _start_process_consumer(payloads + [log_payload],
+                                                 stop_at_end_of_partition=True)
+
+    deadline = monotonic() + 10.
+    while not consumer.stopped:
+        assert monotonic() < deadline, \
+            "Consumer did not reach the end of the partition"
+        sleep(0.01)
+    consumer.stop()
+
+    # There were more messages than blocks, so the blocks were reused
+    assert len(received["blocks"]) == 2
+    assert received["pulse_times"] == list(range(n_messages))
+    assert received["tof"] == [
+        message_id for message_id in range(n_messages) for _ in range(3)
+    ]
+    assert received["payloads"] == [log_payload]
+    assert consumer._reached_eop
+    assert consumer._process.exitcode == 0
+
+
+def test_process_consumer_worker_exits_when_stopped():
+    payloads = [
+        serialise_ev42("detector", message_id, message_id, np.array([1, 2, 3]),
+                       np.array([1, 2, 3])) for message_id in range(3)
+    ]
+    consumer, received = _start_process_consumer(
+        payloads, stop_at_end_of_partition=False)
+
+    deadline = monotonic() + 10.
+    while len(received["pulse_times"]) < len(payloads):
+        assert monotonic() < deadline, "Consumer did not receive the events"
+        sleep(0.01)
+    # The worker is waiting for more messages
+    assert not consumer.stopped
+    consumer.stop()
+
+    assert consumer.stopped
+    assert not consumer._process.is_alive()
+    # It stopped by itself rather than being terminated
+    assert consumer._process.exitcode == 0
+    assert not consumer._reached_eop
+
+
+async def _close_stream_after_first_data(consumer_class: Type,
+                                         **stream_options) -> List:
+    """
+    Starts a stream with consumers of the given class, which consume
+    event messages from a PayloadSource, and closes it as soon as the
+    first data are yielded. Returns the consumers.
+    """
+    payloads = [
+        serialise_ev42("detector", message_id, message_id, np.array([1, 2, 3]),
+                       np.array([1, 2, 3])) for message_id in range(3)
+    ]
+    consumers = []
+
+    def consumer_type(*args):
+        consumer = consumer_class(*args,
+                                  consumer_factory=PayloadSource(payloads))
+        consumers.append(consumer)
+        return consumer
+
+    queue = asyncio.Queue()
+    buffer = StreamedDataBuffer(queue, TEST_BUFFER_SIZE, SHORT_TEST_INTERVAL)
+    stream = _data_stream(buffer,
+                          queue,
+                          "broker", ["events"],
+                          SHORT_TEST_INTERVAL,
+                          query_consumer=FakeQueryConsumer(),
+                          consumer_type=consumer_type,
+                          **stream_options)
+    await asyncio.wait_for(stream.__anext__(), timeout=10.)
+    await stream.aclose()
+    assert buffer._cancelled
+    return consumers
+
+
+@pytest.mark.asyncio
+async def test_consumer_threads_exit_when_stream_is_closed():
+    consumers = await _close_stream_after_first_data(KafkaThreadedConsumer,
+                                                     threaded_consumers=True)
+
+    assert consumers
+    for consumer in consumers:
+        assert consumer.stopped
+        assert not consumer._thread.is_alive()
+
+
+@pytest.mark.asyncio
+async def test_consumer_processes_exit_when_stream_is_closed():
+    consumers = await _close_stream_after_first_data(KafkaProcessConsumer,
+                                                     process_consumers=True)
+
+    assert consumers
+    for consumer in consumers:
+        assert consumer.stopped
+        assert not consumer._thread.is_alive()
+        assert not consumer._process.is_alive()
+
+
 @pytest.mark.asyncio
 async def test_data_are_loaded_from_run_start_message():
     queue = asyncio.Queue()
@@ -389,3 +921,250 @@ async def test_start_time_from_run_start_msg_used_if_requested():
         pass
 
     assert query_consumer.queried_timestamp == test_start_time
+
+
+def test_repeated_run_start_structure_is_loaded_from_cache():
+    builder = NexusBuilder()
+    builder.add_instrument("CACHE_TEST")
+    builder.add_stream(Stream("/entry/stream_1", "test_topic"))
+    nexus_structure = builder.json_string
+
+    first_data, first_topics, _ = _load_run_start_structure(nexus_structure)
+    second_data, second_topics, _ = _load_run_start_structure(nexus_structure)
+
+    assert sc.identical(first_data, second_data)
+    assert first_topics == second_topics == ["test_topic"]
+    # Each call returns its own copy, so users cannot modify the cache
+    second_data["instrument_name"] = sc.Variable(value="MODIFIED")
+    third_data, *_ = _load_run_start_structure(nexus_structure)
+    assert third_data["instrument_name"].value == "CACHE_TEST"
+
+
+def _structure_with_streamed_source_transformation() -> str:
+    builder = NexusBuilder()
+    stream_path = "/entry/source_stage"
+    builder.add_stream(
+        Stream(stream_path,
+               topic="motion_topic",
+               source="source_z",
+               value_units="mm",
+               attributes={
+                   "vector": np.array([0., 0., -1.]),
+                   "transformation_type": "translation",
+                   "offset": np.array([1., 0., 0.]),
+               }))
+    builder.add_component(Source("source", depends_on=stream_path))
+    return builder.json_string
+
+
+@pytest.mark.asyncio
+async def test_positions_are_updated_from_streamed_transformations():
+    loaded_data, topics, live_positions = _load_run_start_structure(
+        _structure_with_streamed_source_transformation())
+    assert "motion_topic" in topics
+    queue = asyncio.Queue()
+    buffer = StreamedDataBuffer(queue, TEST_BUFFER_SIZE, SHORT_TEST_INTERVAL)
+    buffer.set_live_positions(live_positions)
+
+    await buffer.new_data(
+        serialise_f142(np.array(250.), "source_z", timestamp_unix_ns=0))
+    await buffer._emit_data()
+    data = queue.get_nowait()
+
+    assert np.allclose(data.attrs["source_position"].value, [1., 0., 0.25])
+    # The streamed value is also emitted as a log
+    assert "source_z" in data.attrs
+    # Positions are only emitted when they are updated
+    await buffer.new_data(
+        serialise_ev42("detector", 0, 0, np.array([1]), np.array([4])))
+    await buffer._emit_data()
+    assert "source_position" not in queue.get_nowait().attrs
+
+
+def test_time_dependent_position_does_not_stop_run_start_loading():
+    builder = NexusBuilder()
+    stream_path = "/entry/source_stage"
+    builder.add_stream(
+        Stream(stream_path,
+               topic="motion_topic",
+               source="source_z",
+               value_units="mm",
+               attributes={
+                   "vector": np.array([0., 0., -1.]),
+                   "transformation_type": "translation",
+               }))
+    # The source position is a time series as it also depends on a
+    # multi-valued transformation
+    builder.add_component(
+        Source("source",
+               depends_on=Transformation(TransformationType.TRANSLATION,
+                                         vector=np.array([1., 0., 0.]),
+                                         value=np.array([1., 2.]),
+                                         time=np.array([0., 1.]),
+                                         value_units="m",
+                                         time_units="s",
+                                         depends_on=stream_path)))
+
+    with pytest.warns(UserWarning, match="multi-valued"):
+        loaded_data, topics, live_positions = _load_run_start_structure(
+            builder.json_string)
+
+    assert "motion_topic" in topics
+    assert "source_position" in loaded_data
+    assert live_positions is None
+
+
+def _structure_with_streamed_detector_transformation() -> str:
+    builder = NexusBuilder()
+    stream_path = "/entry/detector_stage"
+    builder.add_stream(
+        Stream(stream_path,
+               topic="motion_topic",
+               source="detector_z",
+               value_units="mm",
+               attributes={
+                   "vector": np.array([0., 0., -1.]),
+                   "transformation_type": "translation",
+                   "offset": np.array([1., 0., 0.]),
+               }))
+    # Only the first of the two detectors is on the moving stage
+    builder.add_detector(
+        Detector(np.array([1, 2]),
+                 x_offsets=np.array([0.1, 0.2]),
+                 y_offsets=np.array([0., 0.]),
+                 offsets_unit="m",
+                 depends_on=Transformation(TransformationType.TRANSLATION,
+                                           vector=np.array([0., 0., 1.]),
+                                           value=np.array([0.]),
+                                           value_units="m",
+                                           depends_on=stream_path)))
+    builder.add_detector(
+        Detector(np.array([3, 4]),
+                 x_offsets=np.array([0.3, 0.4]),
+                 y_offsets=np.array([0., 0.]),
+                 offsets_unit="m"))
+    return builder.json_string
+
+
+def _emitted_pixel_positions(data: sc.DataArray) -> Dict[int, np.ndarray]:
+    positions = data.attrs["position"].value
+    return dict(
+        zip(positions.coords["detector_id"].values,
+            np.asarray(positions.values).reshape(-1, 3)))
+
+
+@pytest.mark.asyncio
+async def test_only_moved_detector_pixel_positions_are_emitted():
+    loaded_data, _, live_positions = _load_run_start_structure(
+        _structure_with_streamed_detector_transformation())
+    assert "position" in loaded_data.coords
+    queue = asyncio.Queue()
+    buffer = StreamedDataBuffer(queue, TEST_BUFFER_SIZE, SHORT_TEST_INTERVAL)
+    buffer.set_live_positions(live_positions)
+
+    await buffer.new_data(
+        serialise_f142(np.array(250.), "detector_z", timestamp_unix_ns=0))
+    await buffer._emit_data()
+    positions = _emitted_pixel_positions(queue.get_nowait())
+
+    assert sorted(positions.keys()) == [1, 2]
+    assert np.allclose(positions[1], [1.1, 0., 0.25])
+    assert np.allclose(positions[2], [1.2, 0., 0.25])
+
+
+@pytest.mark.asyncio
+async def test_merged_data_keep_pixel_positions_of_each_update():
+    _, _, live_positions = _load_run_start_structure(
+        _structure_with_streamed_detector_transformation())
+    queue = asyncio.Queue(maxsize=1)
+    buffer = StreamedDataBuffer(queue,
+                                TEST_BUFFER_SIZE,
+                                SHORT_TEST_INTERVAL,
+                                queue_full_policy=QueueFullPolicy.merge)
+    buffer.set_live_positions(live_positions)
+
+    for value in (250., 500.):
+        await buffer.new_data(
+            serialise_f142(np.array(value), "detector_z", timestamp_unix_ns=0))
+        await buffer._emit_data()
+    positions = _emitted_pixel_positions(queue.get_nowait())
+
+    # The latest position of each pixel is kept
+    assert sorted(positions.keys()) == [1, 2]
+    assert np.allclose(positions[1], [1.1, 0., 0.5])
+
+
+def test_position_updates_of_different_detectors_are_combined():
+    def positions(ids, z):
+        return sc.DataArray(
+            data=sc.Variable(['detector_id'],
+                             values=np.array([[0., 0., z]] * len(ids)),
+                             dtype=sc.dtype.vector_3_float64,
+                             unit=sc.units.m),
+            coords={'detector_id': sc.Variable(['detector_id'], values=ids)})
+
+    merged = merge_position_updates(positions(np.array([1, 2]), 1.),
+                                    positions(np.array([2, 3]), 2.))
+
+    assert np.array_equal(merged.coords['detector_id'].values, [1, 2, 3])
+    assert np.allclose(
+        np.asarray(merged.values).reshape(-1, 3)[:, 2], [1., 2., 2.])
+
+
+def test_nexus_file_is_replayed_through_fake_broker():
+    builder = NexusBuilder()
+    builder.add_event_data(
+        EventData(event_id=np.array([1, 2, 3]),
+                  event_time_offset=np.array([4, 5, 6]),
+                  event_time_zero=np.array([12_000_000, 34_000_000]),
+                  event_index=np.array([0, 2])))
+    builder.add_log(
+        Log("temperature",
+            np.array([1.5, 2.5]),
+            np.array([11_000_000, 35_000_000]),
+            value_units="K",
+            time_units="ns"))
+    with builder.file() as nexus_file:
+        replay = NexusReplay(nexus_file)
+    broker = FakeBroker()
+    replay.produce_run_start(broker)
+    replay.replay(broker, speed=None)
+
+    # The real consumers are used, with clients of the fake broker
+    query_consumer = KafkaQueryConsumer("fake_broker",
+                                        consumer_factory=broker.client)
+    run_start = get_run_start_message(replay.run_info_topic, query_consumer)
+    _, topics = _load_nexus_json(run_start.nexus_structure,
+                                 get_start_info=True)
+    assert sorted(topics) == ["events", "logs"]
+    payloads = []
+    consumers = create_consumers(run_start.start_time * sc.Unit('ms'),
+                                 topics,
+                                 "fake_broker",
+                                 query_consumer,
+                                 functools.partial(
+                                     KafkaThreadedConsumer,
+                                     consumer_factory=broker.client),
+                                 payloads.extend,
+                                 stop_at_end_of_partition=True)
+    for consumer in consumers:
+        consumer.start()
+    deadline = monotonic() + 5.
+    while not all(consumer.stopped for consumer in consumers):
+        assert monotonic() < deadline, \
+            "Consumers did not reach the end of the partitions"
+        sleep(0.01)
+
+    events = [
+        deserialise_ev42(payload) for payload in payloads
+        if payload[4:8] == b"ev42"
+    ]
+    logs = [
+        deserialise_f142(payload) for payload in payloads
+        if payload[4:8] == b"f142"
+    ]
+    assert [event.pulse_time for event in events] == [12_000_000, 34_000_000]
+    assert np.array_equal(events[0].detector_id, [1, 2])
+    assert np.array_equal(events[1].time_of_flight, [6])
+    assert [log.value for log in logs] == [1.5, 2.5]
+    assert logs[0].source_name == "temperature"
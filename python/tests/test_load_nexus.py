@@ -8,14 +8,27 @@ from .nexus_helpers import (
     Transformation,
     TransformationType,
     Link,
+    Monitor,
+    OffGeometry,
+    CylindricalGeometry,
     in_memory_hdf5_file_with_two_nxentry,
 )
+import asyncio
+import importlib
+import threading
+import h5py
 import numpy as np
 import pytest
 import scippneutron
 import scipp as sc
 from typing import List, Type, Union, Callable
-from scippneutron.load_nexus import _load_nexus_json
+from scippneutron.load_nexus import (_load_nexus_json, _open_nexus_file,
+                                     _auto_tuned_io_options)
+from scippneutron._loading_pixel_shape import pixel_vertices, pixel_size
+from scippneutron._loading_hdf5_nexus import LoadFromHdf5
+from scippneutron._loading_transformations import (
+    TransformationCache, get_full_transformation_matrix,
+    rotation_matrices_from_axes_and_angles)
 
 
 def test_raises_exception_if_multiple_nxentry_in_file():
@@ -31,6 +44,134 @@ def test_no_exception_if_single_nxentry_found_below_root():
         assert scippneutron.load_nexus(nexus_file, root='/entry_1') is None
 
 
+def test_loads_data_from_each_nxentry_if_all_entries_requested():
+    with in_memory_hdf5_file_with_two_nxentry() as nexus_file:
+        for entry_name, value in (("entry_1", 1.5), ("entry_2", 2.5)):
+            log_group = nexus_file[entry_name].create_group("temperature")
+            log_group.attrs["NX_class"] = "NXlog"
+            log_group.create_dataset("value", data=np.array([value]))
+        loaded_entries = scippneutron.load_nexus(nexus_file, entries="all")
+
+    assert set(loaded_entries.keys()) == {"entry_1", "entry_2"}
+    # Each entry only contains the data from its own subtree
+    assert np.allclose(
+        loaded_entries["entry_1"]["temperature"].data.values.values, 1.5)
+    assert np.allclose(
+        loaded_entries["entry_2"]["temperature"].data.values.values, 2.5)
+
+
+def test_raises_exception_for_unrecognised_io_profile():
+    with in_memory_hdf5_file_with_two_nxentry() as nexus_file:
+        with pytest.raises(ValueError):
+            scippneutron.load_nexus(nexus_file,
+                                    root='/entry_1',
+                                    io_profile='fastest')
+
+
+def _write_nexus_file(path: str, paged: bool = False):
+    """
+    File with a log, and a large chunked dataset which is not loaded
+    """
+    options = {"fs_strategy": "page"} if paged else {}
+    with h5py.File(path, "w", **options) as nexus_file:
+        entry = nexus_file.create_group("entry")
+        entry.attrs["NX_class"] = "NXentry"
+        log_group = entry.create_group("temperature")
+        log_group.attrs["NX_class"] = "NXlog"
+        log_group.create_dataset("value",
+                                 data=np.arange(1000, dtype=np.float32),
+                                 chunks=(1000, ))
+        entry.create_dataset("raw_monitor",
+                             data=np.zeros(1000, dtype=np.int32),
+                             chunks=(1000, ))
+        # 512 KiB chunks
+        entry.create_dataset("raw_frames",
+                             data=np.zeros(65536, dtype=np.float64),
+                             chunks=(65536, ))
+
+
+@pytest.mark.parametrize("io_profile",
+                         ["default", "large_cache", "paged", "in_memory"])
+def test_loads_file_from_path_with_io_profile(tmp_path, io_profile: str):
+    file_path = str(tmp_path / "test.nxs")
+    _write_nexus_file(file_path, paged=io_profile == "paged")
+
+    loaded_data = scippneutron.load_nexus(file_path, io_profile=io_profile)
+
+    assert np.allclose(loaded_data["temperature"].data.values.values,
+                       np.arange(1000))
+
+
+def test_auto_io_profile_sizes_chunk_cache_from_chunk_layout(tmp_path):
+    file_path = str(tmp_path / "test.nxs")
+    _write_nexus_file(file_path)
+
+    options = _auto_tuned_io_options(file_path)
+
+    # Room for 8 of the largest chunks
+    largest_chunk = 65536 * 8
+    assert options["rdcc_nbytes"] == 8 * largest_chunk
+    # A prime number of slots, 100 for each typical chunk which fits
+    typical_chunk = 1000 * 4
+    n_slots = options["rdcc_nslots"]
+    assert n_slots >= 100 * (8 * largest_chunk // typical_chunk)
+    divisors = range(2, int(n_slots**0.5) + 1)
+    assert all(n_slots % divisor for divisor in divisors)
+    with _open_nexus_file(file_path, "auto") as nexus_file:
+        _, rdcc_nslots, rdcc_nbytes, _ = \
+            nexus_file.id.get_access_plist().get_cache()
+    assert (rdcc_nslots, rdcc_nbytes) == (n_slots, options["rdcc_nbytes"])
+
+    loaded_data = scippneutron.load_nexus(file_path, io_profile="auto")
+    assert np.allclose(loaded_data["temperature"].data.values.values,
+                       np.arange(1000))
+
+
+def _fail_to_open_with_page_buffer(monkeypatch):
+    """
+    Recent HDF5 versions ignore the page buffer for files which are
+    not paged, older versions fail to open them
+    """
+    open_file = h5py.File
+
+    def open_without_page_buffer(*args, **kwargs):
+        if "page_buf_size" in kwargs:
+            raise OSError("Unable to open file (page buffering is disabled)")
+        return open_file(*args, **kwargs)
+
+    monkeypatch.setattr(h5py, "File", open_without_page_buffer)
+
+
+def test_paged_io_profile_falls_back_if_file_is_not_paged(
+        tmp_path, monkeypatch):
+    file_path = str(tmp_path / "test.nxs")
+    _write_nexus_file(file_path)
+    _fail_to_open_with_page_buffer(monkeypatch)
+
+    with pytest.warns(UserWarning, match="page buffering"):
+        loaded_data = scippneutron.load_nexus(file_path, io_profile="paged")
+
+    assert np.allclose(loaded_data["temperature"].data.values.values,
+                       np.arange(1000))
+
+
+def test_paged_io_profile_raises_if_paged_file_cannot_be_opened(
+        tmp_path, monkeypatch):
+    file_path = str(tmp_path / "test.nxs")
+    _write_nexus_file(file_path, paged=True)
+    _fail_to_open_with_page_buffer(monkeypatch)
+
+    # Page buffering was not the problem, so the error is not hidden
+    with pytest.raises(OSError, match="page buffering is disabled"):
+        scippneutron.load_nexus(file_path, io_profile="paged")
+
+
+def test_paged_io_profile_raises_if_file_does_not_exist(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        scippneutron.load_nexus(str(tmp_path / "missing.nxs"),
+                                io_profile="paged")
+
+
 def load_from_nexus(
         builder: NexusBuilder) -> Union[sc.Dataset, sc.DataArray, None]:
     with builder.file() as nexus_file:
@@ -902,33 +1043,64 @@ def test_loads_component_position_from_log_transformation(
 
 @pytest.mark.parametrize("component_class,component_name",
                          ((Sample, "sample"), (Source, "source")))
-@pytest.mark.parametrize("transform_type,value,value_units",
-                         ((TransformationType.ROTATION, [26, 73], "deg"),
-                          (TransformationType.TRANSLATION, [230, 310], "cm")))
-def test_skips_component_position_with_multi_value_log_transformation(
+@pytest.mark.parametrize(
+    "transform_type,value,value_units,expected_positions",
+    ((TransformationType.ROTATION, [26, 73], "deg", [[0, 0, 0], [0, 0, 0]]),
+     (TransformationType.TRANSLATION, [230, 310], "cm", [[0, 0, 2.3],
+                                                         [0, 0, 3.1]])))
+def test_loads_component_position_with_multi_value_log_transformation(
         component_class: Union[Type[Source], Type[Sample]],
         component_name: str, transform_type: TransformationType,
-        value: List[float], value_units: str, load_function: Callable):
+        value: List[float], value_units: str,
+        expected_positions: List[List[float]], load_function: Callable):
     builder = NexusBuilder()
     # Provide "time" data, the builder will write the transformation as
     # an NXlog. This would be encountered in a file from an experiment
     # involving a scan of a motion axis.
+    times = np.array([1.3, 6.4])
     transformation = Transformation(transform_type,
                                     vector=np.array([0, 0, -1]),
                                     value=np.array(value),
-                                    time=np.array([1.3, 6.4]),
+                                    time=times,
                                     time_units="s",
                                     value_units=value_units)
     builder.add_component(
         component_class(component_name, depends_on=transformation))
-    with pytest.warns(UserWarning):
-        loaded_data = load_function(builder)
+    loaded_data = load_function(builder)
+
+    # Position is a time series, like an NXlog
+    position = loaded_data[f"{component_name}_position"].value
+    assert np.allclose(position.values, expected_positions)
+    assert position.unit == sc.Unit("m")
+    assert np.allclose(position.coords["time"].values, times)
 
-    # Loading component position from transformations recorded as
-    # NXlogs with multiple values is not yet implemented
-    # However the NXlog itself will be loaded
-    # (loaded_data is not None)
-    assert f"{component_name}_position" not in loaded_data.keys()
+
+@pytest.mark.parametrize("component_class,component_name",
+                         ((Sample, "sample"), (Source, "source")))
+def test_loads_component_position_from_multi_value_log_and_static_transform(
+        component_class: Union[Type[Source], Type[Sample]],
+        component_name: str, load_function: Callable):
+    builder = NexusBuilder()
+    transformation_1 = Transformation(TransformationType.ROTATION,
+                                      np.array([0, 1, 0]),
+                                      np.array([0, 90, 180]),
+                                      time=np.array([1., 2., 3.]),
+                                      time_units="s",
+                                      value_units="deg")
+    transformation_2 = Transformation(TransformationType.TRANSLATION,
+                                      np.array([0, 0, -1]),
+                                      np.array([2.3]),
+                                      value_units="m",
+                                      depends_on=transformation_1)
+    builder.add_component(
+        component_class(component_name, depends_on=transformation_2))
+    loaded_data = load_function(builder)
+
+    # A rotation scan of the coordinate system around the y axis, followed
+    # by a fixed shift along z, traces out a semicircle in the xz plane
+    expected_positions = np.array([[0, 0, 2.3], [-2.3, 0, 0], [0, 0, -2.3]])
+    position = loaded_data[f"{component_name}_position"].value
+    assert np.allclose(position.values, expected_positions)
 
 
 @pytest.mark.parametrize("component_class,component_name",
@@ -1165,6 +1337,278 @@ def test_loads_pixel_positions_with_transformations(load_function: Callable):
                        expected_pixel_positions)
 
 
+def test_loads_pixel_positions_from_offsets_along_each_axis(
+        load_function: Callable):
+    # NeXus allows offsets of a 2D detector to be given along each axis
+    detector_ids = np.array([[1, 2], [3, 4], [5, 6]])
+    x_pixel_offset = np.array([10., 20., 30.])
+    y_pixel_offset = np.array([-5., 5.])
+    distance = 2.5
+    transformation = Transformation(TransformationType.TRANSLATION,
+                                    vector=np.array([0, 0, -1]),
+                                    value=np.array([distance]),
+                                    value_units="m")
+
+    builder = NexusBuilder()
+    builder.add_detector(
+        Detector(detector_ids,
+                 x_offsets=x_pixel_offset,
+                 y_offsets=y_pixel_offset,
+                 offsets_unit="mm",
+                 depends_on=transformation))
+
+    loaded_data = load_function(builder)
+
+    x_expected, y_expected = np.meshgrid(x_pixel_offset / 1_000,
+                                         y_pixel_offset / 1_000,
+                                         indexing="ij")
+    expected_pixel_positions = np.array([
+        x_expected.flatten(),
+        y_expected.flatten(),
+        np.full(detector_ids.size, distance)
+    ]).T
+    assert np.allclose(loaded_data.coords['position'].values,
+                       expected_pixel_positions)
+
+
+def test_loads_pixel_positions_from_offsets_along_each_axis_of_square_detector(
+        load_function: Callable):
+    # Offsets along each axis of a square detector have the same size,
+    # but there are fewer of them than there are pixels
+    detector_ids = np.array([[1, 2], [3, 4]])
+    x_pixel_offset = np.array([10., 20.])
+    y_pixel_offset = np.array([-5., 5.])
+
+    builder = NexusBuilder()
+    builder.add_detector(
+        Detector(detector_ids,
+                 x_offsets=x_pixel_offset,
+                 y_offsets=y_pixel_offset,
+                 offsets_unit="mm"))
+
+    loaded_data = load_function(builder)
+
+    x_expected, y_expected = np.meshgrid(x_pixel_offset / 1_000,
+                                         y_pixel_offset / 1_000,
+                                         indexing="ij")
+    expected_pixel_positions = np.array([
+        x_expected.flatten(),
+        y_expected.flatten(),
+        np.zeros(detector_ids.size)
+    ]).T
+    assert np.allclose(loaded_data.coords['position'].values,
+                       expected_pixel_positions)
+
+
+def test_pixel_grids_give_positions_when_dense_positions_not_loaded():
+    detector_1_ids = np.array([[1, 2, 3], [4, 5, 6]])
+    detector_2_ids = np.array([[7, 8], [9, 10]])
+    distance = 2.5
+    transformation = Transformation(TransformationType.TRANSLATION,
+                                    vector=np.array([0, 0, -1]),
+                                    value=np.array([distance]),
+                                    value_units="m")
+    builder = NexusBuilder()
+    builder.add_detector(
+        Detector(detector_1_ids,
+                 x_offsets=np.array([10., 20.]),
+                 y_offsets=np.array([-5., 0., 5.]),
+                 offsets_unit="mm",
+                 depends_on=transformation))
+    builder.add_detector(
+        Detector(detector_2_ids,
+                 x_offsets=np.array([[0.1, 0.1], [0.2, 0.2]]),
+                 y_offsets=np.array([[0.3, 0.4], [0.3, 0.4]]),
+                 offsets_unit="m"))
+
+    with builder.file() as nexus_file:
+        dense_data = scippneutron.load_nexus(nexus_file)
+        compact_data = scippneutron.load_nexus(nexus_file,
+                                               dense_positions=False)
+
+    assert "position" not in compact_data.coords
+    pixel_grids = compact_data.attrs["pixel_grids"].value
+    assert np.array_equal(pixel_grids["shape"].values, [[2, 3], [2, 2]])
+    assert np.allclose(
+        scippneutron.positions_from_pixel_grids(compact_data).values,
+        dense_data.coords["position"].values)
+
+
+def test_loads_off_pixel_shape_with_transformations(load_function: Callable):
+    x_pixel_offset = np.array([0.1, 0.2, 0.1, 0.2])
+    y_pixel_offset = np.array([0.1, 0.1, 0.2, 0.2])
+    vertices = np.array([[-1., -1., 0.], [1., -1., 0.], [1., 1., 0.],
+                         [-1., 1., 0.]])
+    transformation = Transformation(TransformationType.ROTATION,
+                                    vector=np.array([0, 1, 0]),
+                                    value=np.array([90]),
+                                    value_units="deg")
+
+    builder = NexusBuilder()
+    builder.add_detector(
+        Detector(np.array([0, 1, 2, 3]),
+                 x_offsets=x_pixel_offset,
+                 y_offsets=y_pixel_offset,
+                 offsets_unit="m",
+                 depends_on=transformation,
+                 pixel_shape=OffGeometry(vertices=vertices,
+                                         winding_order=np.array([0, 1, 2, 3]),
+                                         faces=np.array([0]),
+                                         units="mm")))
+
+    loaded_data = load_function(builder)
+
+    pixel_shape = loaded_data.attrs["pixel_shape"].value
+    rotation = np.array([[0, 0, 1], [0, 1, 0], [-1, 0, 0]])
+    # Shared vertices are converted to metres, the rotation of the
+    # detector is given separately
+    assert pixel_shape["vertices"].unit == sc.units.m
+    assert np.allclose(pixel_shape["vertices"].values, vertices / 1_000)
+    assert np.array_equal(pixel_shape["winding_order"].values, [0, 1, 2, 3])
+    assert np.array_equal(pixel_shape["faces"].values, [0])
+    assert np.allclose(pixel_shape["rotations"].values, [rotation])
+    assert np.array_equal(pixel_shape["rotation_index"].values, [0, 0, 0, 0])
+
+    all_vertices = pixel_vertices(loaded_data.coords["position"], pixel_shape)
+    assert all_vertices.values.shape == (4, 4, 3)
+    positions = loaded_data.coords["position"].values
+    assert np.allclose(all_vertices.values[2],
+                       positions[2] + vertices / 1_000 @ rotation.T)
+    assert np.isclose(pixel_size(pixel_shape), 0.002)
+
+
+def test_loads_pixel_shape_shared_by_detectors_with_different_rotations(
+        load_function: Callable):
+    vertices = np.array([[-1., -1., 0.], [1., -1., 0.], [1., 1., 0.],
+                         [-1., 1., 0.]])
+    builder = NexusBuilder()
+    for detector_ids, angle in ((np.array([0, 1]), 90), (np.array([2,
+                                                                   3]), -90)):
+        builder.add_detector(
+            Detector(detector_ids,
+                     x_offsets=np.array([0.1, 0.2]),
+                     y_offsets=np.array([0.1, 0.1]),
+                     offsets_unit="m",
+                     depends_on=Transformation(TransformationType.ROTATION,
+                                               vector=np.array([0, 1, 0]),
+                                               value=np.array([angle]),
+                                               value_units="deg"),
+                     pixel_shape=OffGeometry(vertices=vertices,
+                                             winding_order=np.array(
+                                                 [0, 1, 2, 3]),
+                                             faces=np.array([0]),
+                                             units="mm")))
+
+    loaded_data = load_function(builder)
+
+    pixel_shape = loaded_data.attrs["pixel_shape"].value
+    rotation = np.array([[0, 0, 1], [0, 1, 0], [-1, 0, 0]])
+    assert np.allclose(pixel_shape["vertices"].values, vertices / 1_000)
+    assert np.allclose(pixel_shape["rotations"].values, [rotation, rotation.T])
+    assert np.array_equal(pixel_shape["rotation_index"].values, [0, 0, 1, 1])
+
+    all_vertices = pixel_vertices(loaded_data.coords["position"], pixel_shape)
+    positions = loaded_data.coords["position"].values
+    assert np.allclose(all_vertices.values[1],
+                       positions[1] + vertices / 1_000 @ rotation.T)
+    assert np.allclose(all_vertices.values[2],
+                       positions[2] + vertices / 1_000 @ rotation)
+
+
+def test_loads_cylindrical_pixel_shape(load_function: Callable):
+    vertices = np.array([[0., 0., 0.], [0.5, 0., 0.], [0., 0., 3.]])
+
+    builder = NexusBuilder()
+    builder.add_detector(
+        Detector(np.array([0, 1]),
+                 x_offsets=np.array([0.1, 0.2]),
+                 y_offsets=np.array([0.1, 0.1]),
+                 offsets_unit="m",
+                 pixel_shape=CylindricalGeometry(vertices=vertices,
+                                                 cylinders=np.array([[0, 1,
+                                                                      2]]),
+                                                 units="cm")))
+
+    loaded_data = load_function(builder)
+
+    pixel_shape = loaded_data.attrs["pixel_shape"].value
+    assert np.allclose(pixel_shape["vertices"].values, vertices / 100)
+    assert np.array_equal(pixel_shape["cylinders"].values, [[0, 1, 2]])
+    assert np.isclose(pixel_size(pixel_shape), 0.03)
+
+
+def test_skips_pixel_shape_with_indices_out_of_range(load_function: Callable):
+    builder = NexusBuilder()
+    builder.add_detector(
+        Detector(np.array([0, 1]),
+                 x_offsets=np.array([0.1, 0.2]),
+                 y_offsets=np.array([0.1, 0.1]),
+                 offsets_unit="m",
+                 pixel_shape=CylindricalGeometry(
+                     vertices=np.array([[0., 0., 0.], [0.5, 0., 0.]]),
+                     cylinders=np.array([[0, 1, 2]]),
+                     units="cm")))
+
+    with pytest.warns(UserWarning):
+        loaded_data = load_function(builder)
+
+    assert "pixel_shape" not in loaded_data.attrs
+    assert "position" in loaded_data.coords
+
+
+def test_loads_histogram_data_from_detectors(load_function: Callable):
+    tof_edges = np.array([0., 10., 20., 30.])
+    # Pixel dimensions first, time-of-flight last
+    counts_1 = np.array([[[1, 2, 3], [4, 5, 6]], [[7, 8, 9], [10, 11, 12]]])
+    counts_2 = np.array([[13, 14, 15]])
+
+    builder = NexusBuilder()
+    builder.add_detector(
+        Detector(np.array([[4, 5], [6, 7]]),
+                 x_offsets=np.array([[0.1, 0.2], [0.1, 0.2]]),
+                 y_offsets=np.array([[0.1, 0.1], [0.2, 0.2]]),
+                 offsets_unit="m",
+                 data=counts_1,
+                 time_of_flight=tof_edges,
+                 time_of_flight_units="us"))
+    builder.add_detector(
+        Detector(np.array([1]),
+                 x_offsets=np.array([0.3]),
+                 y_offsets=np.array([0.3]),
+                 offsets_unit="m",
+                 data=counts_2,
+                 time_of_flight=tof_edges,
+                 time_of_flight_units="us"))
+
+    loaded_data = load_function(builder)
+
+    # Detectors are sorted by detector id
+    assert np.array_equal(loaded_data.coords['detector_id'].values,
+                          [1, 4, 5, 6, 7])
+    assert np.array_equal(loaded_data.values,
+                          np.concatenate((counts_2, counts_1.reshape(4, 3))))
+    assert loaded_data.unit == sc.units.counts
+    assert np.allclose(loaded_data.coords['tof'].values, tof_edges)
+    assert loaded_data.coords['tof'].unit == sc.units.us
+    assert np.allclose(loaded_data.coords['position'].values[0],
+                       [0.3, 0.3, 0.])
+
+
+def test_skips_histogram_data_with_mismatched_detector_number(
+        load_function: Callable):
+    builder = NexusBuilder()
+    builder.add_detector(
+        Detector(np.array([1, 2, 3]),
+                 data=np.array([[1, 2], [3, 4]]),
+                 time_of_flight=np.array([0., 10., 20.]),
+                 time_of_flight_units="us"))
+
+    with pytest.warns(UserWarning):
+        loaded_data = load_function(builder)
+
+    assert loaded_data is None or "tof" not in loaded_data.coords
+
+
 def test_links_to_event_data_group_are_ignored(load_function: Callable):
     event_time_offsets = np.array([456, 743, 347, 345, 632])
     event_data = EventData(
@@ -1268,3 +1712,285 @@ def test_linked_datasets_are_found(load_function: Callable):
     expected_detector_ids = np.array([1, 2, 3])
     assert np.array_equal(loaded_data.coords['detector_id'].values,
                           expected_detector_ids)
+
+
+def test_shared_transformations_are_resolved_once_per_file():
+    builder = NexusBuilder()
+    transformation_0 = Transformation(TransformationType.ROTATION,
+                                      np.array([0, 1, 0]),
+                                      np.array([90]),
+                                      value_units="deg")
+    transformation_1 = Transformation(TransformationType.TRANSLATION,
+                                      np.array([0, 0, -1]),
+                                      np.array([2.3]),
+                                      value_units="m",
+                                      depends_on=transformation_0)
+    builder.add_sample(Sample("sample", depends_on=transformation_1))
+    transformation_2 = Transformation(
+        TransformationType.TRANSLATION,
+        np.array([0, 0, -1]),
+        np.array([1.0]),
+        value_units="m",
+        depends_on="/entry/sample/transformations/transform_1")
+    builder.add_source(Source("source", depends_on=transformation_2))
+
+    cache = TransformationCache()
+    nexus = LoadFromHdf5()
+    with builder.file() as nexus_file:
+        sample_matrix = get_full_transformation_matrix(
+            nexus_file["/entry/sample"], nexus_file, nexus, cache)
+        # Overwrite a dataset in the shared part of the chain, it must not
+        # be read again when resolving the source transformations
+        nexus_file["/entry/sample/transformations/transform_0"][...] = 0.
+        source_matrix = get_full_transformation_matrix(
+            nexus_file["/entry/source"], nexus_file, nexus, cache)
+
+    assert "/entry/sample/transformations/transform_0" in cache
+    assert "/entry/sample/transformations/transform_1" in cache
+    assert np.allclose(
+        np.matmul(sample_matrix, [0, 0, 0, 1])[:3], [-2.3, 0, 0])
+    assert np.allclose(
+        np.matmul(source_matrix, [0, 0, 0, 1])[:3], [-3.3, 0, 0])
+
+
+def test_rotation_matrices_are_built_for_arrays_of_axes_and_angles():
+    axes = np.array([[0., 1., 0.], [0., 0., 1.]])
+    angles = np.deg2rad(np.array([90., 90.]))
+
+    matrices = rotation_matrices_from_axes_and_angles(axes, angles)
+
+    assert matrices.shape == (2, 3, 3)
+    for axis, angle, matrix in zip(axes, angles, matrices):
+        assert np.allclose(matrix,
+                           rotation_matrices_from_axes_and_angles(axis, angle))
+    assert np.allclose(matrices[1] @ [1, 0, 0], [0, -1, 0])
+
+
+def test_load_transformations_of_all_components():
+    builder = NexusBuilder()
+    transformation_0 = Transformation(TransformationType.ROTATION,
+                                      np.array([0, 1, 0]),
+                                      np.array([90]),
+                                      value_units="deg")
+    transformation_1 = Transformation(TransformationType.TRANSLATION,
+                                      np.array([0, 0, -1]),
+                                      np.array([2.3]),
+                                      value_units="m",
+                                      depends_on=transformation_0)
+    builder.add_sample(Sample("sample", depends_on=transformation_1))
+    builder.add_source(Source("source"))
+
+    with builder.file() as nexus_file:
+        transformations = scippneutron.load_transformations(nexus_file)
+
+    # Source has no depends_on so is not included
+    assert set(transformations.keys()) == {"/entry/sample"}
+    sample = transformations["/entry/sample"]
+    assert sample["rotation"].dtype == sc.dtype.matrix_3_float64
+    assert np.allclose(sample["rotation"].value,
+                       [[0, 0, 1], [0, 1, 0], [-1, 0, 0]])
+    assert sample["translation"].unit == sc.units.m
+    assert np.allclose(sample["translation"].value, [-2.3, 0, 0])
+
+
+def test_loads_histogram_data_from_monitor(load_function: Callable):
+    counts = np.array([3, 7, 2, 5])
+    tof_edges = np.array([0., 10., 20., 30., 40.])
+    builder = NexusBuilder()
+    builder.add_monitor(
+        Monitor("monitor_1",
+                data=counts,
+                time_of_flight=tof_edges,
+                time_of_flight_units="us"))
+
+    loaded_data = load_function(builder)
+
+    monitor = loaded_data["monitor_1"].value
+    assert np.array_equal(monitor.values, counts)
+    assert monitor.unit == sc.units.counts
+    assert np.allclose(monitor.coords["tof"].values, tof_edges)
+    assert monitor.coords["tof"].unit == sc.units.us
+
+
+def test_skips_monitor_with_data_group_instead_of_dataset():
+    with h5py.File('in_memory_events.nxs',
+                   mode='w',
+                   driver="core",
+                   backing_store=False) as nexus_file:
+        entry = nexus_file.create_group("entry")
+        entry.attrs["NX_class"] = "NXentry"
+        monitor = entry.create_group("monitor_1")
+        monitor.attrs["NX_class"] = "NXmonitor"
+        monitor.create_group("data")
+
+        with pytest.warns(UserWarning):
+            loaded_data = scippneutron.load_nexus(nexus_file)
+
+    assert "monitor_1" not in loaded_data
+
+
+def test_loads_event_data_from_monitor(load_function: Callable):
+    event_time_offsets = np.array([456, 743, 347, 345, 632])
+    monitor_events = EventData(
+        event_id=np.array([1, 1, 1, 1, 1]),
+        event_time_offset=event_time_offsets,
+        event_time_zero=np.array([
+            1600766730000000000, 1600766731000000000, 1600766732000000000,
+            1600766733000000000
+        ]),
+        event_index=np.array([0, 3, 3, 5]),
+    )
+    detector_events = EventData(
+        event_id=np.array([1, 2, 3]),
+        event_time_offset=np.array([123, 456, 789]),
+        event_time_zero=np.array([1600766730000000000]),
+        event_index=np.array([0]),
+    )
+    builder = NexusBuilder()
+    builder.add_event_data(detector_events)
+    builder.add_monitor(Monitor("monitor_1", event_data=monitor_events))
+
+    loaded_data = load_function(builder)
+
+    monitor = loaded_data.attrs["monitor_1"].value
+    assert np.array_equal(np.sort(monitor.coords["tof"].values),
+                          np.sort(event_time_offsets))
+    # Events in the monitor must not be loaded as detector data
+    assert np.array_equal(loaded_data.coords['detector_id'].values, [1, 2, 3])
+    assert loaded_data.bins.sum().data.values.sum() == 3
+
+
+@pytest.mark.asyncio
+async def test_load_nexus_async_gives_same_result_as_load_nexus():
+    event_data = EventData(
+        event_id=np.array([1, 2, 3, 1, 3]),
+        event_time_offset=np.array([456, 743, 347, 345, 632]),
+        event_time_zero=np.array([
+            1600766730000000000, 1600766731000000000, 1600766732000000000,
+            1600766733000000000
+        ]),
+        event_index=np.array([0, 3, 3, 5]),
+    )
+    builder = NexusBuilder()
+    builder.add_event_data(event_data)
+    builder.add_log(Log("test_log", np.array([1.1, 2.2]), np.array([1, 2])))
+    builder.add_title("test title")
+
+    with builder.file() as nexus_file:
+        expected_data = scippneutron.load_nexus(nexus_file)
+        loaded_data = await scippneutron.load_nexus_async(nexus_file)
+
+    assert sc.identical(loaded_data, expected_data)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_load_nexus_async_closes_file_and_executor(
+        tmp_path, monkeypatch):
+    file_path = str(tmp_path / "test.nxs")
+    _write_nexus_file(file_path)
+    load_nexus_module = importlib.import_module("scippneutron.load_nexus")
+
+    executors = []
+    opened_files = []
+
+    class RecordedExecutor(load_nexus_module.ThreadPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            executors.append(self)
+
+    open_file = load_nexus_module._open_nexus_file
+
+    def open_nexus_file(*args):
+        opened_files.append(open_file(*args))
+        return opened_files[-1]
+
+    # Loading the logs blocks until the test has cancelled the load
+    logs_started = threading.Event()
+    release_logs = threading.Event()
+    later_stages = []
+
+    def load_logs(*args):
+        logs_started.set()
+        release_logs.wait(timeout=10.)
+
+    monkeypatch.setattr(load_nexus_module, "ThreadPoolExecutor",
+                        RecordedExecutor)
+    monkeypatch.setattr(load_nexus_module, "_open_nexus_file", open_nexus_file)
+    monkeypatch.setattr(load_nexus_module, "load_logs", load_logs)
+    monkeypatch.setattr(load_nexus_module, "load_monitor_data",
+                        lambda *args: later_stages.append(args))
+
+    task = asyncio.get_running_loop().create_task(
+        scippneutron.load_nexus_async(file_path))
+    await asyncio.get_running_loop().run_in_executor(None, logs_started.wait,
+                                                     10.)
+    task.cancel()
+    release_logs.set()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    # Loading stopped after the stage which was running
+    assert not later_stages
+    assert len(opened_files) == 1
+    assert not opened_files[0].id.valid
+    assert len(executors) == 1
+    assert executors[0]._shutdown
+
+
+def _write_nexus_file_with_two_event_groups(path: str):
+    with h5py.File(path, "w") as nexus_file:
+        entry = nexus_file.create_group("entry")
+        entry.attrs["NX_class"] = "NXentry"
+        for index in range(2):
+            events = entry.create_group(f"events_{index}")
+            events.attrs["NX_class"] = "NXevent_data"
+            events.create_dataset("event_id", data=np.array([index, index]))
+            events.create_dataset("event_time_offset",
+                                  data=np.array([456, 743]))
+            events.create_dataset("event_time_zero", data=np.array([1000]))
+            events.create_dataset("event_index", data=np.array([0]))
+        log_group = entry.create_group("temperature")
+        log_group.attrs["NX_class"] = "NXlog"
+        log_group.create_dataset("value", data=np.arange(3.))
+
+
+@pytest.mark.asyncio
+async def test_load_nexus_async_can_be_cancelled_between_event_groups(
+        tmp_path, monkeypatch):
+    file_path = str(tmp_path / "test.nxs")
+    _write_nexus_file_with_two_event_groups(file_path)
+    load_nexus_module = importlib.import_module("scippneutron.load_nexus")
+    detector_module = importlib.import_module(
+        "scippneutron._loading_detector_data")
+
+    # Loading the first event group blocks until the test has cancelled
+    # the load
+    group_started = threading.Event()
+    release_group = threading.Event()
+    loaded_groups = []
+    later_stages = []
+    load_event_group = detector_module._load_event_group
+
+    def blocking_load_event_group(group, *args):
+        loaded_groups.append(group.path)
+        group_started.set()
+        release_group.wait(timeout=10.)
+        return load_event_group(group, *args)
+
+    monkeypatch.setattr(detector_module, "_load_event_group",
+                        blocking_load_event_group)
+    monkeypatch.setattr(load_nexus_module, "load_logs",
+                        lambda *args: later_stages.append(args))
+
+    task = asyncio.get_running_loop().create_task(
+        scippneutron.load_nexus_async(file_path))
+    await asyncio.get_running_loop().run_in_executor(None, group_started.wait,
+                                                     10.)
+    task.cancel()
+    release_group.set()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    # The second event group and the logs were never loaded
+    assert loaded_groups == ["/entry/events_0"]
+    assert not later_stages
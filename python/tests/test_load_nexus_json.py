@@ -1,8 +1,12 @@
+import json
 import scipp as sc
 import numpy as np
-from .nexus_helpers import NexusBuilder, Source, Stream
+from .nexus_helpers import NexusBuilder, Source, Stream, Link
 import pytest
 from scippneutron.load_nexus import _load_nexus_json
+from scippneutron._loading_json_nexus import (LoadFromJson,
+                                              decode_dataset_values)
+from scippneutron._loading_common import MissingDataset
 """
 Many tests for load_nexus_json() are in test_load_nexus
 as they are parameterised to run the same checks against
@@ -28,3 +32,70 @@ def test_stream_object_as_transformation_results_in_warning():
     default = [0, 0, 0]
     assert np.allclose(loaded_data["source_position"].values, default)
     assert loaded_data["source_position"].unit == sc.Unit("m")
+
+
+def test_get_object_by_path_follows_links_and_returns_same_object():
+    builder = NexusBuilder()
+    builder.add_dataset_at_path("/entry/transform", np.array([13.6]),
+                                {"units": "m"})
+    builder.add_soft_link(Link("/entry/transform_link", "/entry/transform"))
+    root = json.loads(builder.json_string)
+    nexus = LoadFromJson(root)
+
+    target = nexus.get_object_by_path(root, "/entry/transform")
+    assert nexus.get_object_by_path(root, "/entry/transform_link") is target
+    # Second lookup of the same path gives the same object
+    assert nexus.get_object_by_path(root, "/entry/transform_link") is target
+    with pytest.raises(MissingDataset):
+        nexus.get_object_by_path(root, "/entry/not_in_file")
+
+
+def test_numeric_dataset_values_are_decoded_to_numpy_arrays():
+    builder = NexusBuilder()
+    builder.add_dataset_at_path("/entry/detector_number",
+                                np.array([1, 2, 3], dtype=np.uint16), {})
+    builder.add_dataset_at_path("/entry/title", "test title", {})
+    root = json.loads(builder.json_string, object_hook=decode_dataset_values)
+    nexus = LoadFromJson(root)
+
+    detector_number = nexus.get_object_by_path(root, "/entry/detector_number")
+    assert isinstance(detector_number["values"], np.ndarray)
+    # Unsupported integer types are converted to a supported type
+    assert detector_number["values"].dtype == np.int32
+    assert np.array_equal(detector_number["values"], [1, 2, 3])
+    # String datasets are not modified
+    assert nexus.load_scalar_string(root["children"][0],
+                                    "title") == "test title"
+
+
+def _decode_dataset(values, dtype: str):
+    dataset = {
+        "type": "dataset",
+        "name": "data",
+        "dataset": {
+            "type": dtype
+        },
+        "values": values
+    }
+    return json.loads(json.dumps(dataset),
+                      object_hook=decode_dataset_values)["values"]
+
+
+def test_nested_dataset_values_are_decoded_to_multidimensional_array():
+    values = _decode_dataset([[1, 2, 3], [4, 5, 6]], "int64")
+    assert values.dtype == np.int64
+    assert np.array_equal(values, [[1, 2, 3], [4, 5, 6]])
+
+
+def test_dataset_values_with_mismatched_sizes_are_not_decoded():
+    values = _decode_dataset([[1, 2, 3], [4, 5]], "int64")
+    assert values == [[1, 2, 3], [4, 5]]
+
+
+def test_dataset_values_out_of_range_of_dtype_wrap_around():
+    # uint32 is loaded as int32
+    values = _decode_dataset([1, 2**31 + 5], "uint32")
+    assert values.dtype == np.int32
+    assert np.array_equal(
+        values,
+        np.array([1, 2**31 + 5], dtype=np.int64).astype(np.int32))